@@ -0,0 +1 @@
+default_app_config = 'service_directory.api.apps.ApiConfig'
@@ -26,9 +26,16 @@ class KeywordCategoryInlineModelAdmin(admin.TabularInline):
 
 class KeywordModelAdmin(ImportExportMixin, admin.ModelAdmin):
     list_display = ('name', 'formatted_categories', 'show_on_home_page')
+    list_filter = ('show_on_home_page', 'categories')
+    search_fields = ('name',)
     resource_class = KeywordResource
     inlines = (KeywordCategoryInlineModelAdmin,)
 
+    def get_queryset(self, request):
+        return super(KeywordModelAdmin, self).get_queryset(
+            request
+        ).prefetch_related('categories')
+
 
 class OrganisationCategoryInlineModelAdmin(admin.TabularInline):
     model = OrganisationCategory
@@ -42,11 +49,19 @@ class OrganisationKeywordInlineModelAdmin(admin.TabularInline):
 
 class OrganisationModelAdmin(ImportExportMixin, admin.OSMGeoAdmin):
     form = OrganisationModelForm
-    list_display = ('name', 'country')
+    list_display = ('name', 'country', 'formatted_categories',
+                    'formatted_keywords')
+    list_filter = ('country', 'categories')
+    search_fields = ('name',)
     resource_class = OrganisationResource
     inlines = (OrganisationCategoryInlineModelAdmin,
                OrganisationKeywordInlineModelAdmin)
 
+    def get_queryset(self, request):
+        return super(OrganisationModelAdmin, self).get_queryset(
+            request
+        ).select_related('country').prefetch_related('categories', 'keywords')
+
 
 class OrganisationIncorrectInformationReportModelAdmin(ExportMixin,
                                                        admin.ModelAdmin):
@@ -294,6 +294,7 @@ class OrganisationResource(resources.ModelResource):
     class Meta:
         model = Organisation
         import_id_fields = ('name',)
+        exclude = ('created_at', 'updated_at')
         export_order = ('id', 'name', 'about', 'address', 'telephone',
                         'emergency_telephone', 'email', 'web', 'verified_as',
                         'age_range_min', 'age_range_max', 'opening_hours',
@@ -4,4 +4,10 @@ from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
-    name = 'api'
+    name = 'service_directory.api'
+    label = 'api'
+
+    def ready(self):
+        from service_directory.api import caching, sync
+        caching.connect_signals()
+        sync.connect_signals()
@@ -0,0 +1,70 @@
+"""
+Runs fire-and-forget work (eg: Google Analytics events) on a few background
+threads, so that requests don't wait on it.
+"""
+import logging
+import threading
+from Queue import Queue, Full
+
+from django.conf import settings
+from django.db import close_old_connections
+from service_directory.api import metrics
+
+
+class BackgroundDispatcher(object):
+    """
+    A bounded queue of calls, run in order by BACKGROUND_WORKERS daemon
+    threads (started on first use, in each process). When the queue is full
+    calls are dropped rather than holding up the request.
+    """
+    def __init__(self):
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._queue is None:
+                self._queue = Queue(maxsize=settings.BACKGROUND_QUEUE_SIZE)
+                for i in range(settings.BACKGROUND_WORKERS):
+                    worker = threading.Thread(
+                        target=self.work,
+                        name='background-{0}'.format(i)
+                    )
+                    worker.daemon = True
+                    worker.start()
+        return self._queue
+
+    def dispatch(self, func, *args, **kwargs):
+        if not settings.BACKGROUND_WORKERS:
+            func(*args, **kwargs)
+            return
+
+        queue = self._queue or self.start()
+        try:
+            queue.put_nowait((func, args, kwargs))
+        except Full:
+            metrics.increment('background_dropped')
+            logging.warn('Background queue is full, dropped %s', func)
+
+    def work(self):
+        queue = self._queue
+        while True:
+            func, args, kwargs = queue.get()
+            try:
+                func(*args, **kwargs)
+            except:
+                logging.error('Background call failed', exc_info=True)
+            finally:
+                # as at the end of a request, for calls that use the database
+                close_old_connections()
+                queue.task_done()
+
+    def join(self):
+        """
+        Wait for everything dispatched so far to have run.
+        """
+        if self._queue is not None:
+            self._queue.join()
+
+
+dispatcher = BackgroundDispatcher()
@@ -0,0 +1,239 @@
+"""
+A two-tier cache: a small LRU in each process (L1) in front of the shared
+cache (L2, the SHARED_CACHE alias in CACHES, eg: memcached shared by every
+worker and host).
+
+Entries are kept in namespaces, each with a version that is kept in the
+shared cache and bumped whenever one of the models the namespace depends on
+(see NAMESPACE_MODELS) is saved or deleted. Keys include the version, so
+bumping it invalidates the namespace's entries in every process at once
+(the old entries are never read again, and expire). Each process rechecks a
+namespace's version at most every CACHE_VERSION_SECONDS. A change made in a
+transaction bumps the version again once it commits, as another request may
+have refilled the cache from the data before the change in the meantime.
+
+Hits, misses, evictions and invalidations are counted per namespace, eg:
+``cache_keywords_l1_hits`` (see ``metrics.increment``).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models.signals import post_save, post_delete
+from service_directory.api import metrics
+
+
+# the models (by label) whose changes invalidate each namespace
+NAMESPACE_MODELS = OrderedDict([
+    ('keywords', ('api.keyword', 'api.category', 'api.keywordcategory')),
+    ('organisations', (
+        'api.organisation', 'api.organisationcategory',
+        'api.organisationkeyword', 'api.country', 'api.category',
+        'api.keyword', 'api.keywordcategory',
+    )),
+])
+
+MISSING = object()
+
+
+class LocalCache(object):
+    """
+    An LRU of at most CACHE_L1_SIZE entries, each with an expiry time.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] <= now:
+                return MISSING
+            self._entries[key] = entry
+            return entry[1]
+
+    def set(self, key, value, expires_at):
+        """
+        Returns the number of entries evicted to make room.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires_at, value)
+            evicted = 0
+            while len(self._entries) > settings.CACHE_L1_SIZE:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheNamespace(object):
+    clock = staticmethod(time.time)
+
+    def __init__(self, name):
+        self.name = name
+        self.local = LocalCache()
+        self.version_key = 'namespace:{0}:version'.format(name)
+        self._version = None
+        self._version_checked_at = None
+        # used if the shared cache doesn't keep the version (eg: the dummy
+        # cache)
+        self._local_version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[settings.SHARED_CACHE]
+
+    def count(self, event, value=1):
+        metrics.increment('cache_{0}_{1}'.format(self.name, event), value)
+
+    def version(self):
+        now = self.clock()
+        with self._lock:
+            if (
+                self._version is not None and
+                now - self._version_checked_at < settings.CACHE_VERSION_SECONDS
+            ):
+                return self._version
+
+        version = self.shared.get(self.version_key)
+        if version is None:
+            # (evicted, or never set): start from the time, so as not to
+            # reuse a version another process may still have cached entries
+            # under
+            self.shared.add(self.version_key, int(now * 1000), None)
+            version = self.shared.get(self.version_key)
+
+        with self._lock:
+            if version is None:
+                version = self._local_version
+            if version != self._version:
+                self.local.clear()
+            self._version = version
+            self._version_checked_at = now
+            return version
+
+    def changed(self, sender, using, **kwargs):
+        """
+        Connected to the save and delete signals of the namespace's models.
+        """
+        self.invalidate()
+        connection = connections[using]
+        if connection.in_atomic_block and hasattr(connection, 'on_commit'):
+            connection.on_commit(self.invalidate)
+
+    def invalidate(self):
+        """
+        Bump the version.
+        """
+        try:
+            self.shared.incr(self.version_key)
+        except ValueError:
+            # not set, the next ``version`` starts it afresh
+            pass
+
+        with self._lock:
+            self._local_version += 1
+        self.clear_local()
+        self.count('invalidations')
+
+    def clear_local(self):
+        """
+        Forget this process's entries, and its copy of the version.
+        """
+        with self._lock:
+            self._version = None
+        self.local.clear()
+
+    def make_key(self, key):
+        return '{0}:{1}:{2}'.format(
+            self.name, self.version(),
+            hashlib.sha1(key.encode('utf-8')).hexdigest()
+        )
+
+    def get(self, key, default=None):
+        full_key = self.make_key(key)
+
+        value = self.local.get(full_key, self.clock())
+        if value is not MISSING:
+            self.count('l1_hits')
+            return value
+
+        value = self.shared.get(full_key, MISSING)
+        if value is not MISSING:
+            self.count('l2_hits')
+            self.set_local(full_key, value, settings.CACHE_TIMEOUT)
+            return value
+
+        self.count('misses')
+        return default
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = settings.CACHE_TIMEOUT
+        full_key = self.make_key(key)
+        self.shared.set(full_key, value, timeout)
+        self.set_local(full_key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        """
+        Set ``key`` in the shared cache if it isn't already (atomically, eg:
+        for a lock). Returns whether it was set.
+        """
+        if timeout is None:
+            timeout = settings.CACHE_TIMEOUT
+        return self.shared.add(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        full_key = self.make_key(key)
+        self.shared.delete(full_key)
+        self.local.delete(full_key)
+
+    def set_local(self, full_key, value, timeout):
+        evicted = self.local.set(
+            full_key, value,
+            self.clock() + min(timeout, settings.CACHE_L1_SECONDS)
+        )
+        if evicted:
+            self.count('evictions', evicted)
+
+
+namespaces = OrderedDict(
+    (name, CacheNamespace(name)) for name in NAMESPACE_MODELS
+)
+
+
+def namespace(name):
+    return namespaces[name]
+
+
+def clear_local_caches():
+    for cache_namespace in namespaces.values():
+        cache_namespace.clear_local()
+
+
+def connect_signals():
+    for name, labels in NAMESPACE_MODELS.items():
+        for label in labels:
+            model = apps.get_model(label)
+            for signal, action in ((post_save, 'save'),
+                                   (post_delete, 'delete')):
+                signal.connect(
+                    namespaces[name].changed, sender=model,
+                    dispatch_uid='cache_{0}_{1}_{2}'.format(
+                        name, action, label
+                    )
+                )
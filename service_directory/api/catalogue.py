@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from service_directory.api import caching, routers
+from service_directory.api.models import Keyword, Category
+from service_directory.api.renderers import FastJSONRenderer
+from service_directory.api.serializers import KeywordSerializer
+
+
+class KeywordCatalogueSnapshot(object):
+    """
+    Every keyword, serialized once, with an index from (lower case) category
+    name to the keywords in that category.
+
+    Filtered lists are rendered to JSON the first time they are asked for and
+    kept for the lifetime of the snapshot.
+    """
+    def __init__(self, version, keywords):
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.keywords = KeywordSerializer(keywords, many=True).data
+        self.category_names = {}
+        for keyword in keywords:
+            for category in keyword.categories.all():
+                self.category_names.setdefault(
+                    category.name.lower(), set()
+                ).add(keyword.pk)
+
+        self._categories = None
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def category_names_by_id(self):
+        """
+        Every category's name, by id. Loaded the first time it is needed, for
+        the search facet counts.
+        """
+        with self._lock:
+            if self._categories is None:
+                with routers.primary_reads():
+                    self._categories = dict(
+                        Category.objects.values_list('pk', 'name')
+                    )
+            return self._categories
+
+    def filter(self, category_names=None, show_on_home_page=False):
+        keywords = self.keywords
+
+        if show_on_home_page:
+            keywords = [
+                keyword for keyword in keywords
+                if keyword['show_on_home_page']
+            ]
+
+        if category_names:
+            pks = set()
+            for name in category_names:
+                pks.update(self.category_names.get(name.lower(), ()))
+            keywords = [
+                keyword for keyword in keywords if keyword['id'] in pks
+            ]
+
+        return keywords
+
+    def render(self, category_names=None, show_on_home_page=False):
+        """
+        Return (keywords, content, etag) for the given filters.
+        """
+        key = (
+            tuple(sorted(set(name.lower() for name in category_names or ()))),
+            bool(show_on_home_page)
+        )
+
+        with self._lock:
+            rendered = self._rendered.get(key)
+        if rendered is not None:
+            return rendered
+
+        keywords = self.filter(category_names, show_on_home_page)
+        content = FastJSONRenderer().render(keywords)
+        # from the content alone, so that every process (and every reload
+        # that finds nothing has changed) gives the same ETag
+        etag = hashlib.md5(content).hexdigest()
+        rendered = (keywords, content, etag)
+
+        with self._lock:
+            self._rendered[key] = rendered
+        return rendered
+
+
+class KeywordCatalogue(object):
+    """
+    An in-process copy of the keywords, their categories and
+    ``show_on_home_page``.
+
+    Saving or deleting a Keyword, Category or KeywordCategory (in any
+    process) bumps the version of the ``keywords`` cache namespace (see
+    api/caching.py), now and again once the change commits, and the next
+    ``snapshot`` reloads (from the primary, see routers.primary_reads).
+    Changes that don't send signals (eg: bulk updates) are picked up once the
+    snapshot is older than ``KEYWORD_CATALOGUE_TTL`` seconds.
+    """
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        caching.namespace('keywords').invalidate()
+
+    def is_stale(self, snapshot, version):
+        return (
+            snapshot is None or
+            snapshot.version != version or
+            time.time() - snapshot.loaded_at >= settings.KEYWORD_CATALOGUE_TTL
+        )
+
+    def snapshot(self):
+        version = caching.namespace('keywords').version()
+        snapshot = self._snapshot
+        if not self.is_stale(snapshot, version):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if self.is_stale(snapshot, version):
+                with routers.primary_reads():
+                    snapshot = KeywordCatalogueSnapshot(
+                        version,
+                        list(
+                            Keyword.objects.prefetch_related(
+                                'categories'
+                            ).order_by('pk')
+                        )
+                    )
+                self._snapshot = snapshot
+        return snapshot
+
+
+keyword_catalogue = KeywordCatalogue()
@@ -0,0 +1,140 @@
+"""
+Coalesces identical concurrent requests (eg: thousands of users following
+the link in an SMS campaign within seconds of each other), so that their
+response data is computed once and shared.
+
+Within a process, concurrent calls for the same key wait on the one in
+flight. With COALESCE_SHARED set, results are shared across processes too,
+in a namespace of the shared cache (see api/caching.py, so they're dropped
+when the data they're computed from changes): only the process holding the
+key's lock computes it, while the others wait for it to appear. Once an
+entry is older than COALESCE_FRESH_SECONDS one request refreshes it, and the
+rest are served the stale entry in the meantime (for up to
+COALESCE_STALE_SECONDS more) rather than all computing it at once. Shared
+results are computed from the primary database (see
+``routers.primary_reads``).
+"""
+import threading
+import time
+import urllib
+
+from django.conf import settings
+from service_directory.api import caching, metrics, routers
+
+
+def request_key(request):
+    """
+    The path and (sorted) query parameters of a request.
+    """
+    params = sorted(
+        (name, value.encode('utf-8'))
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+    return u'{0}?{1}'.format(request.path, urllib.urlencode(params))
+
+
+class InFlightCall(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs a function once for concurrent calls with the same key (in this
+    process): the first caller runs it, and the rest wait for and share its
+    result (or exception).
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = InFlightCall()
+
+        if not leader:
+            metrics.increment('coalesced_requests')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class Coalescer(object):
+    clock = staticmethod(time.time)
+    sleep = staticmethod(time.sleep)
+
+    def __init__(self):
+        self.single_flight = SingleFlight()
+
+    def get(self, key, func, namespace):
+        """
+        Return the result of ``func`` (which must be picklable if
+        COALESCE_SHARED is set) for ``key``, in the cache namespace
+        ``namespace``.
+        """
+        return self.single_flight.do(
+            (namespace, key), lambda: self.get_cached(key, func, namespace)
+        )
+
+    def get_cached(self, key, func, namespace):
+        if not settings.COALESCE_SHARED:
+            return func()
+
+        cache = caching.namespace(namespace)
+        cache_key = u'coalesce:{0}'.format(key)
+        lock_key = cache_key + u':lock'
+        give_up_at = self.clock() + settings.COALESCE_WAIT_SECONDS
+
+        while True:
+            entry = cache.get(cache_key)
+            if entry is not None:
+                fresh_until, value = entry
+                if self.clock() < fresh_until:
+                    return value
+                if not cache.add(lock_key, True,
+                                 settings.COALESCE_LOCK_SECONDS):
+                    # being refreshed (by another request)
+                    metrics.increment('coalesced_stale_responses')
+                    return value
+                break
+
+            if cache.add(lock_key, True, settings.COALESCE_LOCK_SECONDS):
+                break
+            if self.clock() >= give_up_at:
+                # the process computing it is taking too long
+                return func()
+            self.sleep(0.05)
+
+        try:
+            with routers.primary_reads():
+                value = func()
+            cache.set(
+                cache_key,
+                (self.clock() + settings.COALESCE_FRESH_SECONDS, value),
+                settings.COALESCE_FRESH_SECONDS +
+                settings.COALESCE_STALE_SECONDS
+            )
+            return value
+        finally:
+            cache.delete(lock_key)
+
+
+coalescer = Coalescer()
@@ -1,9 +1,14 @@
+import elasticsearch
+from elasticsearch.helpers import bulk, scan
+from haystack.exceptions import SkipDocument
 from haystack.fields import SearchField
 from haystack.backends.elasticsearch_backend import ElasticsearchSearchBackend, ElasticsearchSearchQuery
 from haystack.backends.elasticsearch_backend import ElasticsearchSearchEngine
+from haystack.models import SearchResult
 from haystack.query import SearchQuerySet
-from haystack.constants import DEFAULT_ALIAS, DJANGO_CT
+from haystack.constants import DEFAULT_ALIAS, DJANGO_CT, ID
 from django.conf import settings
+from service_directory.api import metrics
 
 class TagsField(SearchField):
     field_type = "nested"
@@ -22,6 +27,146 @@ class TagsField(SearchField):
 
 class ConfigurableElasticBackend(ElasticsearchSearchBackend):
 
+    def search(self, query_string, **kwargs):
+        with metrics.timed('es'):
+            return super(ConfigurableElasticBackend, self).search(query_string, **kwargs)
+
+    def multi_search(self, searches):
+        """
+        Run several searches, given as (query_string, search kwargs) pairs,
+        in a single _msearch request. Returns the results of each, as
+        search() would.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        body = []
+        geo_sorts = []
+        for query_string, kwargs in searches:
+            search_kwargs = self.build_search_kwargs(query_string, **kwargs)
+            start_offset = kwargs.get('start_offset', 0)
+            end_offset = kwargs.get('end_offset')
+            search_kwargs['from'] = start_offset
+            if end_offset is not None and end_offset > start_offset:
+                search_kwargs['size'] = end_offset - start_offset
+
+            geo_sorts.append(any(
+                '_geo_distance' in order
+                for order in search_kwargs.get('sort', [])
+            ))
+            body.append({'index': self.index_name, 'type': 'modelresult'})
+            body.append(search_kwargs)
+
+        try:
+            with metrics.timed('es'):
+                responses = self.conn.msearch(body=body)['responses']
+        except elasticsearch.TransportError as e:
+            if not self.silently_fail:
+                raise
+
+            self.log.error("Failed to multi search Elasticsearch: %s", e, exc_info=True)
+            responses = [{}] * len(searches)
+
+        results = []
+        for (query_string, kwargs), raw_results, geo_sort in \
+                zip(searches, responses, geo_sorts):
+            if 'error' in raw_results:
+                if not self.silently_fail:
+                    raise elasticsearch.TransportError(
+                        raw_results.get('status', 'N/A'), raw_results['error']
+                    )
+
+                self.log.error("Failed to query Elasticsearch using '%s': %s", query_string, raw_results['error'])
+                raw_results = {}
+
+            results.append(self._process_results(
+                raw_results,
+                highlight=kwargs.get('highlight'),
+                result_class=kwargs.get('result_class', SearchResult),
+                distance_point=kwargs.get('distance_point'),
+                geo_sort=geo_sort
+            ))
+        return results
+
+    def bulk_update(self, index, iterable, remove_ids=(), commit=True):
+        """
+        Index the objects in ``iterable`` and remove the documents with the
+        identifiers in ``remove_ids``, in a single _bulk request (rather than
+        one for the updates, as update() does, and another for each removal).
+        """
+        if not self.setup_complete:
+            try:
+                self.setup()
+            except elasticsearch.TransportError as e:
+                if not self.silently_fail:
+                    raise
+
+                self.log.error("Failed to update documents in Elasticsearch: %s", e, exc_info=True)
+                return
+
+        actions = []
+        for obj in iterable:
+            try:
+                prepped_data = index.full_prepare(obj)
+            except SkipDocument:
+                self.log.debug(u"Indexing for object `%s` skipped", obj)
+                continue
+
+            final_data = dict(
+                (key, self._from_python(value))
+                for key, value in prepped_data.items()
+            )
+            final_data['_id'] = final_data[ID]
+            actions.append(final_data)
+
+        for doc_id in remove_ids:
+            actions.append({'_op_type': 'delete', '_id': doc_id})
+
+        if not actions:
+            return
+
+        try:
+            with metrics.timed('es'):
+                _, errors = bulk(
+                    self.conn, actions, index=self.index_name,
+                    doc_type='modelresult', chunk_size=len(actions),
+                    raise_on_error=False
+                )
+
+                if commit:
+                    self.conn.indices.refresh(index=self.index_name)
+        except elasticsearch.TransportError as e:
+            if not self.silently_fail:
+                raise
+
+            self.log.error("Failed to update documents in Elasticsearch: %s", e, exc_info=True)
+            return
+
+        for error in errors:
+            # removing a document that was never indexed is fine
+            if error.get('delete', {}).get('status') == 404:
+                continue
+            self.log.error("Failed to update document in Elasticsearch: %s", error)
+
+    def scan_documents(self, django_ct, fields, sort_by, size=500):
+        """
+        Yield the ``fields`` of every document of the ``django_ct`` model
+        (eg: 'api.organisation'), in ``sort_by`` order, scrolling through
+        them ``size`` at a time.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        body = {
+            'query': {'term': {DJANGO_CT: django_ct}},
+            '_source': list(fields),
+            'sort': [{sort_by: {'order': 'asc'}}],
+        }
+        for hit in scan(self.conn, query=body, index=self.index_name,
+                        doc_type='modelresult', preserve_order=True,
+                        size=size):
+            yield hit.get('_source', {})
+
     def build_search_kwargs(self, query_string, sort_by=None, start_offset=0, end_offset=None,
                         fields='', highlight=False, facets=None,
                         date_facets=None, query_facets=None,
@@ -37,6 +182,9 @@ class ConfigurableElasticBackend(ElasticsearchSearchBackend):
                                                                within, dwithin, distance_point,
                                                                models, limit_to_registered_models,
                                                                result_class)
+        if 'facets' in out:
+            self.facets_to_aggregations(out)
+
         if nested:
             out['query'] = self.nested_query_factory(nested)
 
@@ -59,6 +207,38 @@ class ConfigurableElasticBackend(ElasticsearchSearchBackend):
 
 
 
+    def facets_to_aggregations(self, search_kwargs):
+        """
+        Run plain field facets as terms aggregations, which ElasticSearch
+        computes alongside the hits of the same query. Date and query facets,
+        and facets with their own filter or scope, are left as they are.
+        """
+        facets = search_kwargs['facets']
+        for name, facet in list(facets.items()):
+            if list(facet.keys()) == ['terms']:
+                search_kwargs.setdefault('aggs', {})[name] = {
+                    'terms': facet['terms']
+                }
+                del facets[name]
+
+        if not facets:
+            del search_kwargs['facets']
+
+    def _process_results(self, raw_results, *args, **kwargs):
+        results = super(ConfigurableElasticBackend, self)._process_results(
+            raw_results, *args, **kwargs
+        )
+
+        if 'aggregations' in raw_results:
+            fields = results['facets'].setdefault('fields', {})
+            for name, aggregation in raw_results['aggregations'].items():
+                fields[name] = [
+                    (bucket['key'], bucket['doc_count'])
+                    for bucket in aggregation['buckets']
+                ]
+
+        return results
+
     def nested_query_factory(self, nested):
         score_script = "(doc['%s.points'].empty ? 0 : doc['%s.points'].value)" % \
                        (nested['nested_query_path'],nested['nested_query_path'])
@@ -128,10 +308,12 @@ class ConfigurableElasticBackend(ElasticsearchSearchBackend):
             if field_class.indexed is False or hasattr(field_class, 'facet_for'):
                 field_mapping['index'] = 'not_analyzed'
 
-            if field_mapping['type'] == 'string' and field_class.indexed:
+            # facet fields are only ever matched exactly, and aggregated
+            if field_mapping['type'] == 'string' and field_class.indexed and \
+                    not hasattr(field_class, 'facet_for'):
                 field_mapping["term_vector"] = "with_positions_offsets"
 
-                if not hasattr(field_class, 'facet_for') and not field_class.field_type in('ngram', 'edge_ngram'):
+                if not field_class.field_type in('ngram', 'edge_ngram'):
                     field_mapping["analyzer"] = "snowball"
 
             mapping[field_class.index_fieldname] = field_mapping
@@ -148,6 +330,15 @@ class ConfigurableSearchQuerySet(SearchQuerySet):
         return clone
 
 
+    def search_params(self, start_offset=0, end_offset=None):
+        """
+        The (query_string, search kwargs) the backend would be given to run
+        this search, for use with ConfigurableElasticBackend.multi_search.
+        """
+        query = self.query._clone()
+        query.set_limits(start_offset, end_offset)
+        return query.build_query(), query.build_params()
+
     def nested(self, terms=None, path="tags", field="tag"):
         """Adds arguments for nested to the query"""
         clone = self._clone()
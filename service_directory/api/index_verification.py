@@ -0,0 +1,130 @@
+"""
+Checks the search index against the database without rebuilding it.
+
+The organisations are read from the database, and their documents from
+ElasticSearch, in primary key order. Merge joining the two finds the
+documents that are missing, orphaned (their organisation has been deleted)
+or stale (their content hash doesn't match the database's), and only those
+are repaired. Memory use is bounded by the chunk size.
+"""
+from collections import OrderedDict
+
+from haystack import connections
+from haystack.constants import DEFAULT_ALIAS
+from haystack.utils import get_model_ct
+from service_directory.api.models import Organisation
+
+
+OK = 'ok'
+MISSING = 'missing'
+ORPHANED = 'orphaned'
+STALE = 'stale'
+
+
+def database_hashes(index, chunk_size=500):
+    """
+    Yield (pk, content hash, organisation) for each organisation in the
+    database, in primary key order, paging by primary key.
+    """
+    queryset = index.index_queryset().order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        for organisation in chunk:
+            data = index.prepare(organisation)
+            yield organisation.pk, data['content_hash'], organisation
+        last_pk = chunk[-1].pk
+
+
+def index_hashes(backend, chunk_size=500):
+    """
+    Yield (pk, content hash) for each organisation document in the index,
+    in primary key order.
+    """
+    last_pk = None
+    for source in backend.scan_documents(
+        get_model_ct(Organisation), ('organisation_id', 'content_hash'),
+        'organisation_id', size=chunk_size
+    ):
+        pk = source.get('organisation_id')
+        if pk is None or (last_pk is not None and pk <= last_pk):
+            # eg: indexed before organisation_id was added
+            raise ValueError(
+                'The index is not in organisation_id order. You should run '
+                'the `rebuild_index` management command once.'
+            )
+        last_pk = pk
+        yield pk, source.get('content_hash')
+
+
+def compare(database, index):
+    """
+    Merge join the (pk, hash, organisation) stream from the database with
+    the (pk, hash) stream from the index, both in pk order. Yields (status,
+    pk, organisation) for each pk in either.
+    """
+    database, index = iter(database), iter(index)
+    db_row, index_row = next(database, None), next(index, None)
+
+    while db_row is not None or index_row is not None:
+        if index_row is None or (
+            db_row is not None and db_row[0] < index_row[0]
+        ):
+            yield MISSING, db_row[0], db_row[2]
+            db_row = next(database, None)
+        elif db_row is None or index_row[0] < db_row[0]:
+            yield ORPHANED, index_row[0], None
+            index_row = next(index, None)
+        else:
+            status = OK if db_row[1] == index_row[1] else STALE
+            yield status, db_row[0], db_row[2]
+            db_row, index_row = next(database, None), next(index, None)
+
+
+def verify_index(repair=True, chunk_size=500, using=DEFAULT_ALIAS):
+    """
+    Compare the organisation documents with the database and, if
+    ``repair``, index the missing and stale ones and remove the orphaned
+    ones, in bulk requests of ``chunk_size``. Returns the number of
+    documents found with each status.
+    """
+    index = connections[using].get_unified_index().get_index(Organisation)
+    backend = connections[using].get_backend()
+
+    counts = OrderedDict((status, 0) for status in (
+        OK, MISSING, ORPHANED, STALE
+    ))
+    to_index = []
+    to_remove = []
+    repaired = False
+
+    def flush():
+        backend.bulk_update(index, to_index, remove_ids=to_remove,
+                            commit=False)
+        del to_index[:]
+        del to_remove[:]
+
+    for status, pk, organisation in compare(
+        database_hashes(index, chunk_size),
+        index_hashes(backend, chunk_size)
+    ):
+        counts[status] += 1
+        if not repair or status == OK:
+            continue
+
+        repaired = True
+        if status == ORPHANED:
+            to_remove.append('{0}.{1}'.format(get_model_ct(Organisation), pk))
+        else:
+            to_index.append(organisation)
+        if len(to_index) + len(to_remove) >= chunk_size:
+            flush()
+
+    if to_index or to_remove:
+        flush()
+    if repaired:
+        backend.conn.indices.refresh(index=backend.index_name)
+
+    return counts
@@ -0,0 +1,161 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, \
+    setup_test_environment, teardown_test_environment
+from haystack import connections
+from rest_framework.test import APIClient
+from service_directory.api import views
+from service_directory.benchmarks.data import seed_directory
+from service_directory.benchmarks.rendering import measure_rendering
+from service_directory.benchmarks.runner import SCENARIOS, run_scenario, \
+    check_budgets
+
+
+class NullTracker(object):
+    def send(self, *args, **kwargs):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the public API endpoints against a synthetic directory '
+        'in a throwaway test database and ElasticSearch index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--countries', type=int, default=2)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--keywords', type=int, default=50)
+        parser.add_argument('--organisations', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Untimed requests per scenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--index-name',
+                            help='The ElasticSearch index to seed (and '
+                                 'delete afterwards), by default the '
+                                 'INDEX_NAME in HAYSTACK_CONNECTIONS with '
+                                 '"_benchmark" appended.')
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS.keys(),
+                            help='Only run the given scenario(s).')
+        parser.add_argument('--budgets',
+                            help='A JSON file of per-scenario budgets, eg: '
+                                 '{"search": {"p95_ms": 50, '
+                                 '"queries_max": 3}}. The command fails if '
+                                 'any budget is exceeded.')
+        parser.add_argument('--json', action='store_true',
+                            help='Output the results as JSON.')
+        parser.add_argument('--with-analytics', action='store_true',
+                            help='Send Google Analytics events as usual.')
+        parser.add_argument('--accept-encoding',
+                            help='Accept-Encoding header to send, eg: gzip '
+                                 '(bytes_mean is then the compressed size).')
+        parser.add_argument('--rendering', action='store_true',
+                            help='Instead of timing requests, compare render '
+                                 'times with each JSON renderer and response '
+                                 'sizes with each content coding.')
+
+    def handle(self, *args, **options):
+        budgets = {}
+        if options['budgets']:
+            with open(options['budgets']) as fp:
+                budgets = json.load(fp)
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+
+        backend = connections['default'].get_backend()
+        backend.index_name = options['index_name'] or '{0}_benchmark'.format(
+            settings.HAYSTACK_CONNECTIONS['default']['INDEX_NAME']
+        )
+        backend.setup_complete = False
+        backend.existing_mapping = {}
+
+        tracker = views.google_analytics_tracker
+        if not options['with_analytics']:
+            views.google_analytics_tracker = NullTracker()
+
+        try:
+            # measure every request the same way
+            with override_settings(PERFORMANCE_METRICS_SAMPLE_RATE=1.0):
+                summaries = self.run_benchmarks(options)
+        finally:
+            views.google_analytics_tracker = tracker
+            backend.clear()
+            connections.reload('default')
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        if options['rendering']:
+            columns = summaries.values()[0].keys() if summaries else []
+        else:
+            columns = ('requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms',
+                       'rps', 'queries_mean', 'queries_max', 'bytes_mean')
+        self.report(summaries, columns, options['json'])
+
+        failures = check_budgets(summaries, budgets)
+        if failures:
+            raise CommandError(
+                'Budgets exceeded:\n' + '\n'.join(failures)
+            )
+
+    def run_benchmarks(self, options):
+        directory = seed_directory(
+            countries=options['countries'],
+            categories=options['categories'],
+            keywords=options['keywords'],
+            organisations=options['organisations'],
+            seed=options['seed']
+        )
+
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_superuser('benchmark', '', 'benchmark')
+        )
+
+        summaries = {}
+        for name in options['scenario'] or SCENARIOS.keys():
+            if options['rendering']:
+                summaries[name] = measure_rendering(
+                    client, directory, name,
+                    iterations=options['requests'],
+                    seed=options['seed']
+                )
+                continue
+
+            result = run_scenario(
+                client, directory, name,
+                requests=options['requests'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                accept_encoding=options['accept_encoding']
+            )
+            summaries[name] = result.summary()
+
+        return summaries
+
+    def report(self, summaries, columns, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+
+        self.stdout.write(
+            '{0:<22}'.format('scenario') +
+            ''.join('{0:>16}'.format(column) for column in columns)
+        )
+        for name in SCENARIOS:
+            if name in summaries:
+                self.stdout.write(
+                    '{0:<22}'.format(name) +
+                    ''.join(
+                        '{0:>16}'.format(summaries[name][column])
+                        for column in columns
+                    )
+                )
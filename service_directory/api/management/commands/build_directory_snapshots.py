@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from service_directory.api.models import Country
+from service_directory.api.snapshots import build_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Build a gzipped JSON snapshot and a SQLite bundle of the '
+        'organisations in each country, and publish them in the snapshot '
+        'manifest. Run periodically (eg: from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--country', action='append',
+                            help='ISO code of a country to rebuild (default: '
+                                 'all of them).')
+        parser.add_argument('--output',
+                            help='Directory to write to (default: '
+                                 'SNAPSHOT_ROOT).')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Organisations fetched per query.')
+
+    def handle(self, *args, **options):
+        countries = Country.objects.order_by('iso_code')
+        if options['country']:
+            countries = countries.filter(iso_code__in=options['country'])
+            missing = set(code.upper() for code in options['country']) - set(
+                country.iso_code.upper() for country in countries
+            )
+            if missing:
+                raise CommandError(
+                    'Unknown countries: {0}'.format(', '.join(sorted(missing)))
+                )
+
+        manifest = build_snapshots(
+            countries, root=options['output'],
+            chunk_size=options['chunk_size']
+        )
+
+        for iso_code, entry in manifest['countries'].items():
+            self.stdout.write('{0}: {1} ({2} organisations)'.format(
+                iso_code, entry['json']['file'], entry['json']['organisations']
+            ))
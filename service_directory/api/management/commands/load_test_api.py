@@ -0,0 +1,91 @@
+import json
+from collections import OrderedDict
+from urlparse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from service_directory.benchmarks.load import directory_paths, gunicorn, \
+    run_load
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the read endpoints over HTTP with many concurrent '
+        'clients, some of them slow. By default this serves the app (with '
+        'the current settings and database) with gunicorn sync workers and '
+        'then gthread workers, and compares the two.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Load test this running server instead, '
+                                 'eg: http://127.0.0.1:8000')
+        parser.add_argument('--port', type=int, default=8765,
+                            help='Port to serve on when comparing.')
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=50,
+                            help='Threads per gthread worker.')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Clients making requests at once.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--client-delay', type=float, default=0.5,
+                            help='Seconds a slow client pauses part way '
+                                 'through sending its request.')
+        parser.add_argument('--slow-fraction', type=float, default=0.5,
+                            help='Fraction of requests sent slowly.')
+        parser.add_argument('--header', action='append', default=[],
+                            help='Header to send, eg: "Cookie: '
+                                 'sessionid=..." (the API requires an '
+                                 'admin user by default).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true',
+                            help='Output the results as JSON.')
+
+    def handle(self, *args, **options):
+        paths = directory_paths(seed=options['seed'])
+        load_options = dict(
+            paths=paths,
+            concurrency=options['concurrency'],
+            requests=options['requests'],
+            client_delay=options['client_delay'],
+            slow_fraction=options['slow_fraction'],
+            headers=options['header'],
+            seed=options['seed'],
+        )
+
+        summaries = OrderedDict()
+        if options['url']:
+            url = urlsplit(options['url'])
+            if not url.hostname:
+                raise CommandError('Invalid URL: {0}'.format(options['url']))
+            summaries['server'] = run_load(
+                'server', url.hostname, url.port or 80, **load_options
+            ).summary()
+        else:
+            host = '127.0.0.1'
+            for worker_class, threads in (('sync', 1),
+                                          ('gthread', options['threads'])):
+                with gunicorn(host, options['port'], worker_class,
+                              options['workers'], threads):
+                    summaries[worker_class] = run_load(
+                        worker_class, host, options['port'], **load_options
+                    ).summary()
+
+        self.report(summaries, options['json'])
+
+    def report(self, summaries, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+
+        columns = ('requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'rps')
+        self.stdout.write(
+            '{0:<22}'.format('workers') +
+            ''.join('{0:>16}'.format(column) for column in columns)
+        )
+        for name, summary in summaries.items():
+            self.stdout.write(
+                '{0:<22}'.format(name) +
+                ''.join(
+                    '{0:>16}'.format(summary[column]) for column in columns
+                )
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from service_directory.api.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the records of deleted organisations older than '
+        'SYNC_TOMBSTONE_RETENTION_DAYS (clients with older sync tokens must '
+        'sync again from the start). Run daily (eg: from cron).'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            'Deleted {0} tombstones'.format(prune_tombstones())
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from service_directory.api.search_log import apply_retention, \
+    rollup_search_log
+
+
+class Command(BaseCommand):
+    help = (
+        'Aggregate the search log into hourly counts of each query (and of '
+        'those that found nothing), then delete logged searches and hourly '
+        'counts past their retention periods. Run hourly (eg: from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int,
+                            help='Roll up the last HOURS hours again, '
+                                 'rather than those since the last run (and '
+                                 'the last SEARCH_ROLLUP_REBUILD_HOURS).')
+
+    def handle(self, *args, **options):
+        for hour, rows in rollup_search_log(hours=options['hours']):
+            self.stdout.write('{0}: {1} queries'.format(
+                hour.isoformat(), rows
+            ))
+
+        searches, rollups = apply_retention()
+        self.stdout.write(
+            'Deleted {0} logged searches and {1} hourly rollups'.format(
+                searches, rollups
+            )
+        )
@@ -0,0 +1,44 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from service_directory.api.index_verification import verify_index, OK
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the search index with the database, and reindex only the '
+        'organisations whose documents are missing or out of date (and '
+        'remove those of deleted organisations). Much cheaper than '
+        'rebuild_index, so it can be run nightly (eg: from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the differences.')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Organisations fetched per query, and '
+                                 'documents per ElasticSearch request.')
+        parser.add_argument('--json', action='store_true',
+                            help='Output the counts as JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            counts = verify_index(
+                repair=not options['dry_run'],
+                chunk_size=options['chunk_size']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        drift = sum(count for status, count in counts.items() if status != OK)
+        if drift:
+            logging.warn('The ElasticSearch index was out of sync with the '
+                         'database: %s', json.dumps(counts))
+
+        if options['json']:
+            self.stdout.write(json.dumps(counts, indent=2))
+            return
+
+        for status, count in counts.items():
+            self.stdout.write('{0:<10}{1:>10}'.format(status, count))
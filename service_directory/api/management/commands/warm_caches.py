@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from service_directory.api.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        'Warm up the caches of this process and of '
+        'ElasticSearch: load the reference data and templates, render the '
+        'home page and replay the most popular recent searches. Gunicorn '
+        'workers do this before serving requests; run this to warm '
+        'ElasticSearch after it restarts, or to time the warm up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int,
+                            default=settings.WARM_UP_SEARCHES,
+                            help='How many of the most popular searches to '
+                                 'replay.')
+        parser.add_argument('--days', type=int,
+                            default=settings.WARM_UP_SEARCH_DAYS,
+                            help='Popular over this many days.')
+        parser.add_argument('--fixtures',
+                            default=settings.WARM_UP_SEARCHES_FILE,
+                            help='JSON file with a list of search '
+                                 'parameters to replay as well.')
+
+    def handle(self, *args, **options):
+        timings = warm_up(
+            searches=options['searches'], fixtures=options['fixtures'],
+            days=options['days']
+        )
+        for name, seconds in timings.items():
+            self.stdout.write('{0:<16}{1:>8.2f}s'.format(name, seconds))
@@ -0,0 +1,149 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_counters = OrderedDict()
+_counters_lock = threading.Lock()
+
+
+class RequestMetrics(object):
+    """
+    Timings recorded over the course of a single request.
+
+    Each timing is a (count, seconds) pair, eg: the number of SQL queries run
+    and the total time spent running them.
+    """
+    def __init__(self):
+        self.started_at = time.time()
+        self.timings = OrderedDict()
+        self.tags = OrderedDict()
+
+    def record(self, name, duration, count=1):
+        timing = self.timings.setdefault(name, [0, 0.0])
+        timing[0] += count
+        timing[1] += duration
+
+    def tag(self, name, value):
+        self.tags[name] = value
+
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    def server_timing(self):
+        entries = [
+            '{0};dur={1:.1f}'.format(name, duration * 1000)
+            for name, (count, duration) in self.timings.items()
+        ]
+        entries.extend(
+            '{0};desc="{1}"'.format(name, value)
+            for name, value in self.tags.items()
+        )
+        return ', '.join(entries)
+
+    def as_dict(self):
+        return OrderedDict([
+            ('timings', OrderedDict(
+                (name, {'count': count, 'ms': round(duration * 1000, 1)})
+                for name, (count, duration) in self.timings.items()
+            )),
+            ('tags', self.tags),
+        ])
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def finish():
+    request_metrics = current()
+    _local.metrics = None
+    return request_metrics
+
+
+def current():
+    return getattr(_local, 'metrics', None)
+
+
+def record(name, duration, count=1):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.record(name, duration, count)
+
+
+def tag(name, value):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.tag(name, value)
+
+
+@contextmanager
+def timed(name):
+    """
+    Record the time spent in the block against the current request, if it is
+    being measured.
+    """
+    request_metrics = current()
+    if request_metrics is None:
+        yield
+        return
+
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        request_metrics.record(name, time.time() - started_at)
+
+
+@contextmanager
+def counted(name):
+    """
+    Count the calls to (and the time spent in) the block in the process-wide
+    ``<name>_total`` and ``<name>_seconds_total`` counters, eg: for work done
+    in the background, which isn't timed against a request.
+    """
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        increment('{0}_total'.format(name))
+        increment('{0}_seconds_total'.format(name), time.time() - started_at)
+
+
+def increment(name, value=1):
+    """
+    Increment a process-wide counter. These are exposed in Prometheus text
+    format by the ``Metrics`` view.
+    """
+    with _counters_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def counters():
+    with _counters_lock:
+        return OrderedDict(_counters)
+
+
+def log_request(request, response, request_metrics):
+    data = OrderedDict([
+        ('method', request.method),
+        ('path', request.path),
+        ('status', response.status_code),
+        ('ms', round(request_metrics.elapsed() * 1000, 1)),
+    ])
+    data.update(request_metrics.as_dict())
+
+    logger.info(json.dumps(data))
+
+    increment('requests_total')
+    for name, (count, duration) in request_metrics.timings.items():
+        increment('{0}_total'.format(name), count)
+        increment('{0}_seconds_total'.format(name), duration)
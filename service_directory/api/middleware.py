@@ -1,5 +1,26 @@
+import gzip
+import hashlib
+import logging
+import random
+import threading
 import warnings
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connections
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
 from haystack import signal_processor
+from service_directory.api import metrics, routers
+from service_directory.api.responses import etag_matches
+
+try:
+    # optional, responses are only gzipped without it
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
 
 
 # Ref: http://stackoverflow.com/a/31642337
@@ -10,9 +31,16 @@ class HaystackBatchFlushMiddleware(object):
     This should be placed *at the top* of MIDDLEWARE_CLASSES
     (so that it runs last).
     """
+    def process_request(self, request):
+        # (changes are only flushed at the end of the request)
+        start_request = getattr(signal_processor, 'start_request', None)
+        if start_request is not None:
+            start_request()
+
     def process_response(self, request, response):
         try:
-            signal_processor.flush_changes()
+            with metrics.timed('index_flush'):
+                signal_processor.finish_request()
         except AttributeError:
             # in case we're not using our expected signal_processor
             warnings.warn('HaystackBatchFlushMiddleware is being used with an'
@@ -21,3 +49,284 @@ class HaystackBatchFlushMiddleware(object):
                           'should remove this middleware if the'
                           'BatchingSignalProcessor is no longer needed.')
         return response
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Lets the reads of read-only API requests go to the read replicas (see
+    ReadReplicaRouter). Views that must see the latest data set
+    ``read_from_primary``.
+
+    After a client makes a change, its reads stay on the primary for
+    REPLICA_STICKY_SECONDS (tracked with a cookie), so that it sees its own
+    writes despite replication lag.
+
+    If the replica fails part way through the view (eg: it went down since
+    its connection was checked), it is ejected and the view is run again on
+    the primary.
+
+    This should be placed *below* HaystackBatchFlushMiddleware in
+    MIDDLEWARE_CLASSES, so that the index flush reads from the primary.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def process_request(self, request):
+        routers.use_replicas(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        routers.use_replicas(
+            request.method in self.SAFE_METHODS and
+            request.path.startswith(settings.REPLICA_PATH_PREFIX) and
+            settings.REPLICA_STICKY_COOKIE not in request.COOKIES and
+            not getattr(view_class, 'read_from_primary', False)
+        )
+        if routers.using_replicas():
+            request.replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        alias = routers.current_replica()
+        view = getattr(request, 'replica_view', None)
+        if alias is None or view is None or \
+                not isinstance(exception, (OperationalError, InterfaceError)):
+            return None
+
+        logging.warn('Database replica %s failed, retrying on the primary',
+                     alias, exc_info=True)
+        routers.replica_pool.failed(alias)
+        routers.use_replicas(False)
+        metrics.increment('db_replica_retries')
+
+        view_func, view_args, view_kwargs = view
+        return view_func(request, *view_args, **view_kwargs)
+
+    def process_response(self, request, response):
+        routers.use_replicas(False)
+
+        if request.method not in self.SAFE_METHODS and \
+                settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True
+            )
+        return response
+
+
+class PerformanceMetricsMiddleware(object):
+    """
+    Records where the time goes for a sample of requests: SQL queries,
+    ElasticSearch calls, external HTTP calls (Google Analytics, Vumi),
+    serialization and the index flush.
+
+    The timings are returned in a ``Server-Timing`` header and logged as a
+    JSON line to the ``service_directory.api.metrics`` logger.
+
+    This should be placed *above* HaystackBatchFlushMiddleware in
+    MIDDLEWARE_CLASSES so that the index flush is measured too.
+    """
+    def process_request(self, request):
+        if random.random() >= settings.PERFORMANCE_METRICS_SAMPLE_RATE:
+            return
+
+        request._metrics = metrics.start()
+        request._metrics_sql_state = []
+
+        # Django only keeps a log of the queries run (with their timings) in
+        # DEBUG mode, so we force that for the duration of the request.
+        for connection in connections.all():
+            request._metrics_sql_state.append((
+                connection,
+                connection.force_debug_cursor,
+                len(connection.queries_log)
+            ))
+            connection.force_debug_cursor = True
+
+    def process_response(self, request, response):
+        request_metrics = getattr(request, '_metrics', None)
+        if request_metrics is None:
+            return response
+
+        metrics.finish()
+
+        for connection, force_debug_cursor, start in \
+                request._metrics_sql_state:
+            queries = list(connection.queries_log)[start:]
+            request_metrics.record(
+                'sql',
+                sum(float(query['time']) for query in queries),
+                count=len(queries)
+            )
+            connection.force_debug_cursor = force_debug_cursor
+
+        if settings.PERFORMANCE_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = request_metrics.server_timing()
+
+        metrics.log_request(request, response, request_metrics)
+
+        return response
+
+
+def gzip_compress(content, level):
+    buf = BytesIO()
+    with gzip.GzipFile(mode='wb', compresslevel=level, fileobj=buf,
+                       mtime=0) as fileobj:
+        fileobj.write(content)
+    return buf.getvalue()
+
+
+def brotli_compress(content, level):
+    return brotli.compress(content, quality=level)
+
+
+class CompressedContentCache(object):
+    """
+    An LRU of (at most COMPRESSION_CACHE_SIZE) compressed response bodies,
+    keyed by the ETag of the uncompressed body and the content coding.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            content = self._entries.pop(key, None)
+            if content is not None:
+                self._entries[key] = content
+            return content
+
+    def set(self, key, content):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = content
+            while len(self._entries) > settings.COMPRESSION_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def is_api_json(request, response):
+    return (
+        request.path.startswith(settings.COMPRESSION_PATH_PREFIX) and
+        response.get('Content-Type', '').startswith('application/json')
+    )
+
+
+class ContentETagMiddleware(object):
+    """
+    Gives the responses that views mark as ``cache_compressed`` (payloads
+    that are the same for many requests, eg: an organisation's details) an
+    ETag hashed from their content, unless the view set one, and answers
+    conditional requests for them with 304 Not Modified.
+
+    This should be placed *below* CompressionMiddleware in
+    MIDDLEWARE_CLASSES, so that the ETag is there to be compressed against.
+    """
+    def process_response(self, request, response):
+        if (
+            not getattr(response, 'cache_compressed', False) or
+            response.streaming or
+            response.status_code != 200
+        ):
+            return response
+
+        if not response.has_header('ETag'):
+            response['ETag'] = quote_etag(
+                hashlib.md5(response.content).hexdigest()
+            )
+
+        if etag_matches(request, response['ETag'].strip('"')):
+            not_modified = HttpResponseNotModified()
+            not_modified['ETag'] = response['ETag']
+            return not_modified
+        return response
+
+
+class CompressionMiddleware(object):
+    """
+    Compresses the API's JSON responses (under COMPRESSION_PATH_PREFIX) with
+    brotli (when installed) or gzip, whichever the client prefers. Other
+    responses (eg: admin and browsable API pages, which carry CSRF tokens
+    alongside reflected input) aren't compressed, so as not to expose them
+    to BREACH. Compressed responses' ETags are made weak, as the compressed
+    bytes differ from the uncompressed ones.
+
+    Responses that views mark as ``cache_compressed`` are compressed once,
+    at a higher level, and the compressed bytes kept against the response's
+    ETag, which must identify the content exactly (see
+    ContentETagMiddleware).
+
+    This should be placed *above* ContentETagMiddleware in
+    MIDDLEWARE_CLASSES (so that it sees the ETag) and below
+    PerformanceMetricsMiddleware (so that it is measured).
+    """
+    # (compress, level for every request, level for cached content)
+    CODINGS = OrderedDict([
+        ('br', (brotli_compress, 4, 11)),
+        ('gzip', (gzip_compress, 6, 9)),
+    ])
+    if brotli is None:
+        del CODINGS['br']
+
+    cache = CompressedContentCache()
+
+    def choose_coding(self, request):
+        preferences = {}
+        for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            parts = item.strip().split(';')
+            quality = 1.0
+            for param in parts[1:]:
+                name, _, value = param.strip().partition('=')
+                if name == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            preferences[parts[0].strip().lower()] = quality
+
+        best = None
+        for coding in self.CODINGS:
+            quality = preferences.get(coding, preferences.get('*', 0.0))
+            if quality > 0 and (best is None or quality > best[1]):
+                best = (coding, quality)
+        return best[0] if best else None
+
+    def process_response(self, request, response):
+        if (
+            response.streaming or
+            response.status_code != 200 or
+            response.has_header('Content-Encoding') or
+            len(response.content) < settings.COMPRESSION_MIN_LENGTH or
+            not is_api_json(request, response)
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        coding = self.choose_coding(request)
+        if coding is None:
+            return response
+
+        compress, level, cached_level = self.CODINGS[coding]
+
+        with metrics.timed('compress'):
+            etag = response.get('ETag')
+            if etag and getattr(response, 'cache_compressed', False):
+                key = (etag, coding)
+                content = self.cache.get(key)
+                if content is None:
+                    content = compress(response.content, cached_level)
+                    self.cache.set(key, content)
+            else:
+                content = compress(response.content, level)
+
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = coding
+        if etag and not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        return response
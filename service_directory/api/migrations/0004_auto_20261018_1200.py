@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_auto_20170417_1312'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='organisation',
+            name='name',
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_auto_20261018_1200'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganisationTombstone',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('organisation_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now_add=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now_add=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='keyword',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now_add=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='keyword',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='organisation',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now_add=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='organisation',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='organisation',
+            index_together=set([('updated_at', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='organisationtombstone',
+            index_together=set([('deleted_at', 'id')]),
+        ),
+    ]
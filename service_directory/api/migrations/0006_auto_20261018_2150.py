@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_auto_20261018_1300'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryHourly',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('hour', models.DateTimeField()),
+                ('query', models.TextField()),
+                ('search_term', models.TextField(blank=True)),
+                ('searches', models.IntegerField()),
+                ('zero_result_searches', models.IntegerField()),
+                ('total_latency_ms', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name_plural': 'search queries by hour',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchQueryLog',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('searched_at', models.DateTimeField(db_index=True)),
+                ('query', models.TextField()),
+                ('search_term', models.TextField(blank=True)),
+                ('hits', models.IntegerField()),
+                ('latency_ms', models.IntegerField()),
+                ('tier', models.CharField(max_length=10)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='searchqueryhourly',
+            index_together=set([('hour', 'searches')]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# The admin's name search runs UPPER(name::text) LIKE UPPER('%term%'),
+# which a btree index can't serve; these trigram indexes on that expression
+# can.
+INDEXES = (
+    ('api_keyword_name_trgm', 'api_keyword'),
+    ('api_organisation_name_trgm', 'api_organisation'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_auto_20261018_2150'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+            reverse_sql="DROP EXTENSION IF EXISTS pg_trgm"
+        ),
+    ] + [
+        migrations.RunSQL(
+            "CREATE INDEX {0} ON {1} "
+            "USING gin (UPPER(name::text) gin_trgm_ops);".format(name, table),
+            reverse_sql="DROP INDEX IF EXISTS {0}".format(name)
+        )
+        for name, table in INDEXES
+    ]
@@ -4,6 +4,12 @@ from django.contrib.gis.db.models import PointField
 from django.db import models
 
 
+def formatted_names(related):
+    # sorted here rather than with order_by() so that the rows prefetched by
+    # the admin changelists are used
+    return ', '.join(sorted(item.__unicode__() for item in related.all()))
+
+
 class CaseInsensitiveTextField(models.TextField):
     """
     See
@@ -18,6 +24,9 @@ class Country(models.Model):
     name = CaseInsensitiveTextField(max_length=100, unique=True)
     iso_code = CaseInsensitiveTextField(max_length=3, unique=True)
 
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __unicode__(self):
         return self.name
 
@@ -29,6 +38,9 @@ class Category(models.Model):
     name = CaseInsensitiveTextField(max_length=50, unique=True)
     show_on_home_page = models.BooleanField(default=False)
 
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __unicode__(self):
         return self.name
 
@@ -41,14 +53,14 @@ class Keyword(models.Model):
     categories = models.ManyToManyField(Category, through='KeywordCategory')
     show_on_home_page = models.BooleanField(default=False)
 
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __unicode__(self):
         return self.name
 
     def formatted_categories(self):
-        categories = [
-            category.__unicode__() for category in self.categories.all()
-        ]
-        return ', '.join(categories)
+        return formatted_names(self.categories)
     formatted_categories.short_description = 'Categories'
 
 
@@ -95,6 +107,15 @@ class Organisation(models.Model):
 
     facility_code = models.CharField(max_length=50, blank=True)
 
+    created_at = models.DateTimeField(auto_now_add=True)
+    # also bumped when the organisation's categories or keywords change, see
+    # service_directory.api.sync
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # the delta sync API pages through organisations in this order
+        index_together = (('updated_at', 'id'),)
+
     def __unicode__(self):
         return self.name
 
@@ -104,17 +125,11 @@ class Organisation(models.Model):
             return '{0}, {1}'.format(self.location.y, self.location.x)
 
     def formatted_categories(self):
-        categories = [
-            category.__unicode__() for category in self.categories.all()
-        ]
-        return ', '.join(categories)
+        return formatted_names(self.categories)
     formatted_categories.short_description = 'Categories'
 
     def formatted_keywords(self):
-        keywords = [
-            keyword.__unicode__() for keyword in self.keywords.all()
-        ]
-        return ', '.join(keywords)
+        return formatted_names(self.keywords)
     formatted_keywords.short_description = 'Keywords'
 
 
@@ -144,6 +159,18 @@ class OrganisationKeyword(models.Model):
         verbose_name_plural = 'organisation keywords'
 
 
+class OrganisationTombstone(models.Model):
+    """
+    Records the deletion of an Organisation so that the delta sync API can
+    tell clients to remove it.
+    """
+    organisation_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = (('deleted_at', 'id'),)
+
+
 class OrganisationIncorrectInformationReport(models.Model):
     organisation = models.ForeignKey(Organisation)
 
@@ -178,3 +205,37 @@ class OrganisationRating(models.Model):
 
     class Meta:
         verbose_name_plural = 'Organisations - Ratings'
+
+
+class SearchQueryLog(models.Model):
+    """
+    A search, as recorded by ``search_log``. Rolled up hourly into
+    SearchQueryHourly, and deleted after SEARCH_LOG_RETENTION_DAYS.
+    """
+    searched_at = models.DateTimeField(db_index=True)
+
+    # the normalised search parameters, as a query string
+    query = models.TextField()
+    search_term = models.TextField(blank=True)
+
+    hits = models.IntegerField()
+    latency_ms = models.IntegerField()
+    tier = models.CharField(max_length=10)
+
+
+class SearchQueryHourly(models.Model):
+    """
+    The number of times each query was searched for in an hour, and how many
+    of those found nothing.
+    """
+    hour = models.DateTimeField()
+    query = models.TextField()
+    search_term = models.TextField(blank=True)
+
+    searches = models.IntegerField()
+    zero_result_searches = models.IntegerField()
+    total_latency_ms = models.BigIntegerField()
+
+    class Meta:
+        index_together = (('hour', 'searches'),)
+        verbose_name_plural = 'search queries by hour'
@@ -0,0 +1,83 @@
+"""
+PostGIS with persistent connections that are checked before being reused.
+
+Connections are kept open between requests for CONN_MAX_AGE seconds. The
+first time a request uses one it is checked with a ``SELECT 1``, and
+replaced if it's broken (eg: the server was restarted), so that the
+request doesn't fail. Opens, reuses and failures are counted in the
+process-wide metrics.
+
+``on_commit`` runs a function once the current transaction has committed
+(a minimal backport of Django 1.9's ``transaction.on_commit``).
+"""
+from django.contrib.gis.db.backends.postgis import base
+from django.core.signals import request_started
+from django.db import DatabaseError, connections
+from service_directory.api import metrics
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_needed = False
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.run_on_commit = []
+
+    def on_commit(self, func):
+        """
+        Call ``func`` once the current transaction commits, or now if there
+        isn't one. It isn't called if the transaction is rolled back, and is
+        only called once however many times it's given in a transaction.
+        """
+        if not self.in_atomic_block:
+            func()
+        elif func not in self.run_on_commit:
+            self.run_on_commit.append(func)
+
+    def commit(self):
+        super(DatabaseWrapper, self).commit()
+        funcs, self.run_on_commit = self.run_on_commit, []
+        for func in funcs:
+            func()
+
+    def rollback(self):
+        self.run_on_commit = []
+        super(DatabaseWrapper, self).rollback()
+
+    def close(self):
+        # an open transaction is rolled back by the server
+        self.run_on_commit = []
+        super(DatabaseWrapper, self).close()
+
+    def ensure_connection(self):
+        if self.connection is not None and self.health_check_needed:
+            self.health_check_needed = False
+            # a connection can't be replaced part way through a transaction
+            if self.in_atomic_block or self.is_usable():
+                metrics.increment('db_connection_reuses')
+            else:
+                metrics.increment('db_connection_failures')
+                try:
+                    self.close()
+                except DatabaseError:
+                    pass
+                self.connection = None
+
+        if self.connection is None:
+            try:
+                super(DatabaseWrapper, self).ensure_connection()
+            except DatabaseError:
+                metrics.increment('db_connection_failures')
+                raise
+            metrics.increment('db_connection_opens')
+            self.health_check_needed = False
+
+
+def check_connections_on_reuse(**kwargs):
+    for connection in connections.all():
+        connection.health_check_needed = True
+
+
+request_started.connect(
+    check_connections_on_reuse, dispatch_uid='postgis_backend_health_check'
+)
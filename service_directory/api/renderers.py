@@ -0,0 +1,53 @@
+from django.utils import six
+from rest_framework.compat import INDENT_SEPARATORS, LONG_SEPARATORS, \
+    SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+try:
+    # optional, for its C accelerated encoder
+    import simplejson
+except ImportError:  # pragma: no cover
+    simplejson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders the same JSON as JSONRenderer, but uses simplejson's C
+    accelerated encoder when it is installed, and falls back to JSONRenderer
+    (the standard library ``json``) when it isn't.
+
+    With ``ensure_ascii`` off (DRF's default) the standard library encodes
+    strings in pure Python on Python 2, which dominates render time for
+    text-heavy payloads.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if simplejson is None or data is None:
+            return super(FastJSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        if indent is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        else:
+            separators = INDENT_SEPARATORS
+
+        # everything simplejson would otherwise encode differently to the
+        # standard library is turned off, so that values it doesn't handle
+        # natively go through DRF's encoder as usual
+        ret = simplejson.dumps(
+            data, default=self.encoder_class().default,
+            indent=indent, ensure_ascii=self.ensure_ascii,
+            separators=separators, use_decimal=False,
+            namedtuple_as_object=False, for_json=False
+        )
+
+        # see JSONRenderer.render
+        if isinstance(ret, six.text_type):
+            ret = ret.replace(u'\u2028', u'\\u2028').replace(
+                u'\u2029', u'\\u2029'
+            )
+            return bytes(ret.encode('utf-8'))
+        return ret
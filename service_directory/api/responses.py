@@ -0,0 +1,43 @@
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+
+    etags = parse_etags(if_none_match)
+    return etag in etags or '*' in etags
+
+
+def not_modified_response(etag):
+    return Response(
+        status=status.HTTP_304_NOT_MODIFIED,
+        headers={'ETag': quote_etag(etag)}
+    )
+
+
+class PrerenderedResponse(Response):
+    """
+    A Response for data that has already been rendered to JSON.
+
+    The rendered content is used as is when the JSON renderer is negotiated;
+    any other renderer (eg: the browsable API) renders ``data`` as usual.
+    """
+    def __init__(self, data, content, **kwargs):
+        super(PrerenderedResponse, self).__init__(data, **kwargs)
+        self.prerendered_content = content
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        media_type = getattr(self, 'accepted_media_type', None) or ''
+
+        if not isinstance(renderer, JSONRenderer) or 'indent' in media_type:
+            return super(PrerenderedResponse, self).rendered_content
+
+        self['Content-Type'] = self.content_type or renderer.media_type
+        return self.prerendered_content
@@ -0,0 +1,159 @@
+"""
+Sends read-only API traffic to the read replicas in DATABASE_REPLICAS, and
+everything else (writes, the admin, imports and management commands) to the
+primary (``default``) database.
+
+Reads only go to a replica while ReplicaRoutingMiddleware says so, ie: for
+the duration of a read-only API request. If a replica fails part way through
+one, it is ejected and the request is retried on the primary. Data that is
+cached for other requests (see ``primary_reads``) is always read from the
+primary, as a lagging replica could still have the data from before the
+change that invalidated the cache.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, Error, connections
+from service_directory.api import metrics
+
+
+PRIMARY = 'default'
+
+_local = threading.local()
+
+
+def use_replicas(value):
+    """
+    Allow (or stop) reads in the current thread going to the replicas.
+    """
+    _local.use_replicas = value
+    _local.alias = None
+
+
+def using_replicas():
+    return getattr(_local, 'use_replicas', False)
+
+
+def current_replica():
+    """
+    The replica the current thread's reads have gone to, if any.
+    """
+    alias = getattr(_local, 'alias', None)
+    if using_replicas() and alias not in (None, PRIMARY):
+        return alias
+    return None
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the reads in the block to the primary, eg: to refill a cache.
+    """
+    previous = (using_replicas(), getattr(_local, 'alias', None))
+    _local.use_replicas = False
+    try:
+        yield
+    finally:
+        _local.use_replicas, _local.alias = previous
+
+
+class ReplicaPool(object):
+    """
+    Picks replicas in turn, skipping those that recently failed a
+    connection check until REPLICA_EJECT_SECONDS have passed.
+    """
+    def __init__(self):
+        self._ejected = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def is_ejected(self, alias):
+        with self._lock:
+            ejected_at = self._ejected.get(alias)
+            if ejected_at is None:
+                return False
+            if time.time() - ejected_at >= settings.REPLICA_EJECT_SECONDS:
+                del self._ejected[alias]
+                return False
+            return True
+
+    def eject(self, alias):
+        logging.warn('Ejecting database replica %s for %s seconds', alias,
+                     settings.REPLICA_EJECT_SECONDS)
+        metrics.increment('db_replica_ejections')
+        with self._lock:
+            self._ejected[alias] = time.time()
+
+    def is_healthy(self, alias):
+        # connects, or (with api.postgis_backend) checks a reused connection
+        # once per request, so that a replica that is down fails here rather
+        # than part way through a view
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logging.warn('Database replica %s is unavailable', alias,
+                         exc_info=True)
+            return False
+        return True
+
+    def failed(self, alias):
+        """
+        Eject a replica that failed part way through a request, and close
+        its connection.
+        """
+        self.eject(alias)
+        try:
+            connections[alias].close()
+        except Error:
+            pass
+
+    def choose(self):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return PRIMARY
+
+        start = next(self._counter)
+        for i in range(len(replicas)):
+            alias = replicas[(start + i) % len(replicas)]
+            if self.is_ejected(alias):
+                continue
+            if self.is_healthy(alias):
+                return alias
+            self.eject(alias)
+
+        # every replica is down
+        return PRIMARY
+
+    def reset(self):
+        with self._lock:
+            self._ejected.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+class ReadReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if not using_replicas():
+            return PRIMARY
+
+        # stick to one database for the rest of the request, so that its
+        # reads are consistent with each other
+        alias = getattr(_local, 'alias', None)
+        if alias is None or replica_pool.is_ejected(alias):
+            alias = _local.alias = replica_pool.choose()
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model=None, **hints):
+        return db == PRIMARY
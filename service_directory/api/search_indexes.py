@@ -1,27 +1,71 @@
+import hashlib
+import json
+
+from django.utils.encoding import force_text
 from haystack import indexes
 from models import Organisation
 
 
+def content_hash(prepared_data):
+    """
+    A hash of a prepared document, to tell whether the indexed copy is out of
+    date.
+    """
+    data = dict(
+        (key, value) for key, value in prepared_data.items()
+        if key != 'content_hash'
+    )
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=force_text)
+    ).hexdigest()
+
+
 class OrganisationIndex(indexes.SearchIndex, indexes.Indexable):
-    keywords = indexes.MultiValueField(null=True)
-    categories = indexes.MultiValueField(null=True)
+    # faceted, for the search facet counts
+    keywords = indexes.MultiValueField(null=True, faceted=True)
+    categories = indexes.MultiValueField(null=True, faceted=True)
 
     text = indexes.CharField(document=True, use_template=True)
     location = indexes.LocationField(model_attr='location', null=True)
-    country = indexes.CharField(model_attr='country__iso_code', null=True)
+    country = indexes.CharField(
+        model_attr='country__iso_code', null=True, faceted=True
+    )
+
+    # for verify_index, which reads the documents in primary key order and
+    # compares their hashes with the database's
+    organisation_id = indexes.IntegerField(model_attr='pk')
+    content_hash = indexes.CharField(indexed=False, null=True)
 
     def get_model(self):
         return Organisation
 
+    def index_queryset(self, using=None):
+        # everything the prepare methods and the text template use, so that
+        # bulk indexing runs a constant number of queries
+        return self.get_model().objects.select_related(
+            'country'
+        ).prefetch_related(
+            'categories', 'keywords'
+        )
+
+    def read_queryset(self, using=None):
+        return self.get_model().objects.prefetch_related('keywords')
+
+    def prepare(self, obj):
+        data = super(OrganisationIndex, self).prepare(obj)
+        data['content_hash'] = content_hash(data)
+        return data
+
     def prepare_categories(self, obj):
         # Since we're using a M2M relationship with a complex lookup,
+        # we sort the (possibly prefetched) related objects ourselves
         return [
             category.id for category in
-            obj.categories.order_by('pk')
+            sorted(obj.categories.all(), key=lambda category: category.pk)
         ]
 
     def prepare_keywords(self, obj):
-        return [
-            keyword.name for keyword in
-            obj.keywords.order_by('name')
-        ]
+        return sorted(
+            [keyword.name for keyword in obj.keywords.all()],
+            key=lambda name: name.lower()
+        )
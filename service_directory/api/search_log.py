@@ -0,0 +1,267 @@
+"""
+Records searches locally (as well as in Google Analytics), so that we can
+query them ourselves, eg: to decide what to cache.
+
+Each search is appended to an in-memory ring buffer, which is written to
+the database with ``bulk_create`` on a background thread. The
+``rollup_search_log`` management command aggregates the log by hour
+(rebuilding the last few hours each time, to count searches written late)
+and deletes old records.
+"""
+import atexit
+import logging
+import threading
+import time
+import urllib
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, router, transaction
+from django.db.models import Case, Count, IntegerField, Max, Min, Sum, \
+    Value, When
+from django.utils import timezone
+from service_directory.api import metrics
+from service_directory.api.background import dispatcher
+from service_directory.api.models import SearchQueryHourly, SearchQueryLog
+
+
+def normalise_search_term(value):
+    return u' '.join(value.lower().split())
+
+
+def normalise_search(validated_data):
+    """
+    The parameters of a search (as validated by SearchSerializer) as a
+    query string that the search endpoint accepts, with equivalent searches
+    normalised to the same one. Locations are rounded to about a kilometre.
+    """
+    params = []
+    for name, value in sorted(validated_data.items()):
+        if name in ('search_term', 'place_name'):
+            value = normalise_search_term(value)
+        elif name == 'country':
+            value = value.upper()
+        elif name == 'location':
+            value = '{0:.2f},{1:.2f}'.format(value.y, value.x)
+        elif name == 'facets':
+            value = ','.join(sorted(value))
+
+        if name == 'keywords':
+            values = sorted(set(
+                normalise_search_term(keyword) for keyword in value
+            ))
+        elif name == 'categories':
+            values = sorted(set(value))
+        else:
+            values = [value]
+
+        params.extend(
+            (name, unicode(value).encode('utf-8'))
+            # (all_categories is False unless given)
+            for value in values if value not in ('', None) and
+            value is not False
+        )
+
+    return urllib.urlencode(params)
+
+
+class SearchLog(object):
+    """
+    A ring buffer of at most SEARCH_LOG_BUFFER_SIZE searches (the oldest are
+    dropped if the database falls behind). It is written out in the
+    background once SEARCH_LOG_FLUSH_SIZE are waiting, or once the oldest
+    has waited SEARCH_LOG_FLUSH_SECONDS (checked by a timer, and on each
+    search), and at exit.
+    """
+    def __init__(self):
+        self._records = None
+        self._since = None
+        self._dispatched_at = None
+        self._lock = threading.Lock()
+
+    def record(self, validated_data, hits, latency, tier):
+        # kept compact until written
+        entry = (
+            timezone.now(),
+            normalise_search(validated_data),
+            normalise_search_term(validated_data.get('search_term', '')),
+            hits,
+            int(latency * 1000),
+            tier,
+        )
+
+        with self._lock:
+            if self._records is None:
+                self._records = deque(maxlen=settings.SEARCH_LOG_BUFFER_SIZE)
+            if len(self._records) == self._records.maxlen:
+                metrics.increment('search_log_dropped')
+            self._records.append(entry)
+            if self._since is None:
+                self._since = time.time()
+                self.schedule_flush()
+            flush = self._flush_due()
+
+        if flush:
+            dispatcher.dispatch(self.flush)
+
+    def _flush_due(self):
+        """
+        Whether to dispatch a flush (and if so, note that it has been).
+        Called with the lock held.
+        """
+        if not self._records:
+            return False
+
+        now = time.time()
+        # (dispatched again if the background queue dropped a flush)
+        flush = (
+            len(self._records) >= settings.SEARCH_LOG_FLUSH_SIZE or
+            now - self._since >= settings.SEARCH_LOG_FLUSH_SECONDS
+        ) and (
+            self._dispatched_at is None or
+            now - self._dispatched_at >= settings.SEARCH_LOG_FLUSH_SECONDS
+        )
+        if flush:
+            self._dispatched_at = now
+        return flush
+
+    def schedule_flush(self):
+        """
+        Check again once the first search waiting has waited
+        SEARCH_LOG_FLUSH_SECONDS, so that it is written even if no other
+        search follows. Only with background workers: otherwise flushes run
+        inline (eg: within each test's transaction), on the next search.
+        """
+        if not settings.BACKGROUND_WORKERS:
+            return
+        timer = threading.Timer(
+            settings.SEARCH_LOG_FLUSH_SECONDS, self.flush_if_due
+        )
+        timer.daemon = True
+        timer.start()
+
+    def flush_if_due(self):
+        with self._lock:
+            flush = self._flush_due()
+        if flush:
+            dispatcher.dispatch(self.flush)
+
+    def flush(self):
+        with self._lock:
+            records = list(self._records or ())
+            if self._records is not None:
+                self._records.clear()
+            self._since = None
+            self._dispatched_at = None
+
+        if not records:
+            return
+
+        try:
+            SearchQueryLog.objects.bulk_create([
+                SearchQueryLog(
+                    searched_at=searched_at, query=query,
+                    search_term=search_term, hits=hits,
+                    latency_ms=latency_ms, tier=tier
+                )
+                for searched_at, query, search_term, hits, latency_ms, tier
+                in records
+            ], batch_size=500)
+        except DatabaseError:
+            metrics.increment('search_log_dropped', len(records))
+            logging.error('Failed to write the search log', exc_info=True)
+
+
+search_log = SearchLog()
+atexit.register(search_log.flush)
+
+
+def start_of_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_hour(hour):
+    """
+    (Re)build the SearchQueryHourly rows for the hour starting at ``hour``.
+    Returns the number of rows.
+    """
+    rows = SearchQueryLog.objects.filter(
+        searched_at__gte=hour, searched_at__lt=hour + timedelta(hours=1)
+    ).values('query', 'search_term').annotate(
+        searches=Count('id'),
+        zero_result_searches=Sum(Case(
+            When(hits=0, then=Value(1)), default=Value(0),
+            output_field=IntegerField()
+        )),
+        total_latency_ms=Sum('latency_ms'),
+    ).order_by()
+
+    with transaction.atomic():
+        SearchQueryHourly.objects.filter(hour=hour).delete()
+        rollups = SearchQueryHourly.objects.bulk_create([
+            SearchQueryHourly(hour=hour, **row) for row in rows
+        ], batch_size=500)
+    return len(rollups)
+
+
+def rollup_search_log(hours=None, now=None):
+    """
+    Roll up each complete hour since the last one rolled up, and rebuild
+    the last SEARCH_ROLLUP_REBUILD_HOURS (or the last ``hours`` hours), so
+    that searches written after their hour was rolled up are counted.
+    Returns (hour, rows) pairs.
+    """
+    current_hour = start_of_hour(now or timezone.now())
+
+    if hours:
+        hour = current_hour - timedelta(hours=hours)
+    else:
+        last_hour = SearchQueryHourly.objects.aggregate(
+            Max('hour')
+        )['hour__max']
+        first_search = SearchQueryLog.objects.aggregate(
+            Min('searched_at')
+        )['searched_at__min']
+        if last_hour is not None:
+            hour = min(
+                last_hour + timedelta(hours=1),
+                current_hour - timedelta(
+                    hours=settings.SEARCH_ROLLUP_REBUILD_HOURS
+                )
+            )
+        elif first_search is not None:
+            hour = start_of_hour(first_search)
+        else:
+            hour = current_hour
+
+    rolled_up = []
+    while hour < current_hour:
+        rolled_up.append((hour, rollup_hour(hour)))
+        hour += timedelta(hours=1)
+    return rolled_up
+
+
+def delete_expired(model, field, days, now=None):
+    queryset = model.objects.filter(**{
+        '{0}__lt'.format(field): (now or timezone.now()) - timedelta(days=days)
+    })
+    count = queryset.count()
+    # in a single query: delete() would load every row, to send signals
+    # that nothing needs
+    queryset._raw_delete(using=router.db_for_write(model))
+    return count
+
+
+def apply_retention(now=None):
+    """
+    Delete the logged searches older than SEARCH_LOG_RETENTION_DAYS, and
+    the hourly rollups older than SEARCH_ROLLUP_RETENTION_DAYS. Returns the
+    number of each deleted.
+    """
+    return (
+        delete_expired(SearchQueryLog, 'searched_at',
+                       settings.SEARCH_LOG_RETENTION_DAYS, now),
+        delete_expired(SearchQueryHourly, 'hour',
+                       settings.SEARCH_ROLLUP_RETENTION_DAYS, now),
+    )
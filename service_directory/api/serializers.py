@@ -1,9 +1,12 @@
+import copy
 import logging
 from geopy.distance import distance as geo_distance
 from collections import OrderedDict
+from django.conf import settings
 from django.contrib.gis.measure import D
 from django.contrib.gis.geos import Point
-from models import Organisation, Category, Keyword, \
+from haystack import signal_processor
+from models import Country, Organisation, Category, Keyword, \
     OrganisationIncorrectInformationReport, OrganisationRating
 from rest_framework import serializers
 
@@ -24,6 +27,75 @@ class PointField(serializers.CharField):
         return Point(lng, lat, srid=4326)
 
 
+class SparseFieldsetMixin(object):
+    """
+    Lets clients ask for a subset of a serializer's fields (eg:
+    ``?fields=id,name``), and loads only what those fields need.
+
+    ``field_requirements`` maps a field to the (columns, select_related,
+    prefetch_related) it needs; any other field needs the column of the same
+    name.
+    """
+    field_requirements = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super(SparseFieldsetMixin, self).__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        """
+        The fields asked for in the request, or None for all of them.
+        """
+        value = request.query_params.get('fields')
+        if not value:
+            return None
+
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(fields) - set(cls().fields)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': ['Unknown fields: {0}'.format(
+                    ', '.join(sorted(unknown))
+                )]
+            })
+        return fields
+
+    @classmethod
+    def optimise_queryset(cls, queryset, fields, extra_columns=()):
+        """
+        Limit the queryset to the columns and relations needed for
+        ``fields`` (all of the serializer's fields if None).
+        """
+        if fields is None:
+            fields = cls().fields.keys()
+            restrict_columns = False
+        else:
+            restrict_columns = True
+
+        columns = set(['id']) | set(extra_columns)
+        select_related = set()
+        prefetch_related = set()
+        for name in fields:
+            field_columns, field_select, field_prefetch = \
+                cls.field_requirements.get(name, ((name,), (), ()))
+            columns.update(field_columns)
+            select_related.update(field_select)
+            prefetch_related.update(field_prefetch)
+
+        if restrict_columns:
+            queryset = queryset.only(*columns)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
 class HomePageCategoryKeywordGroupingSerializer(serializers.ModelSerializer):
     keywords = serializers.StringRelatedField(source='filtered_keywords',
                                               many=True)
@@ -33,9 +105,22 @@ class HomePageCategoryKeywordGroupingSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'keywords')
 
 
+class CountrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Country
+        fields = ('id', 'name', 'iso_code')
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'show_on_home_page')
+
+
 class KeywordSerializer(serializers.ModelSerializer):
     class Meta:
         model = Keyword
+        fields = ('id', 'name', 'show_on_home_page', 'categories')
 
 
 class SearchSerializer(serializers.Serializer):
@@ -52,7 +137,66 @@ class SearchSerializer(serializers.Serializer):
     categories = serializers.ListField(
         child=serializers.IntegerField(), required=False)
 
-    def perform_search(self, sqs):
+    facets = serializers.CharField(required=False)
+
+    # The fields facet counts can be asked for
+    FACETS = ('categories', 'keywords', 'country')
+
+    # Search term tiers, cheapest first. See ``load_search_results``.
+    TIER_NONE = 'none'
+    TIER_EXACT = 'exact'
+    TIER_FUZZY = 'fuzzy'
+
+    search_tier = TIER_NONE
+    facet_counts = None
+    hit_count = None
+
+    def validate_facets(self, value):
+        facets = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(facets) - set(self.FACETS)
+        if unknown:
+            raise serializers.ValidationError(
+                u'Unknown facets: {0}'.format(', '.join(sorted(unknown)))
+            )
+        return facets
+
+    def build_search_term_query(self, search_term, tier):
+        if tier == self.TIER_EXACT:
+            return {
+                "bool": {
+                    "should": [
+                        {
+                            "match_phrase": {
+                                "text": {
+                                    "query": search_term,
+                                    "boost": 2
+                                }
+                            }
+                        },
+                        {
+                            "match": {
+                                "text": {
+                                    "query": search_term,
+                                    "operator": "and"
+                                }
+                            }
+                        }
+                    ]
+                }
+            }
+
+        return {
+            "match": {
+                "text": {
+                    "query": search_term,
+                    "fuzziness": "AUTO",
+                    "prefix_length": settings.SEARCH_FUZZY_PREFIX_LENGTH,
+                    "max_expansions": settings.SEARCH_FUZZY_MAX_EXPANSIONS
+                }
+            }
+        }
+
+    def perform_search(self, sqs, tier=TIER_EXACT):
         radius = self.validated_data.get('radius')
         country = self.validated_data.get('country')
         location = self.validated_data.get('location')
@@ -60,17 +204,14 @@ class SearchSerializer(serializers.Serializer):
         categories = self.validated_data.get('categories')
         search_term = self.validated_data.get('search_term')
         all_categories = self.validated_data.get('all_categories')
+        facets = self.validated_data.get('facets')
+
+        self.search_tier = self.TIER_NONE
 
         if search_term and not search_term == 'None':
-            query = {
-                "match": {
-                    "text": {
-                        "query": search_term,
-                        "fuzziness": "AUTO"
-                    }
-                }
-            }
+            query = self.build_search_term_query(search_term, tier)
             sqs = sqs.custom_query(query)
+            self.search_tier = tier
 
         if country:
             sqs = sqs.filter(country=country)
@@ -94,10 +235,69 @@ class SearchSerializer(serializers.Serializer):
             if radius:
                 sqs = sqs.dwithin('location', location, D(km=radius))
 
+        # counted by the same query, see
+        # ConfigurableElasticBackend.facets_to_aggregations
+        for facet in facets or ():
+            sqs = sqs.facet(facet, size=settings.SEARCH_FACET_SIZE)
+
         return sqs
 
-    def load_search_results(self, sqs, limit=20):
-        return self.perform_search(sqs).load_all()[:limit]
+    def load_search_results(self, sqs, limit=20, queryset=None):
+        """
+        Search terms are matched exactly (phrase or all terms) first, which is
+        cheap for ElasticSearch. Only if that finds fewer than
+        SEARCH_FUZZY_MIN_HITS results do we fall back to the far more
+        expensive fuzzy match, so misspelled terms are still found.
+
+        SEARCH_OVERFETCH more results than ``limit`` are fetched, so that
+        there are still ``limit`` if some of the organisations have been
+        deleted since they were indexed.
+        """
+        fetch = limit + settings.SEARCH_OVERFETCH
+        results_sqs = self.perform_search(sqs)
+        results = results_sqs[:fetch]
+
+        if self.needs_fuzzy_search(results_sqs.query.get_count()):
+            results_sqs = self.perform_search(sqs, tier=self.TIER_FUZZY)
+            results = results_sqs[:fetch]
+
+        if self.validated_data.get('facets'):
+            self.facet_counts = results_sqs.facet_counts()
+
+        organisations = self.load_organisations(results, queryset)[:limit]
+        self.hit_count = results_sqs.query.get_count()
+        return organisations
+
+    def needs_fuzzy_search(self, hits):
+        return self.search_tier == self.TIER_EXACT and \
+            hits < settings.SEARCH_FUZZY_MIN_HITS
+
+    @staticmethod
+    def load_organisations(results, queryset=None):
+        """
+        Load the organisations for the search results with a single query
+        (plus prefetches), dropping any that were deleted since they were
+        indexed. Their documents are queued for removal from the index.
+        """
+        if queryset is None:
+            queryset = Organisation.objects.prefetch_related('keywords')
+
+        organisations = queryset.in_bulk([result.pk for result in results])
+
+        loaded_results = []
+        stale_pks = []
+        for result in results:
+            organisation = organisations.get(int(result.pk))
+            if organisation is not None:
+                result.object = organisation
+                loaded_results.append(result)
+            else:
+                stale_pks.append(int(result.pk))
+
+        if stale_pks:
+            signal_processor.remove_stale(Organisation, stale_pks)
+
+        return loaded_results
 
     def format_results(self, sqs):
         organisation_distance_tuples = []
@@ -115,7 +315,7 @@ class SearchSerializer(serializers.Serializer):
             logging.warn(
                 'The ElasticSearch index is likely out of sync with'
                 ' the database.'
-                ' You should run the `rebuild_index` management command.'
+                ' You should run the `verify_index` management command.'
             )
 
         for organisation, distance in organisation_distance_tuples:
@@ -128,7 +328,100 @@ class SearchSerializer(serializers.Serializer):
         return []
 
 
-class OrganisationSummarySerializer(serializers.ModelSerializer):
+class MultiSearchSerializer(serializers.Serializer):
+    searches = serializers.ListField(child=serializers.DictField())
+
+    def validate_searches(self, value):
+        if not value:
+            raise serializers.ValidationError(
+                u'At least one search is required.'
+            )
+        if len(value) > settings.MULTI_SEARCH_MAX_SEARCHES:
+            raise serializers.ValidationError(
+                u'At most {0} searches may be run at once.'.format(
+                    settings.MULTI_SEARCH_MAX_SEARCHES
+                )
+            )
+
+        searches = [SearchSerializer(data=params) for params in value]
+        errors = [
+            {} if search.is_valid() else search.errors for search in searches
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return searches
+
+    def load_search_results(self, sqs, limit=20, queryset=None):
+        """
+        Run every search in a single _msearch request, plus one more for
+        those that fall back to the fuzzy match (see
+        SearchSerializer.load_search_results), then load the organisations
+        for all of them with a single query. As there, SEARCH_OVERFETCH
+        extra results are fetched for each search.
+
+        Returns the organisations found by each search, in order.
+        """
+        searches = self.validated_data['searches']
+        backend = sqs.query.backend
+        fetch = limit + settings.SEARCH_OVERFETCH
+
+        results = backend.multi_search([
+            search.perform_search(sqs).search_params(0, fetch)
+            for search in searches
+        ])
+
+        fuzzy = [
+            i for i, search in enumerate(searches)
+            if search.needs_fuzzy_search(results[i]['hits'])
+        ]
+        if fuzzy:
+            fuzzy_results = backend.multi_search([
+                searches[i].perform_search(
+                    sqs, tier=SearchSerializer.TIER_FUZZY
+                ).search_params(0, fetch)
+                for i in fuzzy
+            ])
+            for i, fuzzy_result in zip(fuzzy, fuzzy_results):
+                results[i] = fuzzy_result
+
+        for search, r in zip(searches, results):
+            search.hit_count = r['hits']
+            if search.validated_data.get('facets'):
+                search.facet_counts = sqs.query.post_process_facets(r)
+
+        loaded = set(
+            id(result) for result in SearchSerializer.load_organisations(
+                [result for r in results for result in r['results']],
+                queryset
+            )
+        )
+
+        results_by_search = []
+        seen = set()
+        for r in results:
+            search_results = []
+            for result in r['results']:
+                if len(search_results) == limit:
+                    break
+                if id(result) not in loaded:
+                    continue
+                # searches can find the same organisation, at different
+                # distances (or none): each gets its own copy, taken before
+                # any search sets its distance
+                if result.pk in seen:
+                    result.object = copy.copy(result.object)
+                seen.add(result.pk)
+                search_results.append(result)
+            results_by_search.append(search_results)
+
+        return [
+            search.format_results(found)
+            for search, found in zip(searches, results_by_search)
+        ]
+
+
+class OrganisationSummarySerializer(SparseFieldsetMixin,
+                                    serializers.ModelSerializer):
     distance = serializers.CharField()
 
     class Meta:
@@ -136,44 +429,82 @@ class OrganisationSummarySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'address', 'keywords', 'distance')
 
     # Note: Strictly speaking nothing above this comment is required for the
-    # serializer to work, however it helps Swagger to work out what the
-    # response will look like
+    # serializer to work, however it helps Swagger (and sparse fieldsets) to
+    # work out what the response will look like
+
+    field_requirements = {
+        'keywords': ((), (), ('keywords',)),
+        # set from the search results
+        'distance': ((), (), ()),
+    }
 
     def to_representation(self, instance):
         d = OrderedDict()
 
-        d['id'] = instance.id
-        d['name'] = instance.name
-        d['address'] = instance.address
-        d['keywords'] = [keyword.name for keyword in instance.keywords.all()]
-        d['distance'] = instance.distance if hasattr(instance, 'distance')\
-            else None
+        for name in self.fields:
+            if name == 'keywords':
+                d['keywords'] = [
+                    keyword.name for keyword in instance.keywords.all()
+                ]
+            elif name == 'distance':
+                d['distance'] = getattr(instance, 'distance', None)
+            else:
+                d[name] = getattr(instance, name)
 
         return d
 
 
-class OrganisationSerializer(serializers.ModelSerializer):
+class OrganisationSerializer(SparseFieldsetMixin,
+                             serializers.ModelSerializer):
     distance = serializers.SerializerMethodField(read_only=True)
 
+    # Explicitly defined rather than using the depth attr, which Swagger does
+    # not deal well with
+    # https://github.com/marcgibbons/django-rest-swagger/issues/398
+    country = CountrySerializer(read_only=True)
+    categories = CategorySerializer(many=True, read_only=True)
+    keywords = KeywordSerializer(many=True, read_only=True)
+
     class Meta:
-        # Swagger does not deal well with NestedSerializer (ie: depth attr)
-        # https://github.com/marcgibbons/django-rest-swagger/issues/398
-        # Explicitly defining the descendant serializers would solve it
         model = Organisation
-        depth = 1
+        exclude = ('created_at', 'updated_at')
+
+    field_requirements = {
+        'country': (('country',), ('country',), ()),
+        'categories': ((), (), ('categories',)),
+        # the nested keywords list their categories' ids
+        'keywords': ((), (), ('keywords__categories',)),
+        'distance': (('location',), (), ()),
+    }
+
+    def get_origin(self):
+        """
+        The (longitude, latitude) given in the request's location parameter,
+        or None. It is parsed once, and shared by every organisation when
+        serializing a list of them.
+        """
+        root = self.root
+        if not hasattr(root, '_origin'):
+            root._origin = None
+            location = self.context['request'].GET.get('location')
+            location = location.split(',') if location else None
+            if location:
+                try:
+                    root._origin = (
+                        float(str(location[1])), float(str(location[0]))
+                    )
+                except (ValueError, TypeError, IndexError):
+                    pass
+        return root._origin
 
     def get_distance(self, instance):
-        location = self.context['request'].GET.get('location')
-        location = location.split(',') if location else None
+        origin = self.get_origin()
 
-        if location and instance.location:
+        if origin and instance.location:
             try:
-                lat = float(str(location[0]))
-                lng = float(str(location[1]))
-
                 return '{0:.2f}km'.format(
                     geo_distance(
-                        (lng, lat),
+                        origin,
                         (instance.location.get_x(), instance.location.get_y())
                     ).km
                 )
@@ -182,6 +513,18 @@ class OrganisationSerializer(serializers.ModelSerializer):
         return
 
 
+class OrganisationSyncSerializer(OrganisationSerializer):
+    class Meta(OrganisationSerializer.Meta):
+        exclude = ('created_at', 'distance')
+
+
+class SyncResponseSerializer(serializers.Serializer):
+    organisations = OrganisationSyncSerializer(many=True)
+    deleted = serializers.ListField(child=serializers.IntegerField())
+    next = serializers.CharField()
+    more = serializers.BooleanField()
+
+
 class OrganisationIncorrectInformationReportSerializer(
         serializers.ModelSerializer):
     class Meta:
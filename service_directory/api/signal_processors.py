@@ -1,41 +1,243 @@
+import atexit
+import threading
+import time
 from collections import OrderedDict
+from contextlib import contextmanager
 
+from django.apps import apps
+from django.conf import settings
+from django.db import connections as db_connections
+from haystack.exceptions import NotHandled
 from haystack.signals import RealtimeSignalProcessor
+from service_directory.api import metrics
+from service_directory.api.background import dispatcher
+
+
+# Models denormalised into the organisation documents, with the lookup from
+# Organisation to them. Saving one reindexes the organisations that use it.
+# (They can't be deleted while organisations use them.)
+#
+# Models are given by label, as this module is imported (by haystack) before
+# the models are loaded.
+INDEX_DEPENDENCIES = OrderedDict([
+    ('api.keyword', 'keywords'),  # names, in keywords and the text
+    ('api.category', 'categories'),  # names, in the text
+    ('api.country', 'country'),  # ISO codes
+])
+
+
+# Models through which organisations are related to others, with the field
+# holding the organisation. Saving or deleting one reindexes that
+# organisation.
+ORGANISATION_RELATIONS = OrderedDict([
+    ('api.organisationcategory', 'organisation_id'),
+    ('api.organisationkeyword', 'organisation_id'),
+])
+
+
+def model_label(model):
+    return '{0}.{1}'.format(model._meta.app_label, model._meta.model_name)
+
+
+def get_organisation_model():
+    return apps.get_model('api', 'Organisation')
+
+
+def chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class PendingChanges(threading.local):
+    """
+    The changes not yet sent to the search backend, kept per thread so that
+    each request (with threaded workers) only flushes its own.
+    """
+    def __init__(self):
+        # (model, pk): True to index the instance, False to remove it
+        self.changes = OrderedDict()
+        self.since = None
+        self.batch_depth = 0
+        self.in_request = False
 
 
 # Ref: http://stackoverflow.com/a/31642337
 class BatchingSignalProcessor(RealtimeSignalProcessor):
     """
     RealtimeSignalProcessor connects to Django model signals.
-    We store them locally for processing later - must call
-    ``flush_changes`` from somewhere else (eg: middleware).
+    We store them locally for processing later - ``flush_changes`` is called
+    from the middleware at the end of each request, within a ``batch`` and
+    at exit. Outside requests and transactions, changes are also flushed
+    once there are SEARCH_INDEX_AUTOFLUSH_SIZE of them, or (on the next
+    change) once the oldest is SEARCH_INDEX_AUTOFLUSH_SECONDS old.
+
+    Only the model and primary key of each change is kept; instances are
+    indexed as they are in the database when flushed.
     """
 
     # Haystack instantiates this as a singleton
 
-    _change_list = OrderedDict()
+    def __init__(self, *args, **kwargs):
+        self._pending = PendingChanges()
+        # (model, pk) of the stale documents queued for removal
+        self._stale = set()
+        self._stale_lock = threading.Lock()
+        super(BatchingSignalProcessor, self).__init__(*args, **kwargs)
+        atexit.register(self.flush_changes)
+
+    def _add_change(self, model, pk, index=True):
+        # moved to the end, so that it's flushed after anything queued since
+        changes = self._pending.changes
+        changes.pop((model, pk), None)
+        changes[(model, pk)] = index
+        if self._pending.since is None:
+            self._pending.since = time.time()
+
+    def _add_dependents(self, sender, instance):
+        organisation_model = get_organisation_model()
+        lookup = INDEX_DEPENDENCIES[model_label(sender)]
+        for pk in organisation_model.objects.filter(
+            **{lookup: instance.pk}
+        ).values_list('pk', flat=True):
+            self._add_change(organisation_model, pk)
+
+    def _is_indexed(self, model):
+        for using in self.connection_router.for_write(model=model):
+            unified_index = self.connections[using].get_unified_index()
+            if model in unified_index.get_indexed_models():
+                return True
+        return False
 
-    def _add_change(self, method, sender, instance):
-        key = (sender, instance.pk)
-        if key in self._change_list:
-            del self._change_list[key]
-        self._change_list[key] = (method, instance)
+    def _can_auto_flush(self):
+        # not during a request (it's flushed at the end), nor in a
+        # transaction: the changes may yet be rolled back, or be incomplete
+        # (eg: an organisation saved before its categories and keywords)
+        return not self._pending.in_request and not any(
+            connection.in_atomic_block for connection in db_connections.all()
+        )
+
+    def _auto_flush(self):
+        pending = self._pending
+        if not pending.changes or not self._can_auto_flush():
+            return
+
+        if len(pending.changes) >= settings.SEARCH_INDEX_AUTOFLUSH_SIZE or \
+                time.time() - pending.since >= \
+                settings.SEARCH_INDEX_AUTOFLUSH_SECONDS:
+            metrics.increment('index_autoflushes')
+            self.flush_changes()
 
     def handle_save(self, sender, instance, created, raw, **kwargs):
-        method = super(BatchingSignalProcessor, self).handle_save
-        self._add_change(method, sender, instance)
+        label = model_label(sender)
+
+        if label in INDEX_DEPENDENCIES:
+            # nothing can use a new instance yet
+            if not created and not raw:
+                self._add_dependents(sender, instance)
+        elif label in ORGANISATION_RELATIONS:
+            # an organisation is indexed once, however many of its related
+            # rows are saved along with it
+            self._add_change(
+                get_organisation_model(),
+                getattr(instance, ORGANISATION_RELATIONS[label])
+            )
+        elif self._is_indexed(sender):
+            self._add_change(sender, instance.pk)
+
+        self._auto_flush()
 
     def handle_delete(self, sender, instance, **kwargs):
-        method = super(BatchingSignalProcessor, self).handle_delete
-        self._add_change(method, sender, instance)
+        label = model_label(sender)
+
+        if label in ORGANISATION_RELATIONS:
+            self._add_change(
+                get_organisation_model(),
+                getattr(instance, ORGANISATION_RELATIONS[label])
+            )
+        elif self._is_indexed(sender):
+            self._add_change(sender, instance.pk, index=False)
+
+        self._auto_flush()
+
+    def start_request(self):
+        self._pending.in_request = True
+
+    def finish_request(self):
+        self._pending.in_request = False
+        self.flush_changes()
+
+    @contextmanager
+    def batch(self):
+        """
+        For batch jobs (eg: management commands): the changes made within
+        the block are indexed by the end of it.
+        """
+        self._pending.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._pending.batch_depth -= 1
+            if not self._pending.batch_depth:
+                self.flush_changes()
 
     def flush_changes(self):
-        while True:
+        pending = self._pending
+        changes = pending.changes
+        pending.changes = OrderedDict()
+        pending.since = None
+
+        by_model = OrderedDict()
+        for (model, pk), index in changes.items():
+            by_model.setdefault(model, []).append((pk, index))
+
+        for model, model_changes in by_model.items():
+            self.flush_model(model, model_changes)
+
+    def flush_model(self, model, changes):
+        """
+        Index or remove the instances of ``model`` given as (pk, index)
+        pairs, as they are now in the database: one bulk request for each
+        SEARCH_REINDEX_BATCH_SIZE of them. Those since deleted are removed.
+        """
+        for using in self.connection_router.for_write(model=model):
             try:
-                (sender, pk), (method, instance) = self._change_list.popitem(
-                    last=False
+                index = self.connections[using].get_unified_index().get_index(
+                    model
                 )
-            except KeyError:
-                break
-            else:
-                method(sender, instance)
+            except NotHandled:
+                continue
+            backend = self.connections[using].get_backend()
+
+            for chunk in chunks(changes, settings.SEARCH_REINDEX_BATCH_SIZE):
+                index_pks = [pk for pk, index_it in chunk if index_it]
+                objs = list(index.index_queryset(using=using).filter(
+                    pk__in=index_pks
+                )) if index_pks else []
+                indexed_pks = set(obj.pk for obj in objs)
+
+                backend.bulk_update(index, objs, remove_ids=[
+                    '{0}.{1}'.format(model_label(model), pk)
+                    for pk, index_it in chunk if pk not in indexed_pks
+                ])
+
+    def remove_stale(self, model, pks):
+        """
+        Queue the documents of instances that are no longer in the database
+        (eg: found by a search) for removal in the background. They are
+        reindexed instead if they do exist (eg: a read replica was behind).
+        """
+        with self._stale_lock:
+            pks = [pk for pk in pks if (model, pk) not in self._stale]
+            self._stale.update((model, pk) for pk in pks)
+        if not pks:
+            return
+
+        metrics.increment('index_stale_documents', len(pks))
+        dispatcher.dispatch(self._remove_stale, model, pks)
+
+    def _remove_stale(self, model, pks):
+        try:
+            self.flush_model(model, [(pk, True) for pk in pks])
+        finally:
+            with self._stale_lock:
+                self._stale.difference_update((model, pk) for pk in pks)
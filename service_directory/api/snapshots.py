@@ -0,0 +1,356 @@
+"""
+Pre-built directory snapshots: per country, a gzipped JSON file and a SQLite
+bundle (with an R-tree index on location) of every organisation, written to
+SNAPSHOT_ROOT for static file serving, with a manifest listing them.
+
+Snapshot files are named after a hash of their content, so they can be
+cached forever; only the manifest changes from one build to the next.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from service_directory.api.models import Country, Organisation, \
+    OrganisationTombstone
+from service_directory.api.serializers import OrganisationSyncSerializer
+from service_directory.api.sync import SyncToken, settled_before, \
+    to_microseconds
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def iter_organisations(country, chunk_size=500):
+    """
+    Yield the country's organisations in chunks of ``chunk_size``, paging by
+    primary key so that each chunk is a cheap index range scan.
+    """
+    queryset = Organisation.objects.filter(
+        country=country
+    ).select_related(
+        'country'
+    ).prefetch_related(
+        'categories', 'keywords__categories'
+    ).order_by('pk')
+
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def current_sync_token():
+    """
+    A sync token from which a client holding a snapshot picks up every later
+    change (and possibly some it already has).
+
+    Its position is derived from the data, and its sync time is the start of
+    the day, so that rebuilding unchanged data (on the same day) gives
+    identical snapshots.
+    """
+    def position(timestamp):
+        return to_microseconds(settled_before(timestamp)) if timestamp else 0
+
+    synced_at = settled_before(timezone.now()).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    updated_at = Organisation.objects.aggregate(
+        Max('updated_at')
+    )['updated_at__max']
+    deleted_at = OrganisationTombstone.objects.aggregate(
+        Max('deleted_at')
+    )['deleted_at__max']
+
+    return SyncToken(
+        position(updated_at), 0, position(deleted_at), 0,
+        to_microseconds(synced_at)
+    ).encode()
+
+
+def file_details(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(65536), b''):
+            sha256.update(block)
+    return sha256.hexdigest(), os.path.getsize(path)
+
+
+def publish(temp_path, root, prefix, extension):
+    """
+    Atomically move a finished file into ``root``, named after its hash.
+    """
+    sha256, size = file_details(temp_path)
+    name = '{0}-{1}{2}'.format(prefix, sha256[:16], extension)
+    os.chmod(temp_path, 0o644)
+    os.rename(temp_path, os.path.join(root, name))
+    return OrderedDict([('file', name), ('sha256', sha256), ('size', size)])
+
+
+class JSONSnapshotWriter(object):
+    extension = '.json.gz'
+
+    def __init__(self, path, country, sync_token):
+        self.raw = open(path, 'wb')
+        # mtime is fixed so that unchanged content has an unchanged hash
+        self.fileobj = gzip.GzipFile(
+            filename='', mode='wb', fileobj=self.raw, mtime=0
+        )
+        self.count = 0
+
+        header = json.dumps(OrderedDict([
+            ('country', country.iso_code),
+            ('sync_token', sync_token),
+        ]))
+        # leave the object open to stream the organisations into it
+        self.fileobj.write(header[:-1] + ', "organisations": [')
+
+    def write(self, organisations):
+        data = OrganisationSyncSerializer(organisations, many=True).data
+        for organisation in data:
+            if self.count:
+                self.fileobj.write(',')
+            self.fileobj.write(json.dumps(organisation, cls=JSONEncoder))
+            self.count += 1
+
+    def close(self):
+        self.fileobj.write(']}')
+        self.fileobj.close()
+        self.raw.close()
+
+
+class SQLiteSnapshotWriter(object):
+    extension = '.sqlite'
+
+    SCHEMA = (
+        'CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE organisations ('
+        'id INTEGER PRIMARY KEY, name TEXT, about TEXT, address TEXT, '
+        'telephone TEXT, emergency_telephone TEXT, email TEXT, web TEXT, '
+        'verified_as TEXT, age_range_min INTEGER, age_range_max INTEGER, '
+        'opening_hours TEXT, facility_code TEXT, latitude REAL, '
+        'longitude REAL, updated_at TEXT)',
+        'CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT)',
+        'CREATE TABLE keywords (id INTEGER PRIMARY KEY, name TEXT)',
+        'CREATE TABLE organisation_categories ('
+        'organisation_id INTEGER, category_id INTEGER, '
+        'PRIMARY KEY (organisation_id, category_id))',
+        'CREATE TABLE organisation_keywords ('
+        'organisation_id INTEGER, keyword_id INTEGER, '
+        'PRIMARY KEY (organisation_id, keyword_id))',
+        'CREATE INDEX organisation_categories_category '
+        'ON organisation_categories (category_id)',
+        'CREATE INDEX organisation_keywords_keyword '
+        'ON organisation_keywords (keyword_id)',
+        # the organisations are points, so min == max for both axes
+        'CREATE VIRTUAL TABLE organisation_locations USING rtree('
+        'id, min_latitude, max_latitude, min_longitude, max_longitude)',
+    )
+
+    FIELDS = ('id', 'name', 'about', 'address', 'telephone',
+              'emergency_telephone', 'email', 'web', 'verified_as',
+              'age_range_min', 'age_range_max', 'opening_hours',
+              'facility_code')
+
+    def __init__(self, path, country, sync_token):
+        self.connection = sqlite3.connect(path)
+        self.count = 0
+        self.categories = {}
+        self.keywords = {}
+
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+        self.connection.executemany(
+            'INSERT INTO metadata VALUES (?, ?)', (
+                ('country', country.iso_code),
+                ('sync_token', sync_token),
+            )
+        )
+
+    def write(self, organisations):
+        rows, locations, categories, keywords = [], [], [], []
+
+        for organisation in organisations:
+            location = organisation.location
+            latitude = location.y if location else None
+            longitude = location.x if location else None
+
+            rows.append(
+                [getattr(organisation, field) for field in self.FIELDS] +
+                [latitude, longitude, organisation.updated_at.isoformat()]
+            )
+            if location:
+                locations.append(
+                    (organisation.pk, latitude, latitude, longitude, longitude)
+                )
+
+            for category in organisation.categories.all():
+                self.categories[category.pk] = category.name
+                categories.append((organisation.pk, category.pk))
+            for keyword in organisation.keywords.all():
+                self.keywords[keyword.pk] = keyword.name
+                keywords.append((organisation.pk, keyword.pk))
+
+        self.connection.executemany(
+            'INSERT INTO organisations VALUES ({0})'.format(
+                ', '.join('?' * (len(self.FIELDS) + 3))
+            ),
+            rows
+        )
+        self.connection.executemany(
+            'INSERT INTO organisation_locations VALUES (?, ?, ?, ?, ?)',
+            locations
+        )
+        self.connection.executemany(
+            'INSERT INTO organisation_categories VALUES (?, ?)', categories
+        )
+        self.connection.executemany(
+            'INSERT INTO organisation_keywords VALUES (?, ?)', keywords
+        )
+        self.count += len(rows)
+
+    def close(self):
+        self.connection.executemany(
+            'INSERT INTO categories VALUES (?, ?)',
+            sorted(self.categories.items())
+        )
+        self.connection.executemany(
+            'INSERT INTO keywords VALUES (?, ?)',
+            sorted(self.keywords.items())
+        )
+        self.connection.commit()
+        self.connection.execute('VACUUM')
+        self.connection.close()
+
+
+WRITERS = OrderedDict([
+    ('json', JSONSnapshotWriter),
+    ('sqlite', SQLiteSnapshotWriter),
+])
+
+
+def build_country_snapshots(country, root, sync_token, chunk_size=500):
+    """
+    Write every snapshot format for ``country`` into ``root``, and return
+    their manifest entry.
+    """
+    writers = OrderedDict()
+    for name, writer_class in WRITERS.items():
+        fd, temp_path = tempfile.mkstemp(
+            dir=root, prefix='.{0}-'.format(country.iso_code),
+            suffix=writer_class.extension
+        )
+        os.close(fd)
+        # SQLite wants to create the database itself
+        os.remove(temp_path)
+        writers[name] = (temp_path, writer_class(
+            temp_path, country, sync_token
+        ))
+
+    try:
+        for organisations in iter_organisations(country, chunk_size):
+            for temp_path, writer in writers.values():
+                writer.write(organisations)
+
+        entry = OrderedDict([('name', country.name)])
+        for name, (temp_path, writer) in writers.items():
+            writer.close()
+            entry[name] = publish(
+                temp_path, root, country.iso_code, writer.extension
+            )
+            entry[name]['organisations'] = writer.count
+        entry['sync_token'] = sync_token
+        return entry
+    finally:
+        for temp_path, writer in writers.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def read_manifest(root=None):
+    path = os.path.join(root or settings.SNAPSHOT_ROOT, MANIFEST_NAME)
+    try:
+        with open(path) as fp:
+            return json.load(fp, object_pairs_hook=OrderedDict)
+    except (IOError, ValueError):
+        return None
+
+
+def write_manifest(root, manifest):
+    fd, temp_path = tempfile.mkstemp(dir=root, prefix='.manifest-')
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+    os.chmod(temp_path, 0o644)
+    os.rename(temp_path, os.path.join(root, MANIFEST_NAME))
+
+
+def manifest_files(manifest):
+    if not manifest:
+        return set()
+    return set(
+        entry[name]['file']
+        for entry in manifest['countries'].values()
+        for name in WRITERS
+        if name in entry
+    )
+
+
+def build_snapshots(countries, root=None, chunk_size=500):
+    """
+    Build snapshots of the given countries and publish a new manifest.
+
+    Files from the previous manifest are kept, so that clients part way
+    through a download can finish it; anything older is removed.
+    """
+    root = root or settings.SNAPSHOT_ROOT
+    if not os.path.isdir(root):
+        os.makedirs(root)
+
+    now = timezone.now()
+    version = now.strftime('%Y%m%d%H%M%S%f')
+    sync_token = current_sync_token()
+
+    # countries that aren't being rebuilt keep their existing snapshots,
+    # unless they have since been deleted
+    previous = read_manifest(root)
+    existing = set(
+        iso_code.upper() for iso_code in
+        Country.objects.values_list('iso_code', flat=True)
+    )
+    manifest = OrderedDict([
+        ('version', version),
+        ('generated_at', now.isoformat()),
+        ('countries', OrderedDict(
+            (iso_code, entry) for iso_code, entry in
+            (previous or {}).get('countries', {}).items()
+            if iso_code.upper() in existing
+        )),
+    ])
+
+    for country in countries:
+        manifest['countries'][country.iso_code] = build_country_snapshots(
+            country, root, sync_token, chunk_size
+        )
+
+    write_manifest(root, manifest)
+
+    keep = manifest_files(manifest) | manifest_files(previous)
+    extensions = tuple(writer.extension for writer in WRITERS.values())
+    for name in os.listdir(root):
+        if (
+            name.endswith(extensions) and not name.startswith('.') and
+            name not in keep
+        ):
+            os.remove(os.path.join(root, name))
+
+    return manifest
@@ -0,0 +1,268 @@
+"""
+Delta sync: lets clients fetch only the organisations that have changed (or
+been deleted) since their last sync.
+
+Changes are paged through in (updated_at, id) order, and deletions in
+(deleted_at, id) order, using keyset pagination. The position in both is
+handed to the client as an opaque token.
+
+Deletions are only kept for SYNC_TOMBSTONE_RETENTION_DAYS (see
+``prune_tombstones``), so tokens from a sync longer ago than that expire and
+those clients must sync again from the start.
+"""
+import base64
+import calendar
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from service_directory.api.models import Country, Category, Keyword, \
+    KeywordCategory, Organisation, OrganisationCategory, \
+    OrganisationKeyword, OrganisationTombstone
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_microseconds(value):
+    return (
+        calendar.timegm(value.utctimetuple()) * 1000000 + value.microsecond
+    )
+
+
+def from_microseconds(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class SyncToken(namedtuple('SyncToken', ('updated_at', 'organisation_id',
+                                         'deleted_at', 'tombstone_id',
+                                         'synced_at'))):
+    """
+    The last organisation change and deletion a client has seen, and the
+    time up to which it has seen every deletion (ie: when it synced). The
+    timestamps are microseconds since the epoch.
+    """
+    @classmethod
+    def initial(cls):
+        return cls(0, 0, 0, 0, 0)
+
+    @classmethod
+    def decode(cls, token):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(token)))
+            return cls(*[int(value) for value in values])
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise InvalidSyncToken('Invalid sync token.')
+
+    def encode(self):
+        return base64.urlsafe_b64encode(json.dumps(list(self)))
+
+    def is_expired(self, now=None):
+        """
+        Whether deletions the client hasn't seen may have been pruned: it
+        last synced before the retention period began.
+        """
+        if self == self.initial():
+            return False
+        cutoff = (now or timezone.now()) - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS
+        )
+        return self.synced_at < to_microseconds(cutoff)
+
+
+def after(queryset, timestamp_field, timestamp, pk):
+    """
+    Rows that come after (timestamp, pk) in (timestamp_field, id) order.
+    """
+    timestamp = from_microseconds(timestamp)
+    return queryset.filter(
+        Q(**{timestamp_field + '__gt': timestamp}) |
+        Q(**{timestamp_field: timestamp, 'id__gt': pk})
+    ).order_by(timestamp_field, 'id')
+
+
+class SyncPage(object):
+    def __init__(self, organisations, tombstones, token, more):
+        self.organisations = organisations
+        self.tombstones = tombstones
+        self.token = token
+        self.more = more
+
+
+def oldest_open_write():
+    """
+    When the oldest transaction still open (other than this one) that has
+    written to the primary database started, or None.
+    """
+    connection = connections[router.db_for_write(Organisation)]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        # (backend_xid is only assigned once a transaction writes)
+        cursor.execute(
+            'SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE datname = current_database() '
+            'AND pid <> pg_backend_pid() AND backend_xid IS NOT NULL'
+        )
+        return cursor.fetchone()[0]
+
+
+def settled_before(timestamp):
+    """
+    The latest time up to which every change has been committed (as far as
+    we can tell), at or before ``timestamp``.
+
+    Rows are timestamped when they're saved rather than when their
+    transaction commits, so those written by a transaction still open (eg: a
+    long admin import) can commit after rows with later timestamps. Nothing
+    from after the start of the oldest such transaction is settled. The
+    settle margin (SYNC_SETTLE_SECONDS) allows for short transactions that
+    commit meanwhile and for clock differences between the app servers and
+    the database.
+    """
+    settle = timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    oldest = oldest_open_write()
+    if oldest is not None:
+        timestamp = min(timestamp, oldest)
+    return timestamp - settle
+
+
+def sync_page(token, page_size=None):
+    """
+    Return the next page of changes after ``token``.
+
+    Rows changed since they settled (see ``settled_before``) are held back
+    until a later sync, so that a change committed after a later one (but
+    with an earlier timestamp) isn't skipped.
+    """
+    page_size = page_size or settings.SYNC_PAGE_SIZE
+    settled_at = settled_before(timezone.now())
+
+    organisations = list(
+        after(
+            Organisation.objects.filter(updated_at__lte=settled_at),
+            'updated_at', token.updated_at, token.organisation_id
+        ).select_related(
+            'country'
+        ).prefetch_related(
+            'categories', 'keywords__categories'
+        )[:page_size + 1]
+    )
+
+    tombstones = list(
+        after(
+            OrganisationTombstone.objects.filter(deleted_at__lte=settled_at),
+            'deleted_at', token.deleted_at, token.tombstone_id
+        )[:page_size + 1]
+    )
+
+    more_tombstones = len(tombstones) > page_size
+    more = len(organisations) > page_size or more_tombstones
+    organisations = organisations[:page_size]
+    tombstones = tombstones[:page_size]
+
+    if organisations:
+        token = token._replace(
+            updated_at=to_microseconds(organisations[-1].updated_at),
+            organisation_id=organisations[-1].pk
+        )
+    if tombstones:
+        token = token._replace(
+            deleted_at=to_microseconds(tombstones[-1].deleted_at),
+            tombstone_id=tombstones[-1].pk
+        )
+    # every deletion up to when the changes settled has now been seen,
+    # unless there are more to page through
+    token = token._replace(synced_at=to_microseconds(
+        tombstones[-1].deleted_at if more_tombstones else settled_at
+    ))
+
+    return SyncPage(organisations, tombstones, token, more)
+
+
+def touch_organisations(queryset):
+    queryset.update(updated_at=timezone.now())
+
+
+def prune_tombstones(now=None):
+    """
+    Delete the tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS. Returns
+    the number deleted.
+    """
+    queryset = OrganisationTombstone.objects.filter(
+        deleted_at__lt=(now or timezone.now()) - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS
+        )
+    )
+    count = queryset.count()
+    queryset._raw_delete(using=router.db_for_write(OrganisationTombstone))
+    return count
+
+
+def organisation_relation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_organisations(
+            Organisation.objects.filter(pk=instance.organisation_id)
+        )
+
+
+def country_saved(sender, instance, created, raw, **kwargs):
+    if not created and not raw:
+        touch_organisations(Organisation.objects.filter(country=instance))
+
+
+def category_saved(sender, instance, created, raw, **kwargs):
+    if not created and not raw:
+        touch_organisations(Organisation.objects.filter(categories=instance))
+
+
+def keyword_saved(sender, instance, created, raw, **kwargs):
+    if not created and not raw:
+        touch_organisations(Organisation.objects.filter(keywords=instance))
+
+
+def keyword_category_changed(sender, instance, raw=False, **kwargs):
+    # the keyword's categories are sent with the organisations using it
+    if not raw:
+        touch_organisations(
+            Organisation.objects.filter(keywords=instance.keyword_id)
+        )
+
+
+def organisation_deleted(sender, instance, **kwargs):
+    OrganisationTombstone.objects.create(organisation_id=instance.pk)
+
+
+def connect_signals():
+    for model in (OrganisationCategory, OrganisationKeyword):
+        post_save.connect(
+            organisation_relation_changed, sender=model,
+            dispatch_uid='sync_save_{0}'.format(model.__name__)
+        )
+        post_delete.connect(
+            organisation_relation_changed, sender=model,
+            dispatch_uid='sync_delete_{0}'.format(model.__name__)
+        )
+
+    post_save.connect(keyword_category_changed, sender=KeywordCategory,
+                      dispatch_uid='sync_save_KeywordCategory')
+    post_delete.connect(keyword_category_changed, sender=KeywordCategory,
+                        dispatch_uid='sync_delete_KeywordCategory')
+    post_save.connect(country_saved, sender=Country,
+                      dispatch_uid='sync_save_Country')
+    post_save.connect(category_saved, sender=Category,
+                      dispatch_uid='sync_save_Category')
+    post_save.connect(keyword_saved, sender=Keyword,
+                      dispatch_uid='sync_save_Keyword')
+    post_delete.connect(organisation_deleted, sender=Organisation,
+                        dispatch_uid='sync_delete_Organisation')
@@ -13,6 +13,7 @@ urlpatterns = [
     url(r'^keywords/$', views.KeywordList.as_view()),
 
     url(r'^search/$', views.Search.as_view()),
+    url(r'^multi_search/$', views.MultiSearch.as_view()),
     url(r'^organisation/(?P<pk>[0-9]+)/$', views.OrganisationDetail.as_view()),
     url(r'^organisation/(?P<pk>[0-9]+)/report/$',
         views.OrganisationReportIncorrectInformation.as_view()),
@@ -20,6 +21,12 @@ urlpatterns = [
         views.OrganisationRate.as_view()),
     url(r'^organisation/sms/$',
         views.OrganisationSendSMS.as_view()),
+    url(r'^organisations/$', views.OrganisationBatch.as_view()),
+
+    url(r'^sync/$', views.Sync.as_view()),
+    url(r'^snapshots/$', views.SnapshotManifest.as_view()),
+
+    url(r'^metrics/$', views.Metrics.as_view()),
 
     url(r'^search_form/$', include('haystack.urls')),
 ]
@@ -1,14 +1,24 @@
 import logging
+import time
+from collections import OrderedDict
+from urlparse import urljoin
 
 from UniversalAnalytics import Tracker
 from django.conf import settings
 from django.db.models.query import Prefetch
-from django.http import Http404
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import quote_etag
 from go_http import HttpApiSender
 from rest_framework import status
 from rest_framework.generics import RetrieveAPIView, ListAPIView
+from rest_framework.permissions import BasePermission, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from service_directory.api import metrics
+from service_directory.api.background import dispatcher
+from service_directory.api.catalogue import keyword_catalogue
+from service_directory.api.coalescing import coalescer, request_key
 from service_directory.api.haystack_elasticsearch_raw_query.\
     custom_elasticsearch import ConfigurableSearchQuerySet
 from service_directory.api.models import Keyword, Category, Organisation
@@ -17,7 +27,14 @@ from service_directory.api.serializers import\
     KeywordSerializer, OrganisationSummarySerializer, \
     OrganisationSerializer, OrganisationIncorrectInformationReportSerializer, \
     OrganisationRatingSerializer, OrganisationSendSMSRequestSerializer, \
-    OrganisationSendSMSResponseSerializer, SearchSerializer
+    OrganisationSendSMSResponseSerializer, SearchSerializer, \
+    MultiSearchSerializer, OrganisationSyncSerializer
+from service_directory.api.responses import PrerenderedResponse, \
+    etag_matches, not_modified_response
+from service_directory.api.search_log import search_log
+from service_directory.api.snapshots import read_manifest, WRITERS
+from service_directory.api.sync import SyncToken, InvalidSyncToken, \
+    sync_page
 
 google_analytics_tracker = Tracker.create(
     settings.GOOGLE_ANALYTICS_TRACKING_ID,
@@ -26,18 +43,67 @@ google_analytics_tracker = Tracker.create(
 
 
 def send_ga_tracking_event(path, category, action, label):
-    try:
-        google_analytics_tracker.send(
-            'event',
-            path=path,
-            ec=category,
-            ea=action,
-            el=label
+    # sent from a background thread, the response doesn't depend on it
+    with metrics.timed('ga_dispatch'):
+        dispatcher.dispatch(
+            _send_ga_tracking_event, path, category, action, label
         )
+
+
+def _send_ga_tracking_event(path, category, action, label):
+    # (outside any request, so counted for the process instead)
+    try:
+        with metrics.counted('ga_send'):
+            google_analytics_tracker.send(
+                'event',
+                path=path,
+                ec=category,
+                ea=action,
+                el=label
+            )
     except:
+        metrics.increment('ga_send_failures')
         logging.warn("Google Analytics call failed", exc_info=True)
 
 
+def serialized_data(serializer):
+    with metrics.timed('serialize'):
+        return serializer.data
+
+
+def format_facet_counts(search_serializer):
+    """
+    The facet counts found by a search, with category ids resolved to their
+    names from the keyword catalogue.
+    """
+    fields = search_serializer.facet_counts.get('fields', {})
+    category_names = None
+
+    facets = OrderedDict()
+    for facet in search_serializer.validated_data['facets']:
+        counts = []
+        for value, count in fields.get(facet, ()):
+            if facet == 'categories':
+                if category_names is None:
+                    category_names = keyword_catalogue.snapshot()\
+                        .category_names_by_id()
+                counts.append(OrderedDict([
+                    ('id', int(value)),
+                    ('name', category_names.get(int(value))),
+                    ('count', count),
+                ]))
+            elif facet == 'keywords':
+                counts.append(OrderedDict([
+                    ('name', value), ('count', count)
+                ]))
+            else:
+                counts.append(OrderedDict([
+                    ('iso_code', value), ('count', count)
+                ]))
+        facets[facet] = counts
+    return facets
+
+
 class HomePageCategoryKeywordGrouping(APIView):
     """
     Retrieve keywords grouped by category for the home page
@@ -69,7 +135,9 @@ class HomePageCategoryKeywordGrouping(APIView):
         serializer = HomePageCategoryKeywordGroupingSerializer(
             home_page_categories_with_keywords, many=True
         )
-        return Response(serializer.data)
+        response = Response(serialized_data(serializer))
+        response.cache_compressed = True
+        return response
 
 
 class KeywordList(ListAPIView):
@@ -85,30 +153,35 @@ class KeywordList(ListAPIView):
     """
     serializer_class = KeywordSerializer
 
-    def get_queryset(self):
-        queryset = Keyword.objects.all()
-
-        category_list = self.request.query_params.getlist('category')
-
-        show_on_home_page = self.request.query_params.get(
-            'show_on_home_page')
-        if show_on_home_page:
-            queryset = queryset.filter(show_on_home_page=True)
-
-        if category_list:
-            queryset = queryset.filter(categories__name__in=category_list)
-
-            if queryset:
-                # although this endpoint accepts a list of categories we only
-                # send a tracking event for the first one as generally only one
-                # will be supplied (and we don't want to block the response
-                # because of a large number of tracking calls)
-                send_ga_tracking_event(
-                    self.request._request.path, 'View', 'KeywordsInCategory',
-                    category_list[0]
-                )
+    def list(self, request, *args, **kwargs):
+        category_list = request.query_params.getlist('category')
+        show_on_home_page = request.query_params.get('show_on_home_page')
+
+        # answered from the in-process keyword catalogue (see
+        # KeywordCatalogue), so neither filtering nor rendering touches the
+        # database once it is loaded
+        keywords, content, etag = keyword_catalogue.snapshot().render(
+            category_list, bool(show_on_home_page)
+        )
 
-        return queryset
+        if category_list and keywords:
+            # although this endpoint accepts a list of categories we only
+            # send a tracking event for the first one as generally only one
+            # will be supplied (and we don't want to block the response
+            # because of a large number of tracking calls)
+            send_ga_tracking_event(
+                request._request.path, 'View', 'KeywordsInCategory',
+                category_list[0]
+            )
+
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+
+        response = PrerenderedResponse(
+            keywords, content, headers={'ETag': quote_etag(etag)}
+        )
+        response.cache_compressed = True
+        return response
 
 
 class Search(APIView):
@@ -156,9 +229,24 @@ class Search(APIView):
               type: boolean
               paramType: query
               default: None
+            - name: fields
+              description: comma separated fields to return (default all)
+              type: string
+              paramType: query
+              default: None
+            - name: facets
+              description:
+               comma separated fields (categories, keywords, country) to
+               count the results by. The results are then returned, with the
+               counts, as {"results": [...], "facets": {...}}
+              type: string
+              paramType: query
+              default: None
         response_serializer: OrganisationSummarySerializer
     """
     def get(self, request):
+        started_at = time.time()
+        fields = OrganisationSummarySerializer.requested_fields(request)
         search_serializer = SearchSerializer(data=request.query_params)
 
         send_ga_tracking_event(
@@ -167,43 +255,302 @@ class Search(APIView):
             request.query_params.get('place_name', '')
         )
 
-        # perform search
+        # perform search (once, for identical concurrent searches)
         if search_serializer.is_valid():
-            sqs = ConfigurableSearchQuerySet().models(Organisation)
-            sqs = search_serializer.load_search_results(sqs)
-            serializer = OrganisationSummarySerializer(
-                search_serializer.format_results(sqs), many=True)
-            return Response(serializer.data)
+            result = coalescer.get(
+                request_key(request),
+                lambda: self.search(search_serializer, fields),
+                'organisations'
+            )
+            response = Response(result['data'])
+            response['X-Search-Tier'] = result['search_tier']
+            metrics.tag('search_tier', result['search_tier'])
+            search_log.record(
+                search_serializer.validated_data,
+                result['hit_count'],
+                time.time() - started_at,
+                result['search_tier']
+            )
+            return response
         return Response(search_serializer.errors)
 
+    def search(self, search_serializer, fields):
+        sqs = ConfigurableSearchQuerySet().models(Organisation)
+        sqs = search_serializer.load_search_results(
+            sqs,
+            queryset=OrganisationSummarySerializer.optimise_queryset(
+                Organisation.objects.all(), fields
+            )
+        )
+        serializer = OrganisationSummarySerializer(
+            search_serializer.format_results(sqs), many=True,
+            fields=fields)
+        data = serialized_data(serializer)
+        if search_serializer.facet_counts is not None:
+            data = OrderedDict([
+                ('results', data),
+                ('facets', format_facet_counts(search_serializer)),
+            ])
+        return {
+            'data': data,
+            'search_tier': search_serializer.search_tier,
+            'hit_count': search_serializer.hit_count,
+        }
+
+
+class MultiSearch(APIView):
+    """
+    Run several searches at once. Each search takes the same parameters as
+    the search endpoint (as JSON), and the organisations found by each are
+    returned in the same order as the searches.
+    ---
+    POST:
+        parameters:
+            - name: fields
+              description: comma separated fields to return (default all)
+              type: string
+              paramType: query
+              default: None
+        request_serializer: MultiSearchSerializer
+    """
+    def post(self, request):
+        started_at = time.time()
+        fields = OrganisationSummarySerializer.requested_fields(request)
+        multi_search_serializer = MultiSearchSerializer(data=request.data)
+        multi_search_serializer.is_valid(raise_exception=True)
+        searches = multi_search_serializer.validated_data['searches']
+
+        # one event for all of the searches, rather than one each
+        send_ga_tracking_event(
+            request._request.path, 'Search', 'MultiSearch',
+            '|'.join(
+                search.validated_data.get('search_term', '')
+                for search in searches
+            )
+        )
+
+        sqs = ConfigurableSearchQuerySet().models(Organisation)
+        result_sets = multi_search_serializer.load_search_results(
+            sqs,
+            queryset=OrganisationSummarySerializer.optimise_queryset(
+                Organisation.objects.all(), fields
+            )
+        )
+
+        data = []
+        for search, organisations in zip(searches, result_sets):
+            serializer = OrganisationSummarySerializer(
+                organisations, many=True, fields=fields)
+            result = OrderedDict([
+                ('search_tier', search.search_tier),
+                ('organisations', serialized_data(serializer)),
+            ])
+            if search.facet_counts is not None:
+                result['facets'] = format_facet_counts(search)
+            data.append(result)
+
+        latency = time.time() - started_at
+        for search in searches:
+            search_log.record(search.validated_data, search.hit_count,
+                              latency, search.search_tier)
+        return Response(data)
+
 
 class OrganisationDetail(RetrieveAPIView):
     """
     Retrieve organisation details
+    ---
+    GET:
+        parameters:
+            - name: location
+              description: latitude,longitude
+              type: string
+              paramType: query
+            - name: fields
+              description: comma separated fields to return (default all)
+              type: string
+              paramType: query
     """
     queryset = Organisation.objects.all()
     serializer_class = OrganisationSerializer
 
-    def get(self, request, *args, **kwargs):
-        response = super(OrganisationDetail, self).get(
-            request, *args, **kwargs
+    sparse_fields = None
+
+    def get_queryset(self):
+        # the name is always loaded for the analytics event
+        return OrganisationSerializer.optimise_queryset(
+            super(OrganisationDetail, self).get_queryset(),
+            self.sparse_fields, extra_columns=('name',)
         )
 
-        if response and response.data:
-            try:
-                organisation_name = response.data['name']
-                send_ga_tracking_event(
-                    request._request.path,
-                    'View',
-                    'Organisation',
-                    organisation_name
-                )
-            except (KeyError, TypeError):
-                logging.warn("Did not find expected data in response to make"
-                             " Google Analytics call", exc_info=True)
+    def retrieve(self, request, *args, **kwargs):
+        self.sparse_fields = OrganisationSerializer.requested_fields(request)
+
+        # loaded once, for identical concurrent requests
+        result = coalescer.get(
+            request_key(request), self.load, 'organisations'
+        )
+        response = Response(result['data'])
+        response.cache_compressed = True
+
+        send_ga_tracking_event(
+            request._request.path,
+            'View',
+            'Organisation',
+            result['name']
+        )
 
         return response
 
+    def load(self):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, fields=self.sparse_fields)
+        return {'data': serialized_data(serializer), 'name': instance.name}
+
+
+class OrganisationBatch(APIView):
+    """
+    Retrieve the details of several organisations at once, in the order
+    given. Ids that don't exist are left out.
+    ---
+    GET:
+        parameters:
+            - name: ids
+              description: comma separated organisation ids
+              type: string
+              paramType: query
+              required: true
+            - name: location
+              description: latitude,longitude
+              type: string
+              paramType: query
+            - name: fields
+              description: comma separated fields to return (default all)
+              type: string
+              paramType: query
+        response_serializer: OrganisationSerializer
+    """
+    def get(self, request):
+        ids = request.query_params.get('ids', '')
+        try:
+            ids = [int(pk) for pk in ids.split(',') if pk.strip()]
+        except ValueError:
+            ids = None
+
+        if not ids:
+            return Response(
+                {'ids': ['A comma separated list of ids is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > settings.ORGANISATION_BATCH_MAX_IDS:
+            return Response(
+                {'ids': ['At most {0} ids may be requested.'.format(
+                    settings.ORGANISATION_BATCH_MAX_IDS
+                )]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fields = OrganisationSerializer.requested_fields(request)
+        organisations = OrganisationSerializer.optimise_queryset(
+            Organisation.objects.all(), fields
+        ).in_bulk(ids)
+        organisations = [
+            organisations[pk]
+            for pk in OrderedDict.fromkeys(ids) if pk in organisations
+        ]
+
+        serializer = OrganisationSerializer(
+            organisations, many=True, fields=fields,
+            context={'request': request}
+        )
+        response = Response(serialized_data(serializer))
+
+        # one event for the whole batch, rather than one per organisation
+        if organisations:
+            send_ga_tracking_event(
+                request._request.path,
+                'View',
+                'Organisations',
+                ','.join(str(organisation.pk)
+                         for organisation in organisations)
+            )
+
+        return response
+
+
+class Sync(APIView):
+    """
+    List the organisations changed, and the ids of those deleted, since the
+    last sync. Start without a token, then pass the returned ``next`` token
+    to get the following page (while ``more`` is true) or, later on, the
+    changes made since.
+    ---
+    GET:
+        parameters:
+            - name: since
+              description: the next token returned by the previous sync
+              type: string
+              paramType: query
+        response_serializer: SyncResponseSerializer
+    """
+    # a replica lagging by more than SYNC_SETTLE_SECONDS would have clients
+    # skip past changes it hasn't received yet
+    read_from_primary = True
+
+    def get(self, request):
+        since = request.query_params.get('since')
+
+        try:
+            token = SyncToken.decode(since) if since else SyncToken.initial()
+        except InvalidSyncToken as e:
+            return Response({'since': [str(e)]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if token.is_expired():
+            return Response(
+                {'since': ['Expired sync token, sync again without one.']},
+                status=status.HTTP_410_GONE
+            )
+
+        page = sync_page(token)
+
+        serializer = OrganisationSyncSerializer(
+            page.organisations, many=True, context={'request': request}
+        )
+        return Response(OrderedDict([
+            ('organisations', serialized_data(serializer)),
+            ('deleted', [
+                tombstone.organisation_id for tombstone in page.tombstones
+            ]),
+            ('next', page.token.encode()),
+            ('more', page.more),
+        ]))
+
+
+class SnapshotManifest(APIView):
+    """
+    List the current directory snapshot files for each country, with their
+    hashes and URLs. Download a snapshot, then use its ``sync_token`` with
+    the sync endpoint to fetch subsequent changes.
+    """
+    def get(self, request):
+        manifest = read_manifest()
+        if manifest is None:
+            raise Http404
+
+        if etag_matches(request, manifest['version']):
+            return not_modified_response(manifest['version'])
+
+        for entry in manifest['countries'].values():
+            for name in WRITERS:
+                if name in entry:
+                    entry[name]['url'] = request.build_absolute_uri(
+                        urljoin(settings.SNAPSHOT_URL, entry[name]['file'])
+                    )
+
+        return Response(
+            manifest, headers={'ETag': quote_etag(manifest['version'])}
+        )
+
 
 class OrganisationReportIncorrectInformation(APIView):
     """
@@ -308,10 +655,11 @@ class OrganisationSendSMS(APIView):
                 )
                 analytics_label = 'save'
 
-            sender.send_text(
-                request_serializer.validated_data['cell_number'],
-                message
-            )
+            with metrics.timed('sms'):
+                sender.send_text(
+                    request_serializer.validated_data['cell_number'],
+                    message
+                )
 
             response_serializer = OrganisationSendSMSResponseSerializer(
                 data={'result': True}
@@ -333,3 +681,37 @@ class OrganisationSendSMS(APIView):
 
         return Response(response_serializer.data,
                         status=status.HTTP_200_OK)
+
+
+class MetricsPermission(BasePermission):
+    """
+    Admin users, or a scraper that sends METRICS_TOKEN (if set) as a bearer
+    token: ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    def has_permission(self, request, view):
+        if IsAdminUser().has_permission(request, view):
+            return True
+
+        token = settings.METRICS_TOKEN
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(token) and constant_time_compare(
+            authorization, 'Bearer {0}'.format(token)
+        )
+
+
+class Metrics(APIView):
+    """
+    Process-wide performance counters in Prometheus text format.
+    Note that each worker process keeps its own counters.
+    """
+    permission_classes = (MetricsPermission,)
+
+    def get(self, request):
+        lines = [
+            'service_directory_{0} {1}'.format(name, value)
+            for name, value in metrics.counters().items()
+        ]
+        return HttpResponse(
+            '\n'.join(lines) + '\n',
+            content_type='text/plain; version=0.0.4'
+        )
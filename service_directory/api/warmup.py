@@ -0,0 +1,146 @@
+"""
+Warms a process up before it serves requests (eg: after a deploy), so that
+the first users don't pay for cold caches: checks that the databases and
+ElasticSearch can be reached, loads the reference data and templates,
+renders the home page and replays the most popular recent searches.
+
+Django's database connections belong to the thread that opens them, so
+those opened here can't be reused by the request threads of a threaded
+worker; they are closed once warm-up is done.
+
+Run by the ``warm_caches`` management command, and by each gunicorn worker
+before it accepts requests (see project/gunicorn.py).
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from django.http import QueryDict
+from django.template.loader import get_template
+from django.utils import timezone
+from haystack import connections as haystack_connections
+from service_directory.api.catalogue import keyword_catalogue
+from service_directory.api.haystack_elasticsearch_raw_query.\
+    custom_elasticsearch import ConfigurableSearchQuerySet
+from service_directory.api.models import Country, Organisation, \
+    SearchQueryHourly
+from service_directory.api.renderers import FastJSONRenderer
+from service_directory.api.serializers import SearchSerializer
+
+
+def popular_searches(limit, days):
+    """
+    The parameters of the ``limit`` most searched for queries over the last
+    ``days`` days (from the search log rollups), most popular first.
+    """
+    queries = SearchQueryHourly.objects.filter(
+        hour__gte=timezone.now() - timedelta(days=days)
+    ).values('query').annotate(
+        total=Sum('searches')
+    ).order_by('-total', 'query').values_list('query', flat=True)[:limit]
+
+    return [QueryDict(query) for query in queries]
+
+
+def fixture_searches(path):
+    """
+    Search parameters from a JSON file: a list of objects, each with the
+    parameters of a search, eg: [{"search_term": "clinic"}].
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def warm_connections():
+    """
+    Fail early (and log) if a database or ElasticSearch is unreachable.
+    """
+    for alias in connections:
+        connections[alias].ensure_connection()
+    for alias in haystack_connections.connections_info:
+        backend = haystack_connections[alias].get_backend()
+        # loads the index mapping too
+        backend.setup()
+
+
+def warm_reference_data():
+    list(Country.objects.all())
+
+    snapshot = keyword_catalogue.snapshot()
+    snapshot.render()
+    snapshot.render(show_on_home_page=True)
+    snapshot.category_names_by_id()
+
+    get_template('search/indexes/api/organisation_text.txt')
+
+
+def warm_home_page():
+    # imported here, views depend on much more than the rest of this module
+    from service_directory.api.views import HomePageCategoryKeywordGrouping
+
+    response = HomePageCategoryKeywordGrouping().get(None)
+    FastJSONRenderer().render(response.data)
+
+
+def warm_searches(searches):
+    """
+    Run each search (given as search endpoint parameters) as the search
+    endpoint would, and load its results. Returns the number run.
+    """
+    count = 0
+    for params in searches:
+        search_serializer = SearchSerializer(data=params)
+        if not search_serializer.is_valid():
+            continue
+
+        sqs = ConfigurableSearchQuerySet().models(Organisation)
+        search_serializer.format_results(
+            search_serializer.load_search_results(sqs)
+        )
+        count += 1
+    return count
+
+
+def warm_up(searches=None, fixtures=None, days=None):
+    """
+    Run each warm-up step, logging rather than raising failures (a worker
+    should still start if, eg: ElasticSearch is down). Returns the seconds
+    each step took.
+    """
+    if searches is None:
+        searches = settings.WARM_UP_SEARCHES
+    if fixtures is None:
+        fixtures = settings.WARM_UP_SEARCHES_FILE
+    if days is None:
+        days = settings.WARM_UP_SEARCH_DAYS
+
+    def replay_searches():
+        params = []
+        if fixtures:
+            params.extend(fixture_searches(fixtures))
+        if searches:
+            params.extend(popular_searches(searches, days))
+        warm_searches(params)
+
+    timings = OrderedDict()
+    for name, step in (('connections', warm_connections),
+                       ('reference_data', warm_reference_data),
+                       ('home_page', warm_home_page),
+                       ('searches', replay_searches)):
+        started_at = time.time()
+        try:
+            step()
+        except Exception:
+            logging.warn('Warming up %s failed', name, exc_info=True)
+        timings[name] = time.time() - started_at
+
+    for connection in connections.all():
+        # (a connection can't be closed part way through a transaction)
+        if not connection.in_atomic_block:
+            connection.close()
+    return timings
@@ -0,0 +1,124 @@
+"""
+Seeds a synthetic service directory for the benchmarks.
+"""
+import random
+
+from django.contrib.gis.geos import Point
+from haystack import connections
+from service_directory.api.models import Country, Category, Keyword, \
+    KeywordCategory, Organisation, OrganisationCategory, OrganisationKeyword
+
+
+WORDS = (
+    'clinic', 'hospital', 'counselling', 'shelter', 'legal', 'advice',
+    'trauma', 'maternity', 'pharmacy', 'dental', 'optometry', 'rehab',
+    'hiv', 'testing', 'youth', 'support', 'family', 'housing', 'food',
+    'emergency', 'mental', 'health', 'education', 'training', 'employment'
+)
+
+# Cape Town, the seeded organisations are scattered around this point
+CENTRE = (-33.9249, 18.4241)
+
+
+class SyntheticDirectory(object):
+    def __init__(self, countries, categories, keywords, organisation_ids):
+        self.countries = countries
+        self.categories = categories
+        self.keywords = keywords
+        self.organisation_ids = organisation_ids
+
+
+def seed_directory(countries=2, categories=10, keywords=50,
+                   organisations=1000, keywords_per_organisation=4,
+                   seed=0):
+    """
+    Creates the given number of each model using bulk inserts (so without
+    any signals) and indexes the organisations directly.
+    """
+    rng = random.Random(seed)
+
+    Country.objects.bulk_create(
+        Country(name='Country {0}'.format(i), iso_code='C{0:02d}'.format(i))
+        for i in range(countries)
+    )
+    country_list = list(Country.objects.order_by('pk'))
+
+    Category.objects.bulk_create(
+        Category(
+            name='Category {0}'.format(i),
+            show_on_home_page=i % 2 == 0
+        )
+        for i in range(categories)
+    )
+    category_list = list(Category.objects.order_by('pk'))
+
+    Keyword.objects.bulk_create(
+        Keyword(
+            name='{0} {1}'.format(WORDS[i % len(WORDS)], i),
+            show_on_home_page=i % 3 == 0
+        )
+        for i in range(keywords)
+    )
+    keyword_list = list(Keyword.objects.order_by('pk'))
+
+    KeywordCategory.objects.bulk_create(
+        KeywordCategory(keyword=keyword, category=category)
+        for keyword in keyword_list
+        for category in rng.sample(
+            category_list, min(2, len(category_list))
+        )
+    )
+
+    Organisation.objects.bulk_create(
+        Organisation(
+            name='{0} {1} {2}'.format(
+                rng.choice(WORDS).title(), rng.choice(WORDS).title(), i
+            ),
+            about=' '.join(rng.choice(WORDS) for _ in range(20)),
+            address='{0} Main Road'.format(i),
+            telephone='021 555 {0:04d}'.format(i % 10000),
+            country=rng.choice(country_list),
+            location=Point(
+                CENTRE[1] + rng.uniform(-1, 1),
+                CENTRE[0] + rng.uniform(-1, 1),
+                srid=4326
+            )
+        )
+        for i in range(organisations)
+    )
+    organisation_ids = list(
+        Organisation.objects.order_by('pk').values_list('pk', flat=True)
+    )
+
+    OrganisationCategory.objects.bulk_create(
+        OrganisationCategory(organisation_id=pk, category=category)
+        for pk in organisation_ids
+        for category in rng.sample(
+            category_list, min(2, len(category_list))
+        )
+    )
+
+    OrganisationKeyword.objects.bulk_create(
+        OrganisationKeyword(organisation_id=pk, keyword=keyword)
+        for pk in organisation_ids
+        for keyword in rng.sample(
+            keyword_list, min(keywords_per_organisation, len(keyword_list))
+        )
+    )
+
+    index_organisations()
+
+    return SyntheticDirectory(
+        country_list, category_list, keyword_list, organisation_ids
+    )
+
+
+def index_organisations(batch_size=500):
+    backend = connections['default'].get_backend()
+    index = connections['default'].get_unified_index().get_index(
+        Organisation
+    )
+    queryset = index.index_queryset().order_by('pk')
+
+    for start in range(0, queryset.count(), batch_size):
+        backend.update(index, queryset[start:start + batch_size])
@@ -0,0 +1,153 @@
+"""
+Load tests a running server over HTTP with many concurrent clients, some of
+which send their requests slowly (as clients on slow mobile networks do), to
+compare gunicorn worker classes.
+"""
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib
+from contextlib import contextmanager
+
+from service_directory.api.models import Category, Keyword, Organisation
+from service_directory.benchmarks.runner import ScenarioResult
+
+
+def directory_paths(limit=50, seed=0):
+    """
+    Read endpoint paths (search, detail, keywords and the home page) for
+    the organisations, keywords and categories in the database.
+    """
+    rng = random.Random(seed)
+    paths = [
+        '/api/search/',
+        '/api/keywords/',
+        '/api/homepage_categories_keywords/',
+    ]
+    for pk in Organisation.objects.values_list('pk', flat=True)[:limit]:
+        paths.append('/api/organisation/{0}/'.format(pk))
+    for name in Keyword.objects.values_list('name', flat=True)[:limit]:
+        paths.append('/api/search/?' + urllib.urlencode({
+            'search_term': name.split()[0].encode('utf-8')
+        }))
+    for name in Category.objects.values_list('name', flat=True)[:limit]:
+        paths.append('/api/keywords/?' + urllib.urlencode({
+            'category': name.encode('utf-8')
+        }))
+    rng.shuffle(paths)
+    return paths
+
+
+def request(host, port, path, headers=(), client_delay=0.0, timeout=60):
+    """
+    GET ``path`` over a new connection, pausing ``client_delay`` seconds
+    part way through sending the request. Returns (status code, body size).
+    """
+    data = '\r\n'.join(
+        ['GET {0} HTTP/1.0'.format(path), 'Host: {0}'.format(host),
+         'Accept: application/json'] + list(headers) + ['', '']
+    )
+
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        if client_delay:
+            sock.sendall(data[:len(data) // 2])
+            time.sleep(client_delay)
+            sock.sendall(data[len(data) // 2:])
+        else:
+            sock.sendall(data)
+
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+
+    head, _, body = ''.join(chunks).partition('\r\n\r\n')
+    return int(head.split(' ', 2)[1]), len(body)
+
+
+def run_load(name, host, port, paths, concurrency=50, requests=500,
+             client_delay=0.0, slow_fraction=0.5, headers=(), seed=0):
+    """
+    Make ``requests`` requests from ``concurrency`` clients at once. A
+    ``slow_fraction`` of the requests are sent slowly.
+    """
+    result = ScenarioResult(name)
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client(i):
+        rng = random.Random(seed + i)
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+
+            path = rng.choice(paths)
+            delay = client_delay if rng.random() < slow_fraction else 0.0
+            started_at = time.time()
+            try:
+                status_code, size = request(
+                    host, port, path, headers, client_delay=delay
+                )
+            except (socket.error, ValueError, IndexError):
+                status_code, size = 599, 0
+            latency = time.time() - started_at
+
+            with lock:
+                result.add(latency, 0, status_code, size)
+
+    clients = [
+        threading.Thread(target=client, args=(i,))
+        for i in range(concurrency)
+    ]
+    started_at = time.time()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    result.elapsed = time.time() - started_at
+
+    return result
+
+
+def wait_for_port(host, port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.2)
+    raise RuntimeError('Nothing is listening on {0}:{1}'.format(host, port))
+
+
+@contextmanager
+def gunicorn(host, port, worker_class='sync', workers=1, threads=1):
+    """
+    Serve the app with gunicorn (with the current settings) for the duration
+    of the block.
+    """
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn.app.wsgiapp',
+        'service_directory.project.wsgi:application',
+        '--bind', '{0}:{1}'.format(host, port),
+        '--worker-class', worker_class,
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--log-level', 'warning',
+    ])
+    try:
+        wait_for_port(host, port)
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
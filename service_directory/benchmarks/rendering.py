@@ -0,0 +1,48 @@
+"""
+Compares the time taken to render each scenario's response with each JSON
+renderer, and its size with each content coding.
+"""
+import random
+import time
+from collections import OrderedDict
+
+from rest_framework.renderers import JSONRenderer
+from service_directory.api.middleware import CompressionMiddleware
+from service_directory.api.renderers import FastJSONRenderer
+from service_directory.benchmarks.runner import SCENARIOS
+
+RENDERERS = OrderedDict([
+    ('json', JSONRenderer),
+    ('fast_json', FastJSONRenderer),
+])
+
+
+def timed(func, iterations):
+    started_at = time.time()
+    for _ in range(iterations):
+        result = func()
+    return result, (time.time() - started_at) / iterations
+
+
+def measure_rendering(client, directory, name, iterations=50, seed=0):
+    path, params = SCENARIOS[name](directory, random.Random(seed))
+    data = client.get(path, params).data
+
+    summary = OrderedDict()
+    for renderer_name, renderer_class in RENDERERS.items():
+        content, seconds = timed(
+            lambda: renderer_class().render(data), iterations
+        )
+        summary[renderer_name + '_ms'] = round(seconds * 1000, 3)
+
+    summary['bytes'] = len(content)
+    for coding, (compress, level, cached_level) in \
+            CompressionMiddleware.CODINGS.items():
+        for label, compress_level in (('', level), ('_cached', cached_level)):
+            compressed, seconds = timed(
+                lambda: compress(content, compress_level), iterations
+            )
+            summary[coding + label + '_bytes'] = len(compressed)
+            summary[coding + label + '_ms'] = round(seconds * 1000, 3)
+
+    return summary
@@ -0,0 +1,179 @@
+"""
+Drives the public API endpoints through the Django test client and reports
+latency percentiles, throughput and SQL queries per request.
+"""
+import math
+import random
+import time
+from collections import OrderedDict
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from service_directory.benchmarks.data import CENTRE
+
+
+def search(directory, rng):
+    return '/api/search/', {}
+
+
+def search_term(directory, rng):
+    keyword = rng.choice(directory.keywords)
+    return '/api/search/', {'search_term': keyword.name.split()[0]}
+
+
+def search_location(directory, rng):
+    return '/api/search/', {
+        'location': '{0},{1}'.format(
+            CENTRE[0] + rng.uniform(-0.5, 0.5),
+            CENTRE[1] + rng.uniform(-0.5, 0.5)
+        ),
+        'radius': 25,
+        'categories': rng.choice(directory.categories).pk,
+    }
+
+
+def home_page(directory, rng):
+    return '/api/homepage_categories_keywords/', {}
+
+
+def keywords(directory, rng):
+    return '/api/keywords/', {}
+
+
+def keywords_in_category(directory, rng):
+    return '/api/keywords/', {
+        'category': rng.choice(directory.categories).name
+    }
+
+
+def organisation(directory, rng):
+    pk = rng.choice(directory.organisation_ids)
+    return '/api/organisation/{0}/'.format(pk), {
+        'location': '{0},{1}'.format(*CENTRE)
+    }
+
+
+SCENARIOS = OrderedDict([
+    ('search', search),
+    ('search_term', search_term),
+    ('search_location', search_location),
+    ('home_page', home_page),
+    ('keywords', keywords),
+    ('keywords_in_category', keywords_in_category),
+    ('organisation', organisation),
+])
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class ScenarioResult(object):
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.sizes = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def add(self, latency, queries, status_code, size=0):
+        self.latencies.append(latency)
+        self.queries.append(queries)
+        self.sizes.append(size)
+        if status_code >= 400:
+            self.errors += 1
+
+    def summary(self):
+        """
+        Every metric is None if no requests were made (which budgets
+        ignore).
+        """
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        if not requests:
+            return OrderedDict([
+                ('requests', 0),
+                ('errors', self.errors),
+                ('p50_ms', None),
+                ('p95_ms', None),
+                ('p99_ms', None),
+                ('rps', None),
+                ('queries_mean', None),
+                ('queries_max', None),
+                ('bytes_mean', None),
+            ])
+
+        return OrderedDict([
+            ('requests', requests),
+            ('errors', self.errors),
+            ('p50_ms', round(percentile(latencies, 50) * 1000, 2)),
+            ('p95_ms', round(percentile(latencies, 95) * 1000, 2)),
+            ('p99_ms', round(percentile(latencies, 99) * 1000, 2)),
+            ('rps', round(requests / self.elapsed, 1) if self.elapsed
+             else None),
+            ('queries_mean', round(float(sum(self.queries)) / requests, 2)),
+            ('queries_max', max(self.queries)),
+            ('bytes_mean', int(float(sum(self.sizes)) / requests)),
+        ])
+
+
+def run_scenario(client, directory, name, requests=200, warmup=20, seed=0,
+                 accept_encoding=None):
+    scenario = SCENARIOS[name]
+    headers = {}
+    if accept_encoding:
+        headers['HTTP_ACCEPT_ENCODING'] = accept_encoding
+
+    rng = random.Random(seed)
+    result = ScenarioResult(name)
+
+    for _ in range(warmup):
+        client.get(*scenario(directory, rng), **headers)
+
+    for _ in range(requests):
+        path, params = scenario(directory, rng)
+
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.time()
+            response = client.get(path, params, **headers)
+            latency = time.time() - started_at
+
+        result.add(
+            latency, len(queries), response.status_code, len(response.content)
+        )
+        result.elapsed += latency
+
+    return result
+
+
+# Budgets are given per scenario, eg: {"search": {"p95_ms": 50,
+# "queries_max": 3}}. ``rps`` is a lower bound, everything else an upper
+# bound.
+def check_budgets(summaries, budgets):
+    failures = []
+
+    for name, budget in budgets.items():
+        summary = summaries.get(name)
+        if summary is None:
+            continue
+
+        for metric, limit in budget.items():
+            value = summary.get(metric)
+            if value is None:
+                continue
+            exceeded = value < limit if metric == 'rps' else value > limit
+            if exceeded:
+                failures.append(
+                    '{0}: {1} is {2} (budget {3})'.format(
+                        name, metric, value, limit
+                    )
+                )
+
+    return failures
@@ -10,6 +10,15 @@ from .settings import *
 DEBUG = False
 TEMPLATE_DEBUG = False
 
+# compile each template once per process (they're warmed up by warm_caches)
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
 ALLOWED_HOSTS = ['*']
 
 SECRET_KEY = environ.get('SECRET_KEY', 'please-change-me')
@@ -19,10 +28,27 @@ RAVEN_CONFIG = {'dsn': RAVEN_DSN} if RAVEN_DSN else {}
 
 STATIC_ROOT = '/app/static'
 
+SNAPSHOT_ROOT = environ.get('SNAPSHOT_ROOT', '/app/snapshots')
+SNAPSHOT_URL = environ.get('SNAPSHOT_URL', '/snapshots/')
+
 DATABASES = {
     'default': dj_database_url.config()
 }
 
+# comma separated URLs of read replicas
+DATABASE_REPLICAS = []
+for i, url in enumerate(filter(None, environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    alias = 'replica%d' % (i + 1)
+    DATABASES[alias] = dj_database_url.parse(url.strip())
+    DATABASE_REPLICAS.append(alias)
+
+# persistent, health checked connections (see api.postgis_backend); set
+# DATABASE_CONN_MAX_AGE=0 to close them after each request
+for database in DATABASES.values():
+    if database['ENGINE'] == 'django.contrib.gis.db.backends.postgis':
+        database['ENGINE'] = 'service_directory.api.postgis_backend'
+    database['CONN_MAX_AGE'] = int(environ.get('DATABASE_CONN_MAX_AGE', '300'))
+
 HAYSTACK_CONNECTIONS = {
     'default': {
         'ENGINE': 'service_directory.api.haystack_elasticsearch_raw_query.custom_elasticsearch.ConfigurableElasticSearchEngine',
@@ -31,6 +57,24 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
+# memcached (comma separated host:port), shared by every worker and host
+if environ.get('MEMCACHED_HOSTS'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': environ['MEMCACHED_HOSTS'].split(','),
+        },
+    }
+
+# share coalesced responses across processes (through the shared cache)
+COALESCE_SHARED = environ.get('COALESCE_SHARED', '0') == '1'
+
+WARM_UP_SEARCHES = int(environ.get('WARM_UP_SEARCHES', '50'))
+WARM_UP_SEARCHES_FILE = environ.get('WARM_UP_SEARCHES_FILE')
+
+PERFORMANCE_METRICS_SAMPLE_RATE = float(environ.get('PERFORMANCE_METRICS_SAMPLE_RATE', '0.1'))
+METRICS_TOKEN = environ.get('METRICS_TOKEN')
+
 GOOGLE_ANALYTICS_TRACKING_ID = environ.get('GOOGLE_ANALYTICS_TRACKING_ID', 'please-change-me')
 
 VUMI_GO_ACCOUNT_KEY = environ.get('VUMI_GO_ACCOUNT_KEY', 'please-change-me')
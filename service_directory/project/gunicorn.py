@@ -0,0 +1,35 @@
+"""
+Gunicorn settings, overridable from the environment.
+
+The default sync workers handle one request at a time each, so a worker
+waits out every slow client and every call to PostgreSQL or ElasticSearch.
+With GUNICORN_WORKER_CLASS=gthread each worker instead serves up to
+GUNICORN_THREADS requests at once (each thread keeps its own database
+connection; on Python 2 this needs the ``futures`` backport, see
+requirements.txt). Use the load_test_api command to compare the two.
+
+Each worker warms up (see api/warmup.py) before it accepts requests, unless
+GUNICORN_WARM_UP=0.
+"""
+from os import environ
+
+
+worker_class = environ.get('GUNICORN_WORKER_CLASS', 'sync')
+if 'GUNICORN_WORKERS' in environ:
+    workers = int(environ['GUNICORN_WORKERS'])
+threads = int(environ.get('GUNICORN_THREADS', '1'))
+# idle keep-alive connections are held open by gthread workers
+keepalive = int(environ.get('GUNICORN_KEEPALIVE', '2'))
+timeout = int(environ.get('GUNICORN_TIMEOUT', '1800'))
+
+
+def post_worker_init(worker):
+    # post_fork runs before the worker has loaded the app; this runs after,
+    # and before the worker starts accepting requests
+    if environ.get('GUNICORN_WARM_UP', '1') != '0':
+        from service_directory.api.warmup import warm_up
+
+        timings = warm_up()
+        worker.log.info('Warmed up in %.2fs: %s', sum(timings.values()),
+                        ', '.join('{0} {1:.2f}s'.format(name, seconds)
+                                  for name, seconds in timings.items()))
@@ -47,7 +47,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'service_directory.api.middleware.PerformanceMetricsMiddleware',
+    'service_directory.api.middleware.CompressionMiddleware',
+    'service_directory.api.middleware.ContentETagMiddleware',
     'service_directory.api.middleware.HaystackBatchFlushMiddleware',
+    'service_directory.api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,15 +91,30 @@ DATABASES = {
         # 'ENGINE': 'django.db.backends.sqlite3',
         # 'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
 
-        'ENGINE': 'django.contrib.gis.db.backends.postgis',
+        # PostGIS, with health checks for persistent connections
+        'ENGINE': 'service_directory.api.postgis_backend',
         'NAME': 'servicedirectory',
         'USER': 'servicedirectory',
         'PASSWORD': 'password',
         'HOST': 'localhost',
-        'PORT': '5432'
+        'PORT': '5432',
+        # keep connections open between requests for this many seconds
+        'CONN_MAX_AGE': 300,
     }
 }
 
+# Read-only API requests read from these DATABASES aliases (in turn), see
+# ReadReplicaRouter. A replica that fails is skipped for
+# REPLICA_EJECT_SECONDS (and a request it fails is retried on the primary). A
+# client that makes a change reads from the primary for the following
+# REPLICA_STICKY_SECONDS.
+DATABASE_ROUTERS = ['service_directory.api.routers.ReadReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PATH_PREFIX = '/api/'
+REPLICA_EJECT_SECONDS = 30
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'use_primary_db'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -135,10 +154,19 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Directory snapshots (see the build_directory_snapshots command) are written
+# to SNAPSHOT_ROOT, which should be served (or synced to a CDN) at SNAPSHOT_URL
+SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'snapshots')
+SNAPSHOT_URL = '/snapshots/'
+
 
 # REST framework
 REST_FRAMEWORK = {
-    'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAdminUser',)
+    'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAdminUser',),
+    'DEFAULT_RENDERER_CLASSES': (
+        'service_directory.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 
@@ -147,6 +175,24 @@ SWAGGER_SETTINGS = {
     'is_superuser': True
 }
 
+# Caches (see api/caching.py): each process keeps up to CACHE_L1_SIZE
+# entries for at most CACHE_L1_SECONDS in front of the SHARED_CACHE (which is
+# only shared between processes once CACHES is configured with, eg:
+# memcached, see project/docker.py). Entries expire from the shared cache
+# after CACHE_TIMEOUT seconds, and each process rechecks the cache namespace
+# versions at most every CACHE_VERSION_SECONDS.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'service-directory',
+    },
+}
+SHARED_CACHE = 'default'
+CACHE_L1_SIZE = 1000
+CACHE_L1_SECONDS = 5
+CACHE_TIMEOUT = 300
+CACHE_VERSION_SECONDS = 1
+
 # Haystack search
 HAYSTACK_CONNECTIONS = {
     'default': {
@@ -158,6 +204,111 @@ HAYSTACK_CONNECTIONS = {
 
 HAYSTACK_SIGNAL_PROCESSOR = 'service_directory.api.signal_processors.BatchingSignalProcessor'
 
+# Organisations reindexed together (eg: after a keyword is renamed) are sent
+# to ElasticSearch in bulk requests of this many
+SEARCH_REINDEX_BATCH_SIZE = 500
+
+# Index changes are sent to ElasticSearch at the end of each request, and
+# otherwise (eg: in management commands) once this many are pending, or on
+# the next change once the oldest has waited this many seconds
+SEARCH_INDEX_AUTOFLUSH_SIZE = 500
+SEARCH_INDEX_AUTOFLUSH_SECONDS = 5
+
+# Search terms are matched exactly first; the (expensive) fuzzy match is only
+# used when the exact match finds fewer than SEARCH_FUZZY_MIN_HITS results
+SEARCH_FUZZY_MIN_HITS = 10
+SEARCH_FUZZY_PREFIX_LENGTH = 1
+SEARCH_FUZZY_MAX_EXPANSIONS = 50
+
+# Search fetches this many more results than it returns, so that pages are
+# still full when some of the organisations found have been deleted since
+# they were indexed (their documents are then removed in the background)
+SEARCH_OVERFETCH = 5
+
+# Searches are also logged to the database (see api/search_log.py). Up to
+# SEARCH_LOG_BUFFER_SIZE are kept in memory, and written in the background
+# once SEARCH_LOG_FLUSH_SIZE are waiting or the oldest has waited
+# SEARCH_LOG_FLUSH_SECONDS. The rollup_search_log command aggregates them by
+# hour (rebuilding the last SEARCH_ROLLUP_REBUILD_HOURS each time, to count
+# searches that were written after their hour was rolled up), and deletes
+# logged searches and hourly rollups once they are older than their
+# retention periods.
+SEARCH_LOG_BUFFER_SIZE = 10000
+SEARCH_LOG_FLUSH_SIZE = 500
+SEARCH_LOG_FLUSH_SECONDS = 10
+SEARCH_ROLLUP_REBUILD_HOURS = 2
+SEARCH_LOG_RETENTION_DAYS = 30
+SEARCH_ROLLUP_RETENTION_DAYS = 365
+
+# Each gunicorn worker (and the warm_caches command) replays the
+# WARM_UP_SEARCHES most popular searches of the last WARM_UP_SEARCH_DAYS
+# days, as well as those in WARM_UP_SEARCHES_FILE (a JSON list of search
+# parameters), before serving requests
+WARM_UP_SEARCHES = 50
+WARM_UP_SEARCH_DAYS = 7
+WARM_UP_SEARCHES_FILE = None
+
+# Identical concurrent searches and organisation detail requests are only
+# computed once per process (see api/coalescing.py). With COALESCE_SHARED set
+# their results are shared across processes too (in the shared cache), and
+# kept for COALESCE_FRESH_SECONDS; for COALESCE_STALE_SECONDS after that they
+# are still served while one request refreshes them. Other processes wait up
+# to COALESCE_WAIT_SECONDS for a result being computed, and its lock is held
+# for at most COALESCE_LOCK_SECONDS.
+COALESCE_SHARED = False
+COALESCE_FRESH_SECONDS = 5
+COALESCE_STALE_SECONDS = 30
+COALESCE_WAIT_SECONDS = 2
+COALESCE_LOCK_SECONDS = 10
+
+# The most values the search facet counts are returned for, per facet
+SEARCH_FACET_SIZE = 100
+
+# The most searches the multi search endpoint runs in one request
+MULTI_SEARCH_MAX_SEARCHES = 20
+
+# The keyword catalogue (see KeywordCatalogue) is reloaded at least this
+# often (in seconds) to pick up changes made by other processes
+KEYWORD_CATALOGUE_TTL = 60
+
+
+# Delta sync API (see service_directory.api.sync). Changes made in the last
+# SYNC_SETTLE_SECONDS (or since the oldest open transaction started) are held
+# back until the following sync. Deletions are kept for
+# SYNC_TOMBSTONE_RETENTION_DAYS (see the prune_sync_tombstones command), so
+# clients that haven't synced for that long must start again.
+SYNC_PAGE_SIZE = 100
+SYNC_SETTLE_SECONDS = 5
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+
+# The most organisations the batch organisation endpoint returns at once
+ORGANISATION_BATCH_MAX_IDS = 50
+
+
+# Response compression (see CompressionMiddleware), of the JSON responses
+# under COMPRESSION_PATH_PREFIX only. Cacheable responses get an ETag (see
+# ContentETagMiddleware), which is used to cache their compressed bytes.
+COMPRESSION_PATH_PREFIX = '/api/'
+COMPRESSION_MIN_LENGTH = 200
+COMPRESSION_CACHE_SIZE = 512
+
+
+# Background work, eg: Google Analytics events (see BackgroundDispatcher).
+# With no workers it is done during the request instead.
+BACKGROUND_WORKERS = 2
+BACKGROUND_QUEUE_SIZE = 1000
+
+
+# Per-request performance metrics (see PerformanceMetricsMiddleware)
+# The sample rate is the fraction of requests measured, between 0 and 1.
+# Measured requests log every SQL query (as in DEBUG mode), so keep it low.
+PERFORMANCE_METRICS_SAMPLE_RATE = 0.1
+PERFORMANCE_METRICS_SERVER_TIMING = True
+
+# A bearer token that lets a scraper (eg: Prometheus) read /api/metrics/
+# without admin credentials. Unset, only admin users can.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 
 GOOGLE_ANALYTICS_TRACKING_ID = os.environ.get('GOOGLE_ANALYTICS_TRACKING_ID', 'please-change-me')
 
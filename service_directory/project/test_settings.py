@@ -11,3 +11,10 @@ HAYSTACK_CONNECTIONS['default']['INDEX_NAME'] = 'test'
 
 # turn off authentication on the api for testing
 REST_FRAMEWORK['DEFAULT_PERMISSION_CLASSES'] = ('rest_framework.permissions.AllowAny',)
+
+# run background calls (some of which use the database) inline, within each
+# test's transaction
+BACKGROUND_WORKERS = 0
+
+# measure every request, so that the metrics can be tested
+PERFORMANCE_METRICS_SAMPLE_RATE = 1.0
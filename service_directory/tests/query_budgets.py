@@ -0,0 +1,155 @@
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from haystack import connections, signal_processor
+from rest_framework.test import APIClient
+from service_directory.api.models import Country, Category, Keyword, \
+    KeywordCategory, Organisation, OrganisationCategory, OrganisationKeyword
+from service_directory.api.search_log import search_log
+
+
+# The maximum number of SQL queries and ElasticSearch calls for a single
+# invocation of each view. These must hold no matter how many rows there are,
+# so anything that runs a query per row will exceed them.
+QUERY_BUDGETS = {
+    'search': {'sql': 2, 'es': 1},
+    'search_term': {'sql': 2, 'es': 2},
+    'home_page': {'sql': 2, 'es': 0},
+    'keywords': {'sql': 2, 'es': 0},
+    'keywords_in_category': {'sql': 2, 'es': 0},
+    'organisation': {'sql': 4, 'es': 0},
+    'organisation_sparse': {'sql': 1, 'es': 0},
+    'organisations': {'sql': 4, 'es': 0},
+    'search_sparse': {'sql': 1, 'es': 1},
+    'search_facets': {'sql': 5, 'es': 1},
+    'multi_search': {'sql': 2, 'es': 2},
+    'index_organisations': {'sql': 3, 'es': 1},
+    'sync': {'sql': 6, 'es': 0},
+    'admin:country': {'sql': 6, 'es': 0},
+    'admin:category': {'sql': 6, 'es': 0},
+    'admin:keyword': {'sql': 8, 'es': 0},
+    'admin:organisation': {'sql': 10, 'es': 0},
+}
+
+ES_CALLS = ('search', 'msearch', 'bulk', 'scroll', 'delete')
+
+
+class RecordedCalls(object):
+    sql = 0
+    es = 0
+
+
+@contextmanager
+def record_calls():
+    """
+    Count the SQL queries and ElasticSearch calls made within the block.
+    """
+    recorded = RecordedCalls()
+    es_connection = connections['default'].get_backend().conn
+
+    def counting(method):
+        def wrapper(*args, **kwargs):
+            recorded.es += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in ES_CALLS:
+        if hasattr(es_connection, name):
+            setattr(es_connection, name,
+                    counting(getattr(es_connection, name)))
+
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            yield recorded
+    finally:
+        for name in ES_CALLS:
+            es_connection.__dict__.pop(name, None)
+
+    recorded.sql = len(queries)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Checks that views stay within their QUERY_BUDGETS as the directory grows
+    through ``dataset_sizes`` organisations.
+    """
+    client_class = APIClient
+    dataset_sizes = (1, 10, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+
+        cls.categories = []
+        cls.keywords = []
+        for i in range(3):
+            category = Category.objects.create(
+                name='Category {0}'.format(i),
+                show_on_home_page=True
+            )
+            keyword = Keyword.objects.create(
+                name='keyword{0}'.format(i),
+                show_on_home_page=True
+            )
+            KeywordCategory.objects.create(keyword=keyword, category=category)
+            cls.categories.append(category)
+            cls.keywords.append(keyword)
+
+    def grow_directory(self, size):
+        """
+        Add organisations (and related rows) until there are ``size`` of
+        them, and index them.
+        """
+        for i in range(Organisation.objects.count(), size):
+            organisation = Organisation.objects.create(
+                name='Organisation {0}'.format(i),
+                country=self.country
+            )
+            for category in self.categories[:2]:
+                OrganisationCategory.objects.create(
+                    organisation=organisation, category=category
+                )
+            for keyword in self.keywords[:2]:
+                OrganisationKeyword.objects.create(
+                    organisation=organisation, keyword=keyword
+                )
+
+        # index them now rather than in the middleware of the next request
+        signal_processor.flush_changes()
+
+    def assertWithinBudget(self, name, func):
+        """
+        Call ``func`` once for each dataset size and check the SQL queries
+        and ElasticSearch calls it makes against the budget for ``name``.
+        """
+        budget = QUERY_BUDGETS[name]
+
+        for size in self.dataset_sizes:
+            self.grow_directory(size)
+            # so that the search log isn't written during the call
+            search_log.flush()
+
+            with record_calls() as calls:
+                result = func()
+
+            status_code = getattr(result, 'status_code', 200)
+            self.assertEqual(200, status_code, '{0} failed'.format(name))
+
+            for kind in ('sql', 'es'):
+                self.assertLessEqual(
+                    getattr(calls, kind), budget[kind],
+                    '{0} made {1} {2} calls with {3} organisations '
+                    '(budget is {4})'.format(
+                        name, getattr(calls, kind), kind, size, budget[kind]
+                    )
+                )
+
+    def login_admin(self):
+        User.objects.create_superuser('admin', 'admin@example.org', 'admin')
+        self.client.login(username='admin', password='admin')
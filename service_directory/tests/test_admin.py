@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import Point
+from django.db import connection
 from django.test import TestCase
 from service_directory.api.models import Country, Organisation, Category, \
     Keyword, KeywordCategory, OrganisationCategory, OrganisationKeyword
@@ -180,3 +181,46 @@ class OrganisationModelFormTestCase(TestCase):
                 '/admin/api/organisation/'
             )
         )
+
+
+class NameSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('test', 'test@test.com', 'test')
+
+        country = Country.objects.create(name='South Africa', iso_code='ZA')
+        country.full_clean()  # force model validation to happen
+
+        organisation = Organisation.objects.create(
+            name='Netcare Christiaan Barnard Memorial Hospital',
+            country=country
+        )
+        organisation.full_clean()  # force model validation to happen
+
+        keyword = Keyword.objects.create(name='Trauma')
+        keyword.full_clean()  # force model validation to happen
+
+    def setUp(self):
+        self.client.login(username='test', password='test')
+
+    def test_search(self):
+        response = self.client.get(
+            '/admin/api/organisation/', {'q': 'barnard'}
+        )
+        self.assertEqual(1, response.context['cl'].result_count)
+
+        response = self.client.get('/admin/api/keyword/', {'q': 'RAUM'})
+        self.assertEqual(1, response.context['cl'].result_count)
+
+    def test_names_have_trigram_indexes(self):
+        # (expression indexes aren't introspected by Django)
+        with connection.cursor() as cursor:
+            for table in ('api_keyword', 'api_organisation'):
+                cursor.execute(
+                    'SELECT indexname FROM pg_indexes WHERE tablename = %s',
+                    [table]
+                )
+                self.assertIn(
+                    '{0}_name_trgm'.format(table),
+                    [row[0] for row in cursor.fetchall()]
+                )
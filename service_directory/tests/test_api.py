@@ -1,20 +1,32 @@
 from datetime import datetime, timedelta
 
 import re
+import threading
 from dateutil.parser import parse
 
 from django.conf import settings
 from django.contrib.gis.geos import Point
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from haystack import signal_processor
 from haystack.backends.elasticsearch_backend import ElasticsearchSearchBackend
 from pytz import utc
 from django.core.management import call_command
 
 from rest_framework.test import APIClient
+from service_directory.api import metrics, views
+from service_directory.api.catalogue import keyword_catalogue
+from service_directory.api.haystack_elasticsearch_raw_query.\
+    custom_elasticsearch import ConfigurableSearchQuerySet
 from service_directory.api.models import Country, Category, Keyword,\
-    Organisation, KeywordCategory, OrganisationCategory, OrganisationKeyword
+    Organisation, KeywordCategory, OrganisationCategory, \
+    OrganisationKeyword, OrganisationTombstone
 from service_directory.api.search_indexes import OrganisationIndex
+from service_directory.api.serializers import SearchSerializer
+from service_directory.api.snapshots import current_sync_token
+from service_directory.api.sync import SyncToken, prune_tombstones, \
+    to_microseconds
 
 
 def reset_haystack_index():
@@ -421,6 +433,29 @@ class SearchTestCase(TestCase):
         self.assertListEqual([kw.name for kw in self.org_cmc.keywords.all()],
                              response.data[2]['keywords'])
 
+    @override_settings(BACKGROUND_WORKERS=0)
+    def test_backfills_deleted_organisations(self):
+        # the closest, deleted without its document being removed
+        self.org_cbmh.delete()
+        signal_processor._pending.changes.clear()
+
+        search_serializer = SearchSerializer(
+            data={'location': '-33.921387,18.424101'}
+        )
+        self.assertTrue(search_serializer.is_valid())
+        results = search_serializer.load_search_results(
+            ConfigurableSearchQuerySet().models(Organisation), limit=2
+        )
+        self.assertEqual(
+            [self.org_khc.pk, self.org_cmc.pk],
+            [result.object.pk for result in results]
+        )
+
+        # and its document has been removed
+        self.assertEqual(
+            2, ConfigurableSearchQuerySet().models(Organisation).count()
+        )
+
     def test_get_with_location_parameter_org_with_no_location(self):
         self.org_prkc = Organisation.objects.create(
             name='Praekelt Clinic',
@@ -550,6 +585,37 @@ class SearchTestCase(TestCase):
 
         self.assertEqual(2, len(response.data))
 
+    def test_search_term_tiers(self):
+        # too few exact matches, so we fall back to fuzzy matching
+        response = self.client.get(
+            '/api/search/',
+            {'search_term': 'trauma'},
+            format='json'
+        )
+        self.assertEqual('fuzzy', response['X-Search-Tier'])
+        self.assertEqual(2, len(response.data))
+
+        with self.settings(SEARCH_FUZZY_MIN_HITS=2):
+            response = self.client.get(
+                '/api/search/',
+                {'search_term': 'trauma'},
+                format='json'
+            )
+            self.assertEqual('exact', response['X-Search-Tier'])
+            self.assertEqual(2, len(response.data))
+
+            # misspelled terms still fall back to fuzzy matching
+            response = self.client.get(
+                '/api/search/',
+                {'search_term': 'truama'},
+                format='json'
+            )
+            self.assertEqual('fuzzy', response['X-Search-Tier'])
+            self.assertEqual(2, len(response.data))
+
+        response = self.client.get('/api/search/', format='json')
+        self.assertEqual('none', response['X-Search-Tier'])
+
     def test_api_validation(self):
         response = self.client.get(
             '/api/search/', {
@@ -596,6 +662,146 @@ class SearchTestCase(TestCase):
         )
         self.assertEqual(3, len(response.data))
 
+    def test_sparse_fieldset(self):
+        response = self.client.get(
+            '/api/search/', {
+                'search_term': 'Test Org',
+                'fields': 'id,name,distance'
+            },
+            format='json'
+        )
+
+        self.assertTrue(len(response.data) > 0)
+        for organisation in response.data:
+            self.assertEqual(
+                ['distance', 'id', 'name'], sorted(organisation.keys())
+            )
+
+        response = self.client.get(
+            '/api/search/', {'fields': 'id,colour'}, format='json'
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(
+            {'fields': ['Unknown fields: colour']}, response.data
+        )
+
+    def test_facets(self):
+        keyword_catalogue.invalidate()
+
+        response = self.client.get(
+            '/api/search/', {
+                'facets': 'categories,keywords,country',
+            },
+            format='json'
+        )
+
+        self.assertEqual(3, len(response.data['results']))
+        self.assertEqual([
+            {'id': self.category.pk, 'name': self.category.name, 'count': 3},
+            {'id': self.category2.pk, 'name': self.category2.name,
+             'count': 1},
+        ], response.data['facets']['categories'])
+        self.assertEqual(
+            {'name': self.keyword_test.name, 'count': 3},
+            response.data['facets']['keywords'][0]
+        )
+        self.assertEqual(
+            {'name': self.keyword_trauma.name, 'count': 2},
+            response.data['facets']['keywords'][1]
+        )
+        self.assertEqual(
+            [{'iso_code': 'ZA', 'count': 3}],
+            response.data['facets']['country']
+        )
+
+        # counted over the matching organisations only
+        response = self.client.get(
+            '/api/search/', {
+                'keywords': self.keyword_hiv.name,
+                'facets': 'categories',
+            },
+            format='json'
+        )
+        self.assertEqual(1, len(response.data['results']))
+        self.assertEqual(['categories'], response.data['facets'].keys())
+        self.assertEqual(
+            [1, 1],
+            [facet['count'] for facet in response.data['facets']['categories']]
+        )
+
+        response = self.client.get(
+            '/api/search/', {'facets': 'colour'}, format='json'
+        )
+        self.assertEqual(
+            {'facets': [u'Unknown facets: colour']}, response.data
+        )
+
+    def test_multi_search(self):
+        searches = [
+            {'search_term': 'Netcare'},
+            {'radius': 100, 'location': '-33.921387,18.424101'},
+            {'keywords': [self.keyword_heart.name]},
+            {'search_term': 'Netcare', 'country': 'XX'},
+        ]
+
+        response = self.client.post(
+            '/api/multi_search/', {'searches': searches}, format='json'
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(len(searches), len(response.data))
+
+        # each result set matches what the search endpoint finds
+        for search, result in zip(searches, response.data):
+            single = self.client.get('/api/search/', search, format='json')
+            self.assertEqual(single['X-Search-Tier'], result['search_tier'])
+            self.assertEqual(single.data, result['organisations'])
+
+    def test_multi_search_shared_results(self):
+        # the same organisations, found with and then without a location
+        searches = [
+            {'radius': 100, 'location': '-33.921387,18.424101'},
+            {'search_term': 'Netcare'},
+        ]
+
+        response = self.client.post(
+            '/api/multi_search/', {'searches': searches}, format='json'
+        )
+        with_location, without_location = response.data
+        self.assertTrue(set(
+            organisation['id']
+            for organisation in with_location['organisations']
+        ) & set(
+            organisation['id']
+            for organisation in without_location['organisations']
+        ))
+        self.assertTrue(all(
+            organisation['distance']
+            for organisation in with_location['organisations']
+        ))
+        self.assertFalse(any(
+            organisation.get('distance')
+            for organisation in without_location['organisations']
+        ))
+
+        for search, result in zip(searches, response.data):
+            single = self.client.get('/api/search/', search, format='json')
+            self.assertEqual(single.data, result['organisations'])
+
+    def test_multi_search_validation(self):
+        response = self.client.post(
+            '/api/multi_search/', {'searches': []}, format='json'
+        )
+        self.assertEqual(400, response.status_code)
+
+        response = self.client.post(
+            '/api/multi_search/',
+            {'searches': [{'search_term': 'Netcare'}, {'radius': -1}]},
+            format='json'
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual({}, response.data['searches'][0])
+        self.assertIn('radius', response.data['searches'][1])
+
 
 class OrganisationDetailTestCase(TestCase):
     maxDiff = None
@@ -811,6 +1017,143 @@ class OrganisationDetailTestCase(TestCase):
 
         self.assertJSONEqual(response.content, expected_response_content)
 
+    def test_get_sparse_fieldset(self):
+        url = '/api/organisation/{0}/'.format(self.org.id)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, {
+                    'location': '-33.891937,17.505496',
+                    'fields': 'id,name,distance'
+                },
+                format='json'
+            )
+
+        self.assertJSONEqual(response.content, {
+            'id': self.org.id,
+            'name': self.org.name,
+            'distance': '110.68km'
+        })
+
+        response = self.client.get(
+            url, {'fields': 'name,keywords'}, format='json'
+        )
+        self.assertEqual(
+            [self.keyword.name],
+            [keyword['name'] for keyword in response.data['keywords']]
+        )
+
+        response = self.client.get(url, {'fields': 'colour'}, format='json')
+        self.assertEqual(400, response.status_code)
+
+
+class OrganisationBatchTestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        cls.country.full_clean()  # force model validation to happen
+
+        cls.category = Category.objects.create(name='Test Category')
+        cls.category.full_clean()  # force model validation to happen
+
+        cls.keyword = Keyword.objects.create(name='test')
+        cls.keyword.full_clean()  # force model validation to happen
+
+        kwc = KeywordCategory.objects.create(
+            keyword=cls.keyword, category=cls.category
+        )
+        kwc.full_clean()  # force model validation to happen
+
+        cls.org1 = Organisation.objects.create(
+            name='Test Organisation 1',
+            country=cls.country,
+            location=Point(18.505496, -33.891937, srid=4326)
+        )
+        cls.org1.full_clean()  # force model validation to happen
+
+        cls.org2 = Organisation.objects.create(
+            name='Test Organisation 2',
+            country=cls.country,
+            location=Point(17.505496, -33.891937, srid=4326)
+        )
+        cls.org2.full_clean()  # force model validation to happen
+
+        for org in (cls.org1, cls.org2):
+            oc = OrganisationCategory.objects.create(
+                organisation=org, category=cls.category
+            )
+            oc.full_clean()  # force model validation to happen
+
+            ok = OrganisationKeyword.objects.create(
+                organisation=org, keyword=cls.keyword
+            )
+            ok.full_clean()  # force model validation to happen
+
+    def test_get(self):
+        ids = '{0},{1},{2}'.format(self.org2.id, self.org1.id, 9999)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                '/api/organisations/', {
+                    'ids': ids,
+                    'location': '-33.891937,18.505496'
+                },
+                format='json'
+            )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [self.org2.id, self.org1.id],
+            [organisation['id'] for organisation in response.data]
+        )
+        self.assertEqual(
+            ['110.68km', '0.00km'],
+            [organisation['distance'] for organisation in response.data]
+        )
+
+        # the batch matches the single organisation endpoint
+        single = self.client.get(
+            '/api/organisation/{0}/'.format(self.org1.id),
+            {'location': '-33.891937,18.505496'},
+            format='json'
+        )
+        self.assertEqual(single.data, response.data[1])
+
+    def test_get_sparse_fieldset(self):
+        response = self.client.get(
+            '/api/organisations/', {
+                'ids': '{0},{1}'.format(self.org1.id, self.org2.id),
+                'fields': 'id,name'
+            },
+            format='json'
+        )
+
+        self.assertEqual([
+            {'id': self.org1.id, 'name': self.org1.name},
+            {'id': self.org2.id, 'name': self.org2.name},
+        ], response.data)
+
+    def test_get_validation(self):
+        for ids in ('', 'one,two', ','):
+            response = self.client.get(
+                '/api/organisations/', {'ids': ids}, format='json'
+            )
+            self.assertEqual(400, response.status_code)
+            self.assertIn('ids', response.data)
+
+        with self.settings(ORGANISATION_BATCH_MAX_IDS=1):
+            response = self.client.get(
+                '/api/organisations/',
+                {'ids': '{0},{1}'.format(self.org1.id, self.org2.id)},
+                format='json'
+            )
+        self.assertEqual(400, response.status_code)
+
 
 class OrganisationReportIncorrectInformationTestCase(TestCase):
     client_class = APIClient
@@ -1048,6 +1391,102 @@ class HomePageCategoryKeywordGroupingTestCase(TestCase):
         self.assertJSONEqual(response.content, expected_response_content)
 
 
+class PerformanceMetricsTestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test Category',
+            show_on_home_page=True
+        )
+        cls.category.full_clean()  # force model validation to happen
+
+        cls.keyword = Keyword.objects.create(
+            name='test',
+            show_on_home_page=True
+        )
+        cls.keyword.full_clean()  # force model validation to happen
+
+        kwc = KeywordCategory.objects.create(
+            keyword=cls.keyword, category=cls.category
+        )
+        kwc.full_clean()  # force model validation to happen
+
+    def test_server_timing_header(self):
+        response = self.client.get(
+            '/api/homepage_categories_keywords/',
+            format='json'
+        )
+
+        server_timing = response['Server-Timing']
+        self.assertIn('sql;dur=', server_timing)
+        self.assertIn('serialize;dur=', server_timing)
+        self.assertIn('index_flush;dur=', server_timing)
+
+    def test_sampling(self):
+        with self.settings(PERFORMANCE_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(
+                '/api/homepage_categories_keywords/',
+                format='json'
+            )
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.client.get('/api/homepage_categories_keywords/', format='json')
+
+        response = self.client.get(
+            '/api/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+        )
+
+        self.assertEqual('text/plain; version=0.0.4', response['Content-Type'])
+        self.assertRegexpMatches(
+            response.content, r'service_directory_requests_total \d+'
+        )
+        self.assertRegexpMatches(
+            response.content, r'service_directory_sql_total \d+'
+        )
+
+    def test_metrics_endpoint_permissions(self):
+        # not the API's default (AllowAny in the test settings)
+        self.assertEqual(403, self.client.get('/api/metrics/').status_code)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get(
+                '/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong'
+            )
+        self.assertEqual(403, response.status_code)
+
+    def test_google_analytics_counters(self):
+        class FakeTracker(object):
+            def __init__(self, fail=False):
+                self.fail = fail
+
+            def send(self, *args, **kwargs):
+                if self.fail:
+                    raise IOError('unreachable')
+
+        tracker = views.google_analytics_tracker
+        before = metrics.counters()
+        try:
+            views.google_analytics_tracker = FakeTracker()
+            views.send_ga_tracking_event('/api/search/', 'a', 'b', 'c')
+            views.google_analytics_tracker = FakeTracker(fail=True)
+            views.send_ga_tracking_event('/api/search/', 'a', 'b', 'c')
+        finally:
+            views.google_analytics_tracker = tracker
+
+        after = metrics.counters()
+        self.assertEqual(
+            2, after['ga_send_total'] - before.get('ga_send_total', 0)
+        )
+        self.assertEqual(1, after['ga_send_failures'] -
+                         before.get('ga_send_failures', 0))
+        self.assertIn('ga_send_seconds_total', after)
+
+
 class KeywordListTestCase(TestCase):
     client_class = APIClient
 
@@ -1102,6 +1541,11 @@ class KeywordListTestCase(TestCase):
         )
         kwc.full_clean()  # force model validation to happen
 
+    def setUp(self):
+        # rolling back a test doesn't send signals, so the catalogue may
+        # still hold keywords created by an earlier test
+        keyword_catalogue.invalidate()
+
     def test_get_with_show_in_home_param(self):
         Keyword.objects.create(
             name='test', show_on_home_page=True
@@ -1188,3 +1632,352 @@ class KeywordListTestCase(TestCase):
                str(self.cat2kw2.show_on_home_page).lower(), self.category_2.id)
 
         self.assertJSONEqual(response.content, expected_response_content)
+
+    def test_get_with_multiple_categories(self):
+        kwc = KeywordCategory.objects.create(
+            keyword=self.cat1kw1, category=self.category_2
+        )
+        kwc.full_clean()  # force model validation to happen
+
+        response = self.client.get(
+            '/api/keywords/',
+            {'category': [self.category_1.name, self.category_2.name.upper()]},
+            format='json'
+        )
+
+        # cat1kw1 is in both categories but should only be returned once
+        self.assertEqual(
+            sorted([self.cat1kw1.id, self.cat1kw2.id, self.cat2kw1.id,
+                    self.cat2kw2.id]),
+            sorted(keyword['id'] for keyword in response.data)
+        )
+
+    def test_get_is_cached(self):
+        self.client.get('/api/keywords/', format='json')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/keywords/', {'category': self.category_1.name},
+                format='json'
+            )
+        self.assertEqual(2, len(response.data))
+
+        # changes to keywords are picked up straight away
+        keyword = Keyword.objects.create(name='cat1kw3')
+        kwc = KeywordCategory.objects.create(
+            keyword=keyword, category=self.category_1
+        )
+        kwc.full_clean()  # force model validation to happen
+
+        response = self.client.get(
+            '/api/keywords/', {'category': self.category_1.name},
+            format='json'
+        )
+        self.assertEqual(3, len(response.data))
+
+    def test_get_not_modified(self):
+        response = self.client.get('/api/keywords/', format='json')
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+
+        response = self.client.get(
+            '/api/keywords/', format='json', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(304, response.status_code)
+        self.assertEqual('', response.content)
+
+        self.cat1kw1.show_on_home_page = True
+        self.cat1kw1.save()
+
+        response = self.client.get(
+            '/api/keywords/', format='json', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_etag_is_unchanged_by_reloads(self):
+        response = self.client.get('/api/keywords/', format='json')
+        etag = response['ETag']
+
+        # as another process would load it
+        keyword_catalogue.invalidate()
+
+        response = self.client.get(
+            '/api/keywords/', format='json', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(304, response.status_code)
+
+
+class SyncTestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        cls.country.full_clean()  # force model validation to happen
+
+        cls.category = Category.objects.create(
+            name='Test Category'
+        )
+        cls.category.full_clean()  # force model validation to happen
+
+        cls.keyword = Keyword.objects.create(
+            name='test'
+        )
+        cls.keyword.full_clean()  # force model validation to happen
+
+        cls.org_1 = Organisation.objects.create(
+            name='Test Org 1',
+            country=cls.country
+        )
+        cls.org_1.full_clean()  # force model validation to happen
+
+        oc = OrganisationCategory.objects.create(
+            organisation=cls.org_1, category=cls.category
+        )
+        oc.full_clean()  # force model validation to happen
+
+        ok = OrganisationKeyword.objects.create(
+            organisation=cls.org_1, keyword=cls.keyword
+        )
+        ok.full_clean()  # force model validation to happen
+
+        cls.org_2 = Organisation.objects.create(
+            name='Test Org 2',
+            country=cls.country
+        )
+        cls.org_2.full_clean()  # force model validation to happen
+
+    def sync(self, since=None):
+        data = {'since': since} if since else {}
+        with self.settings(SYNC_SETTLE_SECONDS=0):
+            return self.client.get('/api/sync/', data, format='json')
+
+    def test_initial_sync(self):
+        response = self.sync()
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [self.org_1.id, self.org_2.id],
+            [org['id'] for org in response.data['organisations']]
+        )
+        self.assertEqual([], response.data['deleted'])
+        self.assertFalse(response.data['more'])
+
+        org = response.data['organisations'][0]
+        self.assertEqual(self.country.iso_code, org['country']['iso_code'])
+        self.assertEqual(
+            [self.category.name],
+            [category['name'] for category in org['categories']]
+        )
+        self.assertEqual(
+            [self.keyword.name],
+            [keyword['name'] for keyword in org['keywords']]
+        )
+
+    def test_sync_since(self):
+        since = self.sync().data['next']
+
+        response = self.sync(since)
+        self.assertEqual([], response.data['organisations'])
+        self.assertEqual(since, response.data['next'])
+
+        # adding a keyword changes the organisation
+        ok = OrganisationKeyword.objects.create(
+            organisation=self.org_2, keyword=self.keyword
+        )
+        ok.full_clean()  # force model validation to happen
+
+        response = self.sync(since)
+        self.assertEqual(
+            [self.org_2.id],
+            [org['id'] for org in response.data['organisations']]
+        )
+        since = response.data['next']
+
+        # as does renaming one of its keywords
+        self.keyword.name = 'renamed'
+        self.keyword.save()
+
+        response = self.sync(since)
+        self.assertEqual(
+            [self.org_1.id, self.org_2.id],
+            sorted(org['id'] for org in response.data['organisations'])
+        )
+
+    def test_sync_deleted(self):
+        since = self.sync().data['next']
+
+        org_id = self.org_1.id
+        self.org_1.delete()
+
+        response = self.sync(since)
+        self.assertEqual([org_id], response.data['deleted'])
+        self.assertNotIn(
+            org_id, [org['id'] for org in response.data['organisations']]
+        )
+
+        response = self.sync(response.data['next'])
+        self.assertEqual([], response.data['deleted'])
+
+    def test_sync_pages(self):
+        with self.settings(SYNC_PAGE_SIZE=1):
+            response = self.sync()
+            self.assertEqual(
+                [self.org_1.id],
+                [org['id'] for org in response.data['organisations']]
+            )
+            self.assertTrue(response.data['more'])
+
+            response = self.sync(response.data['next'])
+            self.assertEqual(
+                [self.org_2.id],
+                [org['id'] for org in response.data['organisations']]
+            )
+            self.assertFalse(response.data['more'])
+
+    def test_sync_holds_back_recent_changes(self):
+        response = self.client.get('/api/sync/', format='json')
+
+        self.assertEqual([], response.data['organisations'])
+
+    def test_sync_invalid_token(self):
+        response = self.sync('not-a-token')
+
+        self.assertEqual(400, response.status_code)
+        self.assertIn('since', response.data)
+
+    def test_sync_keyword_category_changes(self):
+        since = self.sync().data['next']
+
+        # mapping the organisation's keyword to another category
+        other = Category.objects.create(name='Other Category')
+        other.full_clean()  # force model validation to happen
+        kwc = KeywordCategory.objects.create(
+            keyword=self.keyword, category=other
+        )
+        kwc.full_clean()  # force model validation to happen
+
+        response = self.sync(since)
+        self.assertEqual(
+            [self.org_1.id],
+            [org['id'] for org in response.data['organisations']]
+        )
+        since = response.data['next']
+
+        kwc.delete()
+        response = self.sync(since)
+        self.assertEqual(
+            [self.org_1.id],
+            [org['id'] for org in response.data['organisations']]
+        )
+
+    def test_sync_expired_token(self):
+        long_ago = timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS + 1
+        )
+        token = SyncToken(0, 0, 0, 0, to_microseconds(long_ago))
+
+        response = self.sync(token.encode())
+        self.assertEqual(410, response.status_code)
+        self.assertIn('since', response.data)
+
+        # it's when the client synced that counts, not what it saw
+        token = SyncToken(
+            to_microseconds(long_ago), 1, 0, 0,
+            to_microseconds(timezone.now())
+        )
+        self.assertEqual(200, self.sync(token.encode()).status_code)
+
+    def test_sync_unchanged_directory(self):
+        long_ago = timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS + 1
+        )
+        Organisation.objects.update(updated_at=long_ago)
+
+        response = self.sync()
+        self.assertEqual(2, len(response.data['organisations']))
+        response = self.sync(response.data['next'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], response.data['organisations'])
+
+        # as a snapshot holds it
+        response = self.sync(current_sync_token())
+        self.assertEqual(200, response.status_code)
+
+    def test_prune_tombstones(self):
+        self.org_1.delete()
+        self.org_2.delete()
+        OrganisationTombstone.objects.filter(
+            organisation_id=self.org_1.id
+        ).update(deleted_at=timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS + 1
+        ))
+
+        self.assertEqual(1, prune_tombstones())
+        self.assertEqual(
+            [self.org_2.id],
+            list(OrganisationTombstone.objects.values_list(
+                'organisation_id', flat=True
+            ))
+        )
+
+
+class SyncTransactionTestCase(TransactionTestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        self.country.full_clean()  # force model validation to happen
+
+    def tearDown(self):
+        signal_processor._pending.changes.clear()
+
+    def sync(self, since=None):
+        data = {'since': since} if since else {}
+        with self.settings(SYNC_SETTLE_SECONDS=0):
+            return self.client.get('/api/sync/', data, format='json')
+
+    def test_sync_holds_back_changes_after_open_transactions(self):
+        written = threading.Event()
+        commit = threading.Event()
+        created = []
+
+        def long_transaction():
+            # (eg: an admin import)
+            try:
+                with transaction.atomic():
+                    created.append(Organisation.objects.create(
+                        name='Imported', country=self.country
+                    ))
+                    written.set()
+                    commit.wait()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=long_transaction)
+        thread.start()
+        written.wait()
+
+        later = Organisation.objects.create(
+            name='Test Org', country=self.country
+        )
+        later.full_clean()  # force model validation to happen
+
+        response = self.sync()
+        self.assertEqual([], response.data['organisations'])
+
+        commit.set()
+        thread.join()
+
+        response = self.sync(response.data['next'])
+        self.assertEqual(
+            [created[0].id, later.id],
+            [org['id'] for org in response.data['organisations']]
+        )
@@ -0,0 +1,67 @@
+import threading
+
+from django.test import SimpleTestCase, override_settings
+from service_directory.api import metrics
+from service_directory.api.background import BackgroundDispatcher
+
+
+class BackgroundDispatcherTestCase(SimpleTestCase):
+    def test_dispatch(self):
+        dispatcher = BackgroundDispatcher()
+        threads = []
+
+        for i in range(5):
+            dispatcher.dispatch(
+                lambda: threads.append(threading.current_thread())
+            )
+        dispatcher.join()
+
+        self.assertEqual(5, len(threads))
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_failures_dont_stop_the_workers(self):
+        dispatcher = BackgroundDispatcher()
+        calls = []
+
+        for i in range(3):
+            dispatcher.dispatch(lambda: 1 / 0)
+        dispatcher.dispatch(calls.append, 'still working')
+        dispatcher.join()
+
+        self.assertEqual(['still working'], calls)
+
+    @override_settings(BACKGROUND_WORKERS=1, BACKGROUND_QUEUE_SIZE=1)
+    def test_drops_calls_when_full(self):
+        dispatcher = BackgroundDispatcher()
+        release = threading.Event()
+        started = threading.Event()
+        calls = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        dispatcher.dispatch(block)
+        started.wait()
+        dropped = metrics.counters().get('background_dropped', 0)
+
+        dispatcher.dispatch(calls.append, 1)  # queued
+        dispatcher.dispatch(calls.append, 2)  # dropped
+        release.set()
+        dispatcher.join()
+
+        self.assertEqual([1], calls)
+        self.assertEqual(
+            dropped + 1, metrics.counters().get('background_dropped', 0)
+        )
+
+    @override_settings(BACKGROUND_WORKERS=0)
+    def test_without_workers(self):
+        dispatcher = BackgroundDispatcher()
+        threads = []
+
+        dispatcher.dispatch(
+            lambda: threads.append(threading.current_thread())
+        )
+
+        self.assertEqual([threading.current_thread()], threads)
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+from service_directory.benchmarks.runner import ScenarioResult, \
+    check_budgets, percentile
+
+
+class ScenarioResultTestCase(SimpleTestCase):
+    def test_summary(self):
+        result = ScenarioResult('search')
+        for latency in (0.01, 0.02, 0.03, 0.04):
+            result.add(latency, 2, 200, 100)
+            result.elapsed += latency
+        result.add(0.1, 4, 500, 50)
+        result.elapsed += 0.1
+
+        summary = result.summary()
+        self.assertEqual(5, summary['requests'])
+        self.assertEqual(1, summary['errors'])
+        self.assertEqual(30.0, summary['p50_ms'])
+        self.assertEqual(100.0, summary['p99_ms'])
+        self.assertEqual(25.0, summary['rps'])
+        self.assertEqual(2.4, summary['queries_mean'])
+        self.assertEqual(4, summary['queries_max'])
+        self.assertEqual(90, summary['bytes_mean'])
+
+    def test_summary_without_requests(self):
+        summary = ScenarioResult('search').summary()
+        self.assertEqual(0, summary['requests'])
+        self.assertIsNone(summary['p95_ms'])
+        self.assertIsNone(summary['queries_mean'])
+
+        # and budgets aren't checked against it
+        self.assertEqual([], check_budgets(
+            {'search': summary}, {'search': {'p95_ms': 50, 'rps': 10}}
+        ))
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(1, percentile([1], 99))
+        self.assertEqual(2, percentile([1, 2, 3, 4], 50))
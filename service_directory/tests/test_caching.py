@@ -0,0 +1,240 @@
+import threading
+
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, \
+    override_settings
+from service_directory.api import caching, metrics
+from service_directory.api.caching import MISSING, CacheNamespace, \
+    LocalCache
+from service_directory.api.catalogue import keyword_catalogue
+from service_directory.api.models import Category, Country, Keyword, \
+    KeywordCategory, Organisation
+
+
+class LocalCacheTestCase(SimpleTestCase):
+    @override_settings(CACHE_L1_SIZE=2)
+    def test_evicts_least_recently_used(self):
+        cache = LocalCache()
+        self.assertEqual(0, cache.set('a', 1, 100))
+        self.assertEqual(0, cache.set('b', 2, 100))
+        cache.get('a', 0)
+        self.assertEqual(1, cache.set('c', 3, 100))
+
+        self.assertEqual(1, cache.get('a', 0))
+        self.assertIs(MISSING, cache.get('b', 0))
+        self.assertEqual(3, cache.get('c', 0))
+
+    def test_expires(self):
+        cache = LocalCache()
+        cache.set('a', None, 100)
+        self.assertIsNone(cache.get('a', 99))
+        self.assertIs(MISSING, cache.get('a', 100))
+
+
+@override_settings(CACHE_L1_SECONDS=5, CACHE_VERSION_SECONDS=1,
+                   CACHE_TIMEOUT=300)
+class CacheNamespaceTestCase(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.now = 1000.0
+
+    def namespace(self, name='test'):
+        # as each process would have
+        namespace = CacheNamespace(name)
+        namespace.clock = lambda: self.now
+        return namespace
+
+    def counts(self, name='test'):
+        counters = metrics.counters()
+        return dict(
+            (event, counters.get('cache_{0}_{1}'.format(name, event), 0))
+            for event in ('l1_hits', 'l2_hits', 'misses', 'evictions',
+                          'invalidations')
+        )
+
+    def assertCounted(self, before, **expected):
+        after = self.counts()
+        self.assertEqual(
+            expected,
+            dict(
+                (event, after[event] - before[event]) for event in after
+                if after[event] != before[event]
+            )
+        )
+
+    def test_tiers(self):
+        first, second = self.namespace(), self.namespace()
+
+        before = self.counts()
+        self.assertIsNone(first.get('key'))
+        first.set('key', {'id': 1})
+        self.assertEqual({'id': 1}, first.get('key'))
+        self.assertEqual({'id': 1}, second.get('key'))
+        self.assertEqual({'id': 1}, second.get('key'))
+        self.assertCounted(before, misses=1, l1_hits=2, l2_hits=1)
+
+        # expired from the local cache
+        self.now += 6
+        before = self.counts()
+        self.assertEqual({'id': 1}, first.get('key'))
+        self.assertCounted(before, l2_hits=1)
+
+    def test_invalidation(self):
+        first, second = self.namespace(), self.namespace()
+        first.set('key', 'value')
+        self.assertEqual('value', second.get('key'))
+
+        before = self.counts()
+        first.invalidate()
+        self.assertIsNone(first.get('key'))
+        # until the other process rechecks the version
+        self.assertEqual('value', second.get('key'))
+        self.now += 1
+        self.assertIsNone(second.get('key'))
+        self.assertCounted(before, invalidations=1, misses=2, l1_hits=1)
+
+        # other namespaces aren't affected
+        other = self.namespace('other')
+        other.set('key', 'value')
+        first.invalidate()
+        self.assertEqual('value', self.namespace('other').get('key'))
+
+    def test_evicted_versions_start_afresh(self):
+        namespace = self.namespace()
+        namespace.set('key', 'value')
+
+        caches['default'].delete(namespace.version_key)
+        namespace.invalidate()
+        self.now += 1
+        self.assertIsNone(namespace.get('key'))
+
+    @override_settings(CACHE_L1_SIZE=1)
+    def test_counts_evictions(self):
+        namespace = self.namespace()
+
+        before = self.counts()
+        namespace.set('a', 1)
+        namespace.set('b', 2)
+        self.assertCounted(before, evictions=1)
+
+    def test_add_and_delete(self):
+        namespace = self.namespace()
+
+        self.assertTrue(namespace.add('lock', True))
+        self.assertFalse(self.namespace().add('lock', True))
+        namespace.delete('lock')
+        self.assertTrue(self.namespace().add('lock', True))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+    }})
+    def test_without_a_shared_cache(self):
+        namespace = self.namespace()
+        namespace.set('key', 'value')
+        self.assertEqual('value', namespace.get('key'))
+
+        namespace.invalidate()
+        self.assertIsNone(namespace.get('key'))
+
+
+class NamespaceSignalsTestCase(TestCase):
+    def setUp(self):
+        caching.clear_local_caches()
+
+    def versions(self):
+        return dict(
+            (name, namespace.version())
+            for name, namespace in caching.namespaces.items()
+        )
+
+    def assertInvalidates(self, names, func):
+        before = self.versions()
+        result = func()
+        after = self.versions()
+        self.assertEqual(
+            set(names),
+            set(name for name in after if after[name] != before[name])
+        )
+        return result
+
+    def test_models_invalidate_their_namespaces(self):
+        category = self.assertInvalidates(
+            ['keywords', 'organisations'],
+            lambda: Category.objects.create(name='Test Category')
+        )
+        keyword = self.assertInvalidates(
+            ['keywords', 'organisations'],
+            lambda: Keyword.objects.create(name='test')
+        )
+        self.assertInvalidates(
+            ['keywords', 'organisations'],
+            lambda: KeywordCategory.objects.create(
+                keyword=keyword, category=category
+            )
+        )
+        country = self.assertInvalidates(
+            ['organisations'],
+            lambda: Country.objects.create(name='South Africa', iso_code='ZA')
+        )
+        organisation = self.assertInvalidates(
+            ['organisations'],
+            lambda: Organisation.objects.create(
+                name='Netcare', country=country
+            )
+        )
+        self.assertInvalidates(['organisations'], organisation.delete)
+
+    def test_keyword_catalogue(self):
+        keyword_catalogue.invalidate()
+        self.assertEqual([], keyword_catalogue.snapshot().keywords)
+
+        keyword = Keyword.objects.create(name='test')
+        keyword.full_clean()  # force model validation to happen
+
+        self.assertEqual(
+            ['test'],
+            [item['name'] for item in keyword_catalogue.snapshot().keywords]
+        )
+
+
+class InvalidateOnCommitTestCase(TransactionTestCase):
+    def setUp(self):
+        caching.clear_local_caches()
+        keyword_catalogue.invalidate()
+
+    def test_keyword_catalogue_reloaded_during_a_transaction(self):
+        def reload_elsewhere():
+            # another request, which can't see the uncommitted keyword
+            try:
+                keyword_catalogue.snapshot()
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            Keyword.objects.create(name='test')
+            thread = threading.Thread(target=reload_elsewhere)
+            thread.start()
+            thread.join()
+            # its snapshot, cached under the bumped version
+            self.assertEqual([], keyword_catalogue.snapshot().keywords)
+
+        self.assertEqual(
+            ['test'],
+            [item['name'] for item in keyword_catalogue.snapshot().keywords]
+        )
+
+    def test_not_invalidated_after_rollback(self):
+        version = caching.namespace('keywords').version()
+        try:
+            with transaction.atomic():
+                Keyword.objects.create(name='test')
+                raise ValueError()
+        except ValueError:
+            pass
+        bumped = caching.namespace('keywords').version()
+        self.assertNotEqual(version, bumped)
+
+        with transaction.atomic():
+            pass
+        self.assertEqual(bumped, caching.namespace('keywords').version())
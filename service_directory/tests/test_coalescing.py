@@ -0,0 +1,212 @@
+import threading
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from haystack import signal_processor
+from rest_framework.test import APIClient
+from service_directory.api import caching, metrics
+from service_directory.api.coalescing import Coalescer, SingleFlight
+from service_directory.api.models import Country, Organisation
+from service_directory.tests.query_budgets import record_calls
+from service_directory.tests.test_api import reset_haystack_index
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def run_concurrently(self, single_flight, key, func, count):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(single_flight.do(key, func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_concurrent_calls_share_one_result(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait()
+            return {'id': 1}
+
+        coalesced = metrics.counters().get('coalesced_requests', 0)
+        threads, results, errors = self.run_concurrently(
+            single_flight, 'key', compute, 5
+        )
+        # until they're all waiting on the first
+        while (metrics.counters().get('coalesced_requests', 0) <
+               coalesced + 4):
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([{'id': 1}] * 5, results)
+        self.assertEqual([], errors)
+
+        # and once it's done, the next call computes it again
+        self.assertEqual({'id': 1}, single_flight.do('key', compute))
+        self.assertEqual(2, len(calls))
+
+    def test_different_keys(self):
+        single_flight = SingleFlight()
+        self.assertEqual(1, single_flight.do('a', lambda: 1))
+        self.assertEqual(2, single_flight.do('b', lambda: 2))
+
+    def test_errors_are_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait()
+            raise ValueError('failed')
+
+        coalesced = metrics.counters().get('coalesced_requests', 0)
+        threads, results, errors = self.run_concurrently(
+            single_flight, 'key', fail, 3
+        )
+        while (metrics.counters().get('coalesced_requests', 0) <
+               coalesced + 2):
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], results)
+        self.assertEqual(3, len(errors))
+        self.assertEqual({ValueError}, set(type(e) for e in errors))
+
+
+@override_settings(COALESCE_SHARED=True, COALESCE_FRESH_SECONDS=5,
+                   COALESCE_STALE_SECONDS=30, COALESCE_WAIT_SECONDS=1)
+class CoalescerCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caching.clear_local_caches()
+        self.cache = caching.namespace('organisations')
+        self.now = 1000.0
+        self.coalescer = Coalescer()
+        self.coalescer.clock = lambda: self.now
+        self.coalescer.sleep = self.tick
+        self.calls = []
+
+    def tick(self, seconds):
+        self.now += seconds
+
+    def compute(self):
+        self.calls.append(self.now)
+        return len(self.calls)
+
+    def get(self, key):
+        return self.coalescer.get(key, self.compute, 'organisations')
+
+    def test_caches_results(self):
+        self.assertEqual(1, self.get('key'))
+        self.now += 4
+        self.assertEqual(1, self.get('key'))
+        self.assertEqual(2, self.get('other'))
+
+    def test_refreshes_expired_results(self):
+        self.get('key')
+        self.now += 6
+        self.assertEqual(2, self.get('key'))
+        self.assertEqual(2, self.get('key'))
+
+    @override_settings(COALESCE_SHARED=False)
+    def test_without_cache(self):
+        self.assertEqual(1, self.get('key'))
+        self.assertEqual(2, self.get('key'))
+
+    def test_serves_stale_results_while_refreshing(self):
+        self.get('key')
+        self.now += 6
+        self.cache.add('coalesce:key:lock', True)
+
+        self.assertEqual(1, self.get('key'))
+        self.assertEqual(1, len(self.calls))
+
+    def test_waits_for_other_processes(self):
+        self.cache.add('coalesce:key:lock', True)
+
+        def computed_elsewhere(seconds):
+            # the other process finishes
+            self.tick(seconds)
+            self.cache.set('coalesce:key', (self.now + 5, 'other'))
+
+        self.coalescer.sleep = computed_elsewhere
+        self.assertEqual('other', self.get('key'))
+        self.assertEqual([], self.calls)
+
+    def test_stops_waiting(self):
+        self.cache.add('coalesce:key:lock', True)
+
+        self.assertEqual(1, self.get('key'))
+        self.assertEqual(1, len(self.calls))
+
+
+@override_settings(COALESCE_SHARED=True)
+class CoalescedViewsTestCase(TestCase):
+    client_class = APIClient
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def setUp(self):
+        caches['default'].clear()
+        caching.clear_local_caches()
+        reset_haystack_index()
+
+        country = Country.objects.create(name='South Africa', iso_code='ZA')
+        country.full_clean()  # force model validation to happen
+
+        self.organisation = Organisation.objects.create(
+            name='Netcare Christiaan Barnard Memorial Hospital',
+            country=country
+        )
+        self.organisation.full_clean()  # force model validation to happen
+        signal_processor.flush_changes()
+
+    def test_search(self):
+        first = self.client.get(
+            '/api/search/', {'search_term': 'netcare', 'fields': 'id,name'}
+        )
+        with record_calls() as calls:
+            # the same parameters, in a different order
+            second = self.client.get(
+                '/api/search/?fields=id,name&search_term=netcare'
+            )
+
+        self.assertEqual(0, calls.es)
+        self.assertEqual(0, calls.sql)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['X-Search-Tier'], second['X-Search-Tier'])
+        self.assertEqual(
+            [{'id': self.organisation.pk, 'name': self.organisation.name}],
+            second.data
+        )
+
+        different = self.client.get('/api/search/', {'search_term': 'red'})
+        self.assertEqual([], different.data)
+
+    def test_organisation_detail(self):
+        url = '/api/organisation/{0}/'.format(self.organisation.pk)
+        first = self.client.get(url, {'fields': 'name'})
+        with record_calls() as calls:
+            second = self.client.get(url, {'fields': 'name'})
+
+        self.assertEqual(0, calls.sql)
+        self.assertEqual({'name': self.organisation.name}, second.data)
+        self.assertEqual(first.data, second.data)
+
+        response = self.client.get('/api/organisation/0/')
+        self.assertEqual(404, response.status_code)
@@ -0,0 +1,104 @@
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from haystack import signal_processor
+from rest_framework.test import APIClient
+from service_directory.api.index_verification import compare, \
+    verify_index
+from service_directory.api.models import Country, Organisation
+from service_directory.tests.test_api import reset_haystack_index
+
+
+class CompareTestCase(SimpleTestCase):
+    def test_merge_joins_in_pk_order(self):
+        database = [(1, 'a', 'one'), (2, 'b', 'two'), (4, 'd', 'four')]
+        index = [(1, 'a'), (2, 'x'), (3, 'c'), (5, 'e')]
+
+        self.assertEqual([
+            ('ok', 1, 'one'),
+            ('stale', 2, 'two'),
+            ('orphaned', 3, None),
+            ('missing', 4, 'four'),
+            ('orphaned', 5, None),
+        ], list(compare(database, index)))
+
+    def test_empty(self):
+        self.assertEqual([], list(compare([], [])))
+        self.assertEqual(
+            [('missing', 1, 'one')], list(compare([(1, 'a', 'one')], []))
+        )
+
+
+class VerifyIndexTestCase(TestCase):
+    client_class = APIClient
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def setUp(self):
+        reset_haystack_index()
+
+        self.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        self.country.full_clean()  # force model validation to happen
+
+        self.organisations = []
+        for name in ('Netcare', 'Groote Schuur', 'Red Cross'):
+            organisation = Organisation.objects.create(
+                name=name,
+                country=self.country
+            )
+            organisation.full_clean()  # force model validation to happen
+            self.organisations.append(organisation)
+
+        signal_processor.flush_changes()
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params, format='json')
+        return [organisation['id'] for organisation in response.data]
+
+    def make_drift(self):
+        netcare, groote_schuur, red_cross = self.organisations
+
+        # updates and bulk creates don't send signals
+        Organisation.objects.filter(pk=groote_schuur.pk).update(
+            name='Tygerberg'
+        )
+        Organisation.objects.bulk_create([
+            Organisation(name='Lifeline', country=self.country)
+        ])
+        missing = Organisation.objects.get(name='Lifeline')
+
+        red_cross.delete()
+        signal_processor._pending.changes.clear()
+
+        return netcare, groote_schuur, red_cross, missing
+
+    def test_finds_drift(self):
+        self.make_drift()
+
+        expected = {'ok': 1, 'missing': 1, 'orphaned': 1, 'stale': 1}
+        self.assertEqual(expected, verify_index(repair=False))
+        self.assertEqual(expected, verify_index(repair=False))
+
+    def test_repairs_drift(self):
+        netcare, groote_schuur, red_cross, missing = self.make_drift()
+
+        self.assertEqual(
+            {'ok': 1, 'missing': 1, 'orphaned': 1, 'stale': 1},
+            verify_index(chunk_size=2)
+        )
+        self.assertEqual(
+            {'ok': 3, 'missing': 0, 'orphaned': 0, 'stale': 0},
+            verify_index(chunk_size=2)
+        )
+
+        self.assertEqual(
+            sorted([netcare.pk, groote_schuur.pk, missing.pk]),
+            sorted(self.search())
+        )
+        self.assertEqual(
+            [groote_schuur.pk], self.search(search_term='tygerberg')
+        )
+        self.assertEqual([missing.pk], self.search(search_term='lifeline'))
@@ -0,0 +1,85 @@
+from django.core.signals import request_started
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from service_directory.api import metrics
+
+
+class ConnectionHealthCheckTestCase(TransactionTestCase):
+    def counter(self, name):
+        return metrics.counters().get(name, 0)
+
+    def query(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0]
+
+    def test_reuses_healthy_connection(self):
+        self.query()
+        reuses = self.counter('db_connection_reuses')
+        opens = self.counter('db_connection_opens')
+        raw_connection = connection.connection
+
+        request_started.send(sender=self.__class__)
+        self.assertEqual(1, self.query())
+        # checked once per request
+        self.assertEqual(1, self.query())
+
+        self.assertIs(raw_connection, connection.connection)
+        self.assertEqual(reuses + 1, self.counter('db_connection_reuses'))
+        self.assertEqual(opens, self.counter('db_connection_opens'))
+
+    def test_replaces_broken_connection(self):
+        self.query()
+        failures = self.counter('db_connection_failures')
+        opens = self.counter('db_connection_opens')
+
+        # as if the server had been restarted
+        connection.connection.close()
+
+        request_started.send(sender=self.__class__)
+        self.assertEqual(1, self.query())
+
+        self.assertEqual(failures + 1, self.counter('db_connection_failures'))
+        self.assertEqual(opens + 1, self.counter('db_connection_opens'))
+
+
+class OnCommitTestCase(TransactionTestCase):
+    def test_called_after_commit(self):
+        calls = []
+        with transaction.atomic():
+            connection.on_commit(lambda: calls.append('outer'))
+            with transaction.atomic():
+                connection.on_commit(lambda: calls.append('inner'))
+            self.assertEqual([], calls)
+        self.assertEqual(['outer', 'inner'], calls)
+
+    def test_called_once(self):
+        calls = []
+
+        def func():
+            calls.append(1)
+
+        with transaction.atomic():
+            connection.on_commit(func)
+            connection.on_commit(func)
+        self.assertEqual([1], calls)
+
+    def test_not_called_after_rollback(self):
+        calls = []
+        try:
+            with transaction.atomic():
+                connection.on_commit(lambda: calls.append(1))
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual([], calls)
+
+        # or left for the next transaction
+        with transaction.atomic():
+            pass
+        self.assertEqual([], calls)
+
+    def test_called_now_outside_transactions(self):
+        calls = []
+        connection.on_commit(lambda: calls.append(1))
+        self.assertEqual([1], calls)
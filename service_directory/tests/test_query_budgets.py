@@ -0,0 +1,173 @@
+from django.core.management import call_command
+from service_directory.api.catalogue import keyword_catalogue
+from service_directory.api.models import Organisation
+from service_directory.api.search_indexes import OrganisationIndex
+from service_directory.tests.query_budgets import QueryBudgetTestCase
+from service_directory.tests.test_api import reset_haystack_index
+
+
+class APIQueryBudgetTestCase(QueryBudgetTestCase):
+    def setUp(self):
+        reset_haystack_index()
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def test_search(self):
+        self.assertWithinBudget(
+            'search',
+            lambda: self.client.get('/api/search/', format='json')
+        )
+
+    def test_search_with_search_term(self):
+        self.assertWithinBudget(
+            'search_term',
+            lambda: self.client.get(
+                '/api/search/', {'search_term': 'organisation'},
+                format='json'
+            )
+        )
+
+    def test_home_page(self):
+        self.assertWithinBudget(
+            'home_page',
+            lambda: self.client.get(
+                '/api/homepage_categories_keywords/', format='json'
+            )
+        )
+
+    def test_keywords(self):
+        self.assertWithinBudget(
+            'keywords',
+            lambda: self.client.get('/api/keywords/', format='json')
+        )
+
+    def test_keywords_in_category(self):
+        self.assertWithinBudget(
+            'keywords_in_category',
+            lambda: self.client.get(
+                '/api/keywords/', {'category': self.categories[0].name},
+                format='json'
+            )
+        )
+
+    def test_organisation(self):
+        self.assertWithinBudget(
+            'organisation',
+            lambda: self.client.get(
+                '/api/organisation/{0}/'.format(self.organisation_pk()),
+                format='json'
+            )
+        )
+
+    def test_search_facets(self):
+        keyword_catalogue.invalidate()
+        self.assertWithinBudget(
+            'search_facets',
+            lambda: self.client.get(
+                '/api/search/', {'facets': 'categories,keywords,country'},
+                format='json'
+            )
+        )
+
+    def test_multi_search(self):
+        searches = [
+            {'search_term': self.keywords[0].name},
+            {'search_term': 'nothing like it'},
+            {'keywords': [self.keywords[0].name]},
+        ]
+        self.assertWithinBudget(
+            'multi_search',
+            lambda: self.client.post(
+                '/api/multi_search/', {'searches': searches}, format='json'
+            )
+        )
+
+    def test_organisations(self):
+        ids = Organisation.objects.values_list('pk', flat=True)[:50]
+        self.assertWithinBudget(
+            'organisations',
+            lambda: self.client.get(
+                '/api/organisations/',
+                {'ids': ','.join(str(pk) for pk in ids)}, format='json'
+            )
+        )
+
+    def test_sync(self):
+        with self.settings(SYNC_SETTLE_SECONDS=0):
+            self.assertWithinBudget(
+                'sync',
+                lambda: self.client.get('/api/sync/', format='json')
+            )
+
+    def test_organisation_sparse(self):
+        self.assertWithinBudget(
+            'organisation_sparse',
+            lambda: self.client.get(
+                '/api/organisation/{0}/'.format(self.organisation_pk()),
+                {'fields': 'id,name,distance'}, format='json'
+            )
+        )
+
+    def test_search_sparse(self):
+        self.assertWithinBudget(
+            'search_sparse',
+            lambda: self.client.get(
+                '/api/search/', {'fields': 'id,name,distance'},
+                format='json'
+            )
+        )
+
+    def test_index_organisations(self):
+        index = OrganisationIndex()
+        backend = index._get_backend(None)
+
+        self.assertWithinBudget(
+            'index_organisations',
+            lambda: backend.update(index, index.index_queryset())
+        )
+
+    def organisation_pk(self):
+        return self.keywords[0].organisation_set.latest('pk').pk
+
+
+class AdminQueryBudgetTestCase(QueryBudgetTestCase):
+    def setUp(self):
+        reset_haystack_index()
+        self.login_admin()
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def test_country_changelist(self):
+        self.assertWithinBudget(
+            'admin:country',
+            lambda: self.client.get('/admin/api/country/')
+        )
+
+    def test_category_changelist(self):
+        self.assertWithinBudget(
+            'admin:category',
+            lambda: self.client.get('/admin/api/category/')
+        )
+
+    def test_keyword_changelist(self):
+        self.assertWithinBudget(
+            'admin:keyword',
+            lambda: self.client.get('/admin/api/keyword/')
+        )
+
+    def test_organisation_changelist(self):
+        self.assertWithinBudget(
+            'admin:organisation',
+            lambda: self.client.get('/admin/api/organisation/')
+        )
+
+    def test_organisation_changelist_search(self):
+        self.assertWithinBudget(
+            'admin:organisation',
+            lambda: self.client.get(
+                '/admin/api/organisation/',
+                {'q': 'Organisation', 'country__id__exact': self.country.pk}
+            )
+        )
@@ -0,0 +1,151 @@
+import gzip
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from service_directory.api.catalogue import keyword_catalogue
+from service_directory.api.middleware import CompressionMiddleware
+from service_directory.api.models import Country, Keyword, Organisation
+from service_directory.api.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTestCase(SimpleTestCase):
+    data = [
+        OrderedDict([
+            ('id', 1),
+            ('name', u'Caf\xe9 \u2028 \u2029 "quoted" </script>'),
+            ('at', datetime(2016, 4, 5, 15, 26)),
+            ('rating', Decimal('1.10')),
+            ('point', (1, 2)),
+            ('empty', None),
+        ])
+    ]
+
+    def test_render_matches_json_renderer(self):
+        self.assertEqual(
+            JSONRenderer().render(self.data),
+            FastJSONRenderer().render(self.data)
+        )
+
+    def test_render_indented(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            JSONRenderer().render(self.data, media_type),
+            FastJSONRenderer().render(self.data, media_type)
+        )
+
+    def test_render_none(self):
+        self.assertEqual(b'', FastJSONRenderer().render(None))
+
+
+class CompressionTestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(20):
+            keyword = Keyword.objects.create(name='keyword {0}'.format(i))
+            keyword.full_clean()  # force model validation to happen
+
+    def setUp(self):
+        keyword_catalogue.invalidate()
+        CompressionMiddleware.cache.clear()
+
+    def test_gzip(self):
+        uncompressed = self.client.get('/api/keywords/', format='json')
+        self.assertFalse(uncompressed.has_header('Content-Encoding'))
+        self.assertEqual('Accept-Encoding', uncompressed['Vary'])
+
+        response = self.client.get(
+            '/api/keywords/', format='json',
+            HTTP_ACCEPT_ENCODING='gzip;q=1.0, br;q=0'
+        )
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(str(len(response.content)),
+                         response['Content-Length'])
+        self.assertLess(len(response.content), len(uncompressed.content))
+        self.assertEqual(
+            uncompressed.content,
+            gzip.GzipFile(fileobj=BytesIO(response.content)).read()
+        )
+
+    def test_compressed_once(self):
+        self.client.get(
+            '/api/keywords/', format='json', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.client.get(
+            '/api/keywords/', format='json', HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertEqual(1, len(CompressionMiddleware.cache._entries))
+
+    def test_not_acceptable(self):
+        response = self.client.get(
+            '/api/keywords/', format='json', HTTP_ACCEPT_ENCODING='identity'
+        )
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_only_api_json(self):
+        User.objects.create_superuser('admin', 'admin@example.org', 'admin')
+        self.client.login(username='admin', password='admin')
+
+        response = self.client.get(
+            '/admin/api/keyword/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        # the browsable API
+        response = self.client.get(
+            '/api/keywords/', HTTP_ACCEPT='text/html',
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_compressed_etags_are_weak(self):
+        uncompressed = self.client.get('/api/keywords/', format='json')
+        response = self.client.get(
+            '/api/keywords/', format='json', HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual('W/' + uncompressed['ETag'], response['ETag'])
+
+        response = self.client.get(
+            '/api/keywords/', format='json', HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(304, response.status_code)
+
+
+class ContentETagTestCase(TestCase):
+    client_class = APIClient
+
+    def test_cacheable_responses(self):
+        country = Country.objects.create(name='South Africa', iso_code='ZA')
+        country.full_clean()  # force model validation to happen
+        organisation = Organisation.objects.create(
+            name='Netcare', country=country
+        )
+        organisation.full_clean()  # force model validation to happen
+        url = '/api/organisation/{0}/'.format(organisation.pk)
+
+        response = self.client.get(url, format='json')
+        etag = response['ETag']
+
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+
+    def test_other_responses(self):
+        response = self.client.get('/api/sync/', format='json')
+
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('ETag'))
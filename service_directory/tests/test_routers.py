@@ -0,0 +1,156 @@
+from django.db import OperationalError, ProgrammingError
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.test.client import RequestFactory
+from service_directory.api import routers
+from service_directory.api.middleware import ReplicaRoutingMiddleware
+from service_directory.api.models import Organisation
+from service_directory.api.routers import ReadReplicaRouter, ReplicaPool
+from service_directory.api.views import OrganisationDetail, Sync
+
+
+class FakeReplicaPool(ReplicaPool):
+    def __init__(self, down=()):
+        super(FakeReplicaPool, self).__init__()
+        self.down = set(down)
+
+    def is_healthy(self, alias):
+        return alias not in self.down
+
+    def failed(self, alias):
+        # (there's no connection to close)
+        self.eject(alias)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'],
+                   REPLICA_EJECT_SECONDS=30)
+class ReplicaPoolTestCase(SimpleTestCase):
+    def test_round_robin(self):
+        pool = FakeReplicaPool()
+        self.assertEqual(
+            ['replica1', 'replica2', 'replica1', 'replica2'],
+            [pool.choose() for i in range(4)]
+        )
+
+    def test_ejects_unhealthy_replicas(self):
+        pool = FakeReplicaPool(down=['replica1'])
+        self.assertEqual(
+            ['replica2', 'replica2', 'replica2'],
+            [pool.choose() for i in range(3)]
+        )
+        self.assertTrue(pool.is_ejected('replica1'))
+
+        # ejected replicas aren't checked again until REPLICA_EJECT_SECONDS
+        # have passed
+        pool.down.clear()
+        self.assertEqual('replica2', pool.choose())
+        self.assertEqual('replica2', pool.choose())
+
+        with self.settings(REPLICA_EJECT_SECONDS=0):
+            self.assertEqual(
+                set(['replica1', 'replica2']),
+                set(pool.choose() for i in range(2))
+            )
+
+    def test_falls_back_to_primary(self):
+        pool = FakeReplicaPool(down=['replica1', 'replica2'])
+        self.assertEqual('default', pool.choose())
+
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual('default', FakeReplicaPool().choose())
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReadReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.pool = routers.replica_pool
+        routers.replica_pool = FakeReplicaPool()
+        self.router = ReadReplicaRouter()
+        self.middleware = ReplicaRoutingMiddleware()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        routers.replica_pool = self.pool
+        routers.use_replicas(False)
+
+    def route(self, request, view=OrganisationDetail):
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, view.as_view(), (), {})
+        return self.router.db_for_read(Organisation)
+
+    def test_api_reads_use_a_replica(self):
+        request = self.factory.get('/api/organisation/1/')
+        self.assertEqual('replica1', self.route(request))
+        # for the rest of the request
+        self.assertEqual('replica1', self.router.db_for_read(Organisation))
+        self.assertEqual('default', self.router.db_for_write(Organisation))
+
+        self.middleware.process_response(request, HttpResponse())
+        self.assertEqual('default', self.router.db_for_read(Organisation))
+
+        request = self.factory.get('/api/organisation/1/')
+        self.assertEqual('replica2', self.route(request))
+
+    def test_other_reads_use_the_primary(self):
+        self.assertEqual('default', self.router.db_for_read(Organisation))
+        self.assertEqual(
+            'default', self.route(self.factory.post('/api/organisation/1/'))
+        )
+        self.assertEqual(
+            'default', self.route(self.factory.get('/admin/api/keyword/'))
+        )
+        self.assertEqual(
+            'default', self.route(self.factory.get('/api/sync/'), view=Sync)
+        )
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        request = self.factory.post('/api/organisation/1/rate/')
+        self.route(request)
+        response = self.middleware.process_response(request, HttpResponse())
+
+        cookie = response.cookies['use_primary_db']
+        self.assertEqual(10, cookie['max-age'])
+
+        request = self.factory.get('/api/organisation/1/')
+        request.COOKIES['use_primary_db'] = cookie.value
+        self.assertEqual('default', self.route(request))
+
+    def test_failed_replicas_are_retried_on_the_primary(self):
+        def view(request):
+            if self.router.db_for_read(Organisation) != 'default':
+                raise OperationalError('server closed the connection')
+            return HttpResponse('retried')
+
+        request = self.factory.get('/api/organisation/1/')
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, view, (), {})
+        try:
+            view(request)
+        except OperationalError as e:
+            response = self.middleware.process_exception(request, e)
+
+        self.assertEqual('retried', response.content)
+        self.assertTrue(routers.replica_pool.is_ejected('replica1'))
+
+    def test_other_errors_are_not_retried(self):
+        request = self.factory.get('/api/organisation/1/')
+        self.route(request)
+        self.assertIsNone(self.middleware.process_exception(
+            request, ProgrammingError('relation does not exist')
+        ))
+        self.assertFalse(routers.replica_pool.is_ejected('replica1'))
+
+    def test_primary_reads(self):
+        self.route(self.factory.get('/api/organisation/1/'))
+        with routers.primary_reads():
+            self.assertEqual('default', self.router.db_for_read(Organisation))
+        # back to the same replica
+        self.assertEqual('replica1', self.router.db_for_read(Organisation))
+
+    def test_no_sticky_cookie_without_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            request = self.factory.post('/api/organisation/1/rate/')
+            response = self.middleware.process_response(
+                request, HttpResponse()
+            )
+        self.assertNotIn('use_primary_db', response.cookies)
@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from haystack import signal_processor
+from pytz import utc
+from rest_framework.test import APIClient
+from service_directory.api.models import Country, Organisation, \
+    SearchQueryHourly, SearchQueryLog
+from service_directory.api.search_log import normalise_search, \
+    rollup_search_log, apply_retention, search_log
+from service_directory.tests.test_api import reset_haystack_index
+
+
+class NormaliseSearchTestCase(SimpleTestCase):
+    def test_equivalent_searches_are_the_same(self):
+        self.assertEqual(
+            normalise_search({
+                'search_term': ' Heart  Clinic',
+                'keywords': ['HIV', 'aids'],
+                'location': Point(18.424101, -33.921387, srid=4326),
+                'country': 'za',
+            }),
+            normalise_search({
+                'country': 'ZA',
+                'keywords': ['aids', 'hiv'],
+                'location': Point(18.4239, -33.9209, srid=4326),
+                'search_term': 'heart clinic',
+            })
+        )
+        self.assertEqual(
+            'country=ZA&keywords=aids&keywords=hiv&'
+            'location=-33.92%2C18.42&search_term=heart+clinic',
+            normalise_search({
+                'search_term': 'Heart Clinic',
+                'keywords': ['HIV', 'aids'],
+                'location': Point(18.424101, -33.921387, srid=4326),
+                'country': 'za',
+            })
+        )
+
+
+class SearchLogTestCase(TestCase):
+    client_class = APIClient
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def setUp(self):
+        reset_haystack_index()
+
+        country = Country.objects.create(name='South Africa', iso_code='ZA')
+        country.full_clean()  # force model validation to happen
+
+        organisation = Organisation.objects.create(
+            name='Netcare Christiaan Barnard Memorial Hospital',
+            country=country
+        )
+        organisation.full_clean()  # force model validation to happen
+        signal_processor.flush_changes()
+
+        # anything logged by earlier tests
+        search_log.flush()
+        SearchQueryLog.objects.all().delete()
+
+    @override_settings(SEARCH_LOG_FLUSH_SIZE=2, SEARCH_FUZZY_MIN_HITS=1)
+    def test_searches_are_logged(self):
+        self.client.get('/api/search/', {'search_term': 'Netcare'})
+        self.assertEqual(0, SearchQueryLog.objects.count())
+
+        self.client.post('/api/multi_search/', {'searches': [
+            {'search_term': 'nothing'}
+        ]}, format='json')
+
+        logged = list(SearchQueryLog.objects.order_by('id'))
+        self.assertEqual(
+            [('search_term=netcare', 'netcare', 1),
+             ('search_term=nothing', 'nothing', 0)],
+            [(log.query, log.search_term, log.hits) for log in logged]
+        )
+        self.assertEqual(['exact', 'fuzzy'], [log.tier for log in logged])
+
+    def test_flush_writes_waiting_searches(self):
+        self.client.get('/api/search/', {'search_term': 'Netcare'})
+        search_log.flush()
+
+        self.assertEqual(1, SearchQueryLog.objects.count())
+
+    def test_flushed_once_due_without_another_search(self):
+        self.client.get('/api/search/', {'search_term': 'Netcare'})
+        search_log.flush_if_due()
+        self.assertEqual(0, SearchQueryLog.objects.count())
+
+        # as the timer would, once the search has waited
+        with override_settings(SEARCH_LOG_FLUSH_SECONDS=0):
+            search_log.flush_if_due()
+        self.assertEqual(1, SearchQueryLog.objects.count())
+
+
+class RollupSearchLogTestCase(TestCase):
+    now = datetime(2026, 10, 18, 12, 30, tzinfo=utc)
+
+    def log(self, query, hits, minutes_ago, latency_ms=10):
+        SearchQueryLog.objects.create(
+            searched_at=self.now - timedelta(minutes=minutes_ago),
+            query='search_term={0}'.format(query),
+            search_term=query,
+            hits=hits,
+            latency_ms=latency_ms,
+            tier='exact'
+        )
+
+    def rollups(self):
+        return [
+            (rollup.hour.hour, rollup.search_term, rollup.searches,
+             rollup.zero_result_searches, rollup.total_latency_ms)
+            for rollup in SearchQueryHourly.objects.order_by(
+                'hour', '-searches', '-search_term'
+            )
+        ]
+
+    @override_settings(SEARCH_ROLLUP_REBUILD_HOURS=1)
+    def test_rollup(self):
+        self.log('heart', 3, minutes_ago=50)
+        self.log('heart', 3, minutes_ago=40, latency_ms=30)
+        self.log('hart', 0, minutes_ago=40)
+        self.log('heart', 3, minutes_ago=100)
+        self.log('heart', 3, minutes_ago=10)  # the current hour
+
+        rolled_up = rollup_search_log(now=self.now)
+        self.assertEqual([(10, 1), (11, 2)], [
+            (hour.hour, rows) for hour, rows in rolled_up
+        ])
+        self.assertEqual([
+            (10, 'heart', 1, 0, 10),
+            (11, 'heart', 2, 0, 40),
+            (11, 'hart', 1, 1, 10),
+        ], self.rollups())
+
+        # written late, after its hour was rolled up: the last hour is
+        # rebuilt
+        self.log('hart', 0, minutes_ago=45)
+        rolled_up = rollup_search_log(now=self.now)
+        self.assertEqual([(11, 2)], [
+            (hour.hour, rows) for hour, rows in rolled_up
+        ])
+        self.assertEqual([
+            (10, 'heart', 1, 0, 10),
+            (11, 'heart', 2, 0, 40),
+            (11, 'hart', 2, 2, 20),
+        ], self.rollups())
+
+        # hours rolled up again are replaced
+        self.log('heart', 3, minutes_ago=80)
+        rollup_search_log(hours=2, now=self.now)
+        self.assertEqual([
+            (10, 'heart', 2, 0, 20),
+            (11, 'heart', 2, 0, 40),
+            (11, 'hart', 2, 2, 20),
+        ], self.rollups())
+
+    @override_settings(SEARCH_LOG_RETENTION_DAYS=1,
+                       SEARCH_ROLLUP_RETENTION_DAYS=2)
+    def test_retention(self):
+        self.log('heart', 3, minutes_ago=60 * 24 * 3)
+        self.log('heart', 3, minutes_ago=60 * 36)
+        self.log('heart', 3, minutes_ago=60)
+        rollup_search_log(now=self.now)
+
+        self.assertEqual((2, 1), apply_retention(now=self.now))
+        self.assertEqual(1, SearchQueryLog.objects.count())
+        self.assertEqual(2, SearchQueryHourly.objects.count())
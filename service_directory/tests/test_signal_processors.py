@@ -0,0 +1,230 @@
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from haystack import signal_processor
+from rest_framework.test import APIClient
+from service_directory.api.models import Country, Category, Keyword, \
+    Organisation, OrganisationCategory, OrganisationKeyword
+from service_directory.tests.query_budgets import record_calls
+from service_directory.tests.test_api import reset_haystack_index
+
+
+class BatchingSignalProcessorTestCase(TestCase):
+    client_class = APIClient
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def setUp(self):
+        reset_haystack_index()
+
+        self.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        self.country.full_clean()  # force model validation to happen
+
+        self.category = Category.objects.create(name='Health')
+        self.category.full_clean()  # force model validation to happen
+
+        self.keyword = Keyword.objects.create(name='heart')
+        self.keyword.full_clean()  # force model validation to happen
+
+        self.org = Organisation.objects.create(
+            name='Netcare Christiaan Barnard Memorial Hospital',
+            country=self.country,
+            location=Point(18.418231, -33.921859, srid=4326)
+        )
+        self.org.full_clean()  # force model validation to happen
+
+        oc = OrganisationCategory.objects.create(
+            organisation=self.org, category=self.category
+        )
+        oc.full_clean()  # force model validation to happen
+
+        ok = OrganisationKeyword.objects.create(
+            organisation=self.org, keyword=self.keyword
+        )
+        ok.full_clean()  # force model validation to happen
+
+        signal_processor.flush_changes()
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params, format='json')
+        return [organisation['id'] for organisation in response.data]
+
+    def test_keyword_rename_reindexes_organisations(self):
+        self.keyword.name = 'cardiac'
+        self.keyword.save()
+        signal_processor.flush_changes()
+
+        self.assertEqual([self.org.pk], self.search(keywords='cardiac'))
+        self.assertEqual([], self.search(keywords='heart'))
+        self.assertEqual([self.org.pk], self.search(search_term='cardiac'))
+
+    def test_category_rename_reindexes_organisations(self):
+        self.category.name = 'Wellbeing'
+        self.category.save()
+        signal_processor.flush_changes()
+
+        self.assertEqual([self.org.pk], self.search(search_term='wellbeing'))
+
+    def test_country_change_reindexes_organisations(self):
+        self.country.iso_code = 'ZW'
+        self.country.save()
+        signal_processor.flush_changes()
+
+        self.assertEqual([self.org.pk], self.search(country='ZW'))
+        self.assertEqual([], self.search(country='ZA'))
+
+    def test_finds_dependents_with_one_query(self):
+        with self.assertNumQueries(1):
+            signal_processor.handle_save(
+                Keyword, self.keyword, created=False, raw=False
+            )
+        signal_processor.flush_changes()
+
+    def test_organisation_indexed_once_with_its_relations(self):
+        keyword = Keyword.objects.create(name='cardiac')
+        keyword.full_clean()  # force model validation to happen
+
+        # as the admin does: the organisation, then each inline
+        self.org.name = 'Groote Schuur Hospital'
+        self.org.save()
+        ok = OrganisationKeyword.objects.create(
+            organisation=self.org, keyword=keyword
+        )
+        ok.full_clean()  # force model validation to happen
+        OrganisationKeyword.objects.get(
+            organisation=self.org, keyword=self.keyword
+        ).delete()
+
+        with record_calls() as calls:
+            signal_processor.flush_changes()
+        self.assertEqual(1, calls.es)
+
+        self.assertEqual([self.org.pk], self.search(keywords='cardiac'))
+        self.assertEqual([], self.search(keywords='heart'))
+        self.assertEqual([self.org.pk], self.search(search_term='groote'))
+
+    def test_deleted_organisation_is_removed(self):
+        self.org.delete()
+        signal_processor.flush_changes()
+
+        self.assertEqual([], self.search())
+
+    def test_pending_changes_are_keys(self):
+        self.org.save()
+
+        self.assertEqual(
+            [((Organisation, self.org.pk), True)],
+            list(signal_processor._pending.changes.items())
+        )
+        signal_processor.flush_changes()
+
+    def test_indexes_and_removes_in_one_request(self):
+        other = Organisation.objects.create(
+            name='Groote Schuur Hospital',
+            country=self.country
+        )
+        other.full_clean()  # force model validation to happen
+        self.org.delete()
+
+        with record_calls() as calls:
+            signal_processor.flush_changes()
+        self.assertEqual(1, calls.es)
+
+        self.assertEqual([other.pk], self.search())
+
+    def test_batch_flushes_at_the_end(self):
+        with signal_processor.batch():
+            with signal_processor.batch():
+                self.org.delete()
+            self.assertTrue(signal_processor._pending.changes)
+
+        self.assertFalse(signal_processor._pending.changes)
+        self.assertEqual([], self.search())
+
+
+class AutoFlushTestCase(TransactionTestCase):
+    client_class = APIClient
+
+    def tearDown(self):
+        signal_processor._pending.changes.clear()
+        signal_processor._pending.in_request = False
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def setUp(self):
+        reset_haystack_index()
+
+        self.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        self.country.full_clean()  # force model validation to happen
+        signal_processor.flush_changes()
+
+    def create_organisation(self, name):
+        organisation = Organisation.objects.create(
+            name=name,
+            country=self.country
+        )
+        organisation.full_clean()  # force model validation to happen
+        return organisation
+
+    def search(self):
+        response = self.client.get('/api/search/', format='json')
+        return [organisation['id'] for organisation in response.data]
+
+    @override_settings(SEARCH_INDEX_AUTOFLUSH_SIZE=2)
+    def test_flushes_once_enough_changes_are_pending(self):
+        netcare = self.create_organisation('Netcare')
+        self.assertEqual(1, len(signal_processor._pending.changes))
+
+        groote_schuur = self.create_organisation('Groote Schuur Hospital')
+        self.assertFalse(signal_processor._pending.changes)
+        self.assertEqual(
+            sorted([netcare.pk, groote_schuur.pk]), sorted(self.search())
+        )
+
+    @override_settings(SEARCH_INDEX_AUTOFLUSH_SECONDS=0)
+    def test_flushes_once_changes_are_old(self):
+        organisation = self.create_organisation('Netcare')
+        self.assertFalse(signal_processor._pending.changes)
+        self.assertEqual([organisation.pk], self.search())
+
+    @override_settings(SEARCH_INDEX_AUTOFLUSH_SECONDS=0)
+    def test_not_within_transactions(self):
+        with transaction.atomic():
+            organisation = self.create_organisation('Netcare')
+            self.assertEqual(1, len(signal_processor._pending.changes))
+
+        # with the next change
+        other = self.create_organisation('Groote Schuur Hospital')
+        self.assertFalse(signal_processor._pending.changes)
+        self.assertEqual(
+            sorted([organisation.pk, other.pk]), sorted(self.search())
+        )
+
+    @override_settings(SEARCH_INDEX_AUTOFLUSH_SECONDS=0)
+    def test_rolled_back_changes_are_not_indexed(self):
+        try:
+            with transaction.atomic():
+                self.create_organisation('Netcare')
+                raise ValueError
+        except ValueError:
+            pass
+
+        signal_processor.flush_changes()
+        self.assertEqual([], self.search())
+
+    @override_settings(SEARCH_INDEX_AUTOFLUSH_SECONDS=0)
+    def test_not_during_requests(self):
+        signal_processor.start_request()
+        organisation = self.create_organisation('Netcare')
+        self.assertEqual(1, len(signal_processor._pending.changes))
+
+        signal_processor.finish_request()
+        self.assertFalse(signal_processor._pending.changes)
+        self.assertEqual([organisation.pk], self.search())
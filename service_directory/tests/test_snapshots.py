@@ -0,0 +1,159 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from StringIO import StringIO
+
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+from service_directory.api.models import Country, Category, Keyword, \
+    Organisation, OrganisationCategory, OrganisationKeyword
+
+
+class DirectorySnapshotTestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(
+            name='South Africa',
+            iso_code='ZA'
+        )
+        cls.country.full_clean()  # force model validation to happen
+
+        cls.other_country = Country.objects.create(
+            name='Kenya',
+            iso_code='KE'
+        )
+        cls.other_country.full_clean()  # force model validation to happen
+
+        cls.category = Category.objects.create(
+            name='Test Category'
+        )
+        cls.category.full_clean()  # force model validation to happen
+
+        cls.keyword = Keyword.objects.create(
+            name='test'
+        )
+        cls.keyword.full_clean()  # force model validation to happen
+
+        cls.org = Organisation.objects.create(
+            name='Test Org',
+            country=cls.country,
+            location=Point(18.505496, -33.891937, srid=4326)
+        )
+        cls.org.full_clean()  # force model validation to happen
+
+        oc = OrganisationCategory.objects.create(
+            organisation=cls.org, category=cls.category
+        )
+        oc.full_clean()  # force model validation to happen
+
+        ok = OrganisationKeyword.objects.create(
+            organisation=cls.org, keyword=cls.keyword
+        )
+        ok.full_clean()  # force model validation to happen
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = self.settings(SNAPSHOT_ROOT=self.root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root)
+
+    def build(self, *args):
+        call_command('build_directory_snapshots', *args, stdout=StringIO())
+        with open(os.path.join(self.root, 'manifest.json')) as fp:
+            return json.load(fp)
+
+    def test_build(self):
+        manifest = self.build()
+
+        self.assertEqual(['KE', 'ZA'], sorted(manifest['countries']))
+        entry = manifest['countries']['ZA']
+        self.assertEqual(1, entry['json']['organisations'])
+        self.assertEqual(1, entry['sqlite']['organisations'])
+
+        snapshot = json.load(
+            gzip.open(os.path.join(self.root, entry['json']['file']))
+        )
+        self.assertEqual('ZA', snapshot['country'])
+        self.assertEqual(entry['sync_token'], snapshot['sync_token'])
+        self.assertEqual(1, len(snapshot['organisations']))
+        self.assertEqual(self.org.name, snapshot['organisations'][0]['name'])
+        self.assertEqual(
+            [self.keyword.name],
+            [keyword['name'] for keyword in
+             snapshot['organisations'][0]['keywords']]
+        )
+
+        connection = sqlite3.connect(
+            os.path.join(self.root, entry['sqlite']['file'])
+        )
+        rows = connection.execute(
+            'SELECT o.name FROM organisations o '
+            'JOIN organisation_locations l ON l.id = o.id '
+            'WHERE l.min_latitude >= -34 AND l.max_latitude <= -33 '
+            'AND l.min_longitude >= 18 AND l.max_longitude <= 19'
+        ).fetchall()
+        self.assertEqual([(self.org.name,)], rows)
+        connection.close()
+
+        self.assertEqual(
+            0, manifest['countries']['KE']['json']['organisations']
+        )
+
+    def test_rebuild(self):
+        first = self.build()
+        first_file = first['countries']['ZA']['json']['file']
+
+        # unchanged content is published under the same name
+        self.assertEqual(
+            first_file, self.build()['countries']['ZA']['json']['file']
+        )
+
+        self.org.name = 'Renamed Org'
+        self.org.save()
+
+        second_file = self.build('--country', 'ZA')['countries']['ZA'][
+            'json']['file']
+        self.assertNotEqual(first_file, second_file)
+        # the previous files are kept for clients that are part way through
+        # downloading them
+        self.assertTrue(os.path.exists(os.path.join(self.root, first_file)))
+
+        self.org.name = 'Renamed Again'
+        self.org.save()
+
+        self.build('--country', 'ZA')
+        self.assertFalse(os.path.exists(os.path.join(self.root, first_file)))
+
+    def test_manifest(self):
+        response = self.client.get('/api/snapshots/', format='json')
+        self.assertEqual(404, response.status_code)
+
+        manifest = self.build()
+
+        response = self.client.get('/api/snapshots/', format='json')
+        self.assertEqual(200, response.status_code)
+        entry = response.data['countries']['ZA']
+        self.assertEqual(
+            manifest['countries']['ZA']['json']['sha256'],
+            entry['json']['sha256']
+        )
+        self.assertEqual(
+            'http://testserver/snapshots/' + entry['json']['file'],
+            entry['json']['url']
+        )
+
+        response = self.client.get(
+            '/api/snapshots/', format='json',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(304, response.status_code)
@@ -0,0 +1,89 @@
+import json
+import tempfile
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from haystack import signal_processor
+from service_directory.api.models import Country, Organisation, \
+    SearchQueryHourly
+from service_directory.api.warmup import fixture_searches, \
+    popular_searches, warm_searches, warm_up
+from service_directory.tests.test_api import reset_haystack_index
+
+
+class WarmUpTestCase(TestCase):
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def setUp(self):
+        reset_haystack_index()
+
+        country = Country.objects.create(name='South Africa', iso_code='ZA')
+        country.full_clean()  # force model validation to happen
+
+        organisation = Organisation.objects.create(
+            name='Netcare Christiaan Barnard Memorial Hospital',
+            country=country
+        )
+        organisation.full_clean()  # force model validation to happen
+        signal_processor.flush_changes()
+
+    def rollup(self, query, searches, hours_ago):
+        SearchQueryHourly.objects.create(
+            hour=timezone.now() - timedelta(hours=hours_ago),
+            query=query,
+            search_term='',
+            searches=searches,
+            zero_result_searches=0,
+            total_latency_ms=0
+        )
+
+    def test_popular_searches(self):
+        self.rollup('search_term=clinic', 5, hours_ago=1)
+        self.rollup('search_term=clinic', 3, hours_ago=2)
+        self.rollup('search_term=heart&keywords=a&keywords=b', 6, hours_ago=1)
+        self.rollup('search_term=old', 100, hours_ago=24 * 30)
+
+        searches = popular_searches(10, days=7)
+        self.assertEqual(
+            [['clinic'], ['heart']],
+            [params.getlist('search_term') for params in searches]
+        )
+        self.assertEqual(['a', 'b'], searches[1].getlist('keywords'))
+
+        self.assertEqual(1, len(popular_searches(1, days=7)))
+
+    def test_warm_searches(self):
+        self.assertEqual(2, warm_searches([
+            {'search_term': 'netcare'},
+            {'radius': -1},  # invalid, skipped
+            {'location': '-33.921387,18.424101', 'facets': 'country'},
+        ]))
+
+    def test_warm_up(self):
+        self.rollup('search_term=netcare', 5, hours_ago=1)
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            json.dump([{'search_term': 'hospital'}], f)
+            f.flush()
+            self.assertEqual(
+                [{'search_term': 'hospital'}], fixture_searches(f.name)
+            )
+
+            timings = warm_up(searches=10, fixtures=f.name, days=7)
+
+        self.assertEqual(
+            ['connections', 'reference_data', 'home_page', 'searches'],
+            list(timings)
+        )
+
+
+class WarmUpConnectionsTestCase(TransactionTestCase):
+    def test_closes_database_connections(self):
+        # request threads would never use this thread's connections
+        timings = warm_up(searches=0, fixtures='', days=7)
+
+        self.assertIn('connections', timings)
+        self.assertIsNone(connection.connection)